@@ -5,153 +5,192 @@ Enhanced CBR extraction with multiple fallback methods and fixed Vision API comp
 """
 
 import os
+import re
 import sys
-import zipfile
-import tempfile
-import shutil
+import io
 import base64
+import contextlib
 import json
 import time
-import subprocess
-from typing import List, Dict, Any
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from openai import OpenAI
+from comic_archive import ComicArchive
+from disk_cache import DiskCache
+from llm_client import LLMClient, RateLimiter
+from page_selection import (COVERAGE_MODES, DEFAULT_MAX_VISION_PAGES, PAGE_SELECTION_MODES,
+                            available as page_scoring_available, page_features, select_pages)
+from prompt_budget import PromptSection, count_tokens
+from script_sections import JsonFieldParser
+from structured_output import render_markdown, strict_object
+from tracing import span, in_current_context
+
+# Bump when the per-page Vision prompt changes so cached analyses are not reused
+PAGE_ANALYSIS_PROMPT_VERSION = "page-v1"
+BRIEF_PAGE_ANALYSIS_PROMPT_VERSION = "page-brief-v1"
+
+# Full coverage (see COVERAGE_MODES) sends every page through a cheaper, briefer pass
+PAGE_ANALYSIS_FOCUS = "Describe the characters, dialogue, action, and story elements visible."
+BRIEF_PAGE_ANALYSIS_FOCUS = "Briefly note the characters, key dialogue and action visible, in at most 100 words."
+FULL_COVERAGE_VISION_MODEL = "gpt-4.1-mini"
+
+# Batched Vision reply: one analysis per image, in the order the images were sent
+def page_batch_schema(pages: int) -> Dict[str, Any]:
+    return strict_object({
+        "pages": {"type": "array", "minItems": pages, "maxItems": pages, "items": strict_object({
+            "analysis": {"type": "string", "description": "Characters, dialogue, action and story elements visible on this page"}
+        })}
+    })
+
+# Script generation reply; the script comes first so dependent work can start while the rest streams in
+SCRIPT_OUTPUT_SCHEMA = strict_object({
+    "script": {"type": "string", "description": "Complete narration: a factual, third-person narrative summary of the comic plot"},
+    "hook_analysis": {"type": "string", "description": "Why the opening is effective according to the ComicShortsNarrativeProfile"},
+    "title_suggestions": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 3,
+                          "description": "Factual titles reflecting the content, suitable for a short summary format"}
+})
+
+# The gold-standard scripts shown to the script writer; the prompt budget falls back to their openings
+REFERENCE_SCRIPT_EXAMPLES = """Example 1 - "How Did Dr Doom Take Over The World?":
+"After sorcerer Supreme Dr. Doom took over the world, he put an end to all senseless wars and promised every citizen free universal healthcare, leaving the Avengers with no other choice but to stop him. After gathering every useful hero available and Squirrel Girl, the Avengers arrive at Laaria to end Doom's reign, only to be completely humiliated in front of the whole world. As time went on and people's lives began to change for the better, Doom's followers started to grow in number. While the Avengers are desperately trying to come up with a plan to stop him, believing that Doom has every world leader under some form of mind control, Carol comes up with a plan to free them from Doom's influence. And while she believes that the Avengers are more than powerful enough to beat Victor, she's called in a few villains to help them. With the help of their new allies, Captain Marvel plans to distract Doom while Scarlet Witch frees every world leader from his mind control. And with everyone on board, they arrive at the Lavarian border once again. Having anticipated their arrival, Doom welcomes the Avengers with his dinosaur variant. And while he's surprised that Earth's mightiest heroes were desperate enough to team up with a group of villains, he reassures them that they stand no chance of winning. While the Avengers are keeping Doom distracted, Scarlet Witch enters the mind of every politician under Doom's influence. But after spending hours trying to break their mind control, she's shocked to learn the truth. Despite what they thought, Doom didn't use his powers to control the politicians. He simply offered to give them whatever they needed to gain their support, money, power, or drugs."
+
+Example 2 - "How Spider-Man Almost Ended Peter Parker?":
+"How did Spider-Man almost get Peter Parker killed? While Peter is out on a date with MJ, they are interrupted by a giant tric sentinel destroying Manhattan. MJ asks if he needs to get out of here, but Peter doesn't think he'll have to because Spider-Man is already there to deal with it. A few days ago, Peter went to visit Dr. Connors at the university to discuss the isotope genome accelerator, the device that gave him his powers all those years ago. Connors explains that with the accelerator's help, he plans to separate his human side from the lizard, but their talk is cut short by Taskmaster and Black Ant, who came to steal the device. Taskmaster throws Peter out of the way, only for him to accidentally turn on the accelerator, separating Spider-Man and Peter Parker from each other. Once Spider-Man has dealt with the villains, he and Peter swing away to talk about what just happened. But after realizing that they can finally live separate lives, Spidey goes to do some superhero stuff, leaving Peter alone on the rooftop. Without his powers, Peter can finally live a normal life. He can go back to school and settle down with the woman he loves. All while Spider-Man is having the time of his life, going on talk shows, and making millions of dollars with various sponsorships. But when he starts to swing people around the city for money, Peter decides it's time to have a talk. Realizing that the experiment left Spider-Man with no sense of responsibility or intellect, Peter tries to remind him of why they decided to become heroes in the first place, only for Spidey to web him to a wall and swing away. Knowing that he needs to get his powers back or somebody will get hurt, Peter steals the accelerator from Dr. Connors lab, but when he tries to turn everything back to normal, they are attacked by an army of Tsentinels. As they try to run away, a sentinel behind them is about to blow both of them up, only for Peter to save Spider-Man's life by pushing him away. Lying half dead on the ground, Peter hopes that Spider-Man has finally learned to be more responsible. But since it didn't really work, he activates the accelerator with his web shooter, merging their bodies back"
+
+Example 3 - "Deadpool Takes Spider-Man To Hell":
+"While Spider-Man is fighting with Hydroman, Deadpool interrupts them, telling Spidey that his villains are very boring. And after giving him a hug, Wade teleports both of them to hell, where they're captured by Dormamu. As Deadpool continues to annoy Spider-Man with his jokes, Peter asks Dormamu if he can torture them separately, buying Wade just enough time to dislocate his hip and cut themselves loose. When Dormamu's mindless ones attack them, Wade is confused why Spidey is angry with him, saying he only wanted to give him a battle worthy of an Avenger. But when even Dormamu questions why Spider-Man would team up with an idiot like Deadpool, Wade ends the battle by giving the mindless ones brains, causing them to turn against their master. Thinking that this must be a bad dream, Spider-Man tells Deadpool to immediately take them home. But by the time they arrive, Hydroman has absorbed all the water from the sewers, demanding $100 million or he'll drown the city in its own filth. After getting blasted with sewer water, Deadpool blames Spider-Man for unleashing a walking toilet on the city. But when Peter asks if he has any grenades on him, he throws Wade into Hydroman, causing both of them to explode. While Deadpool's legs are starting to grow back, Spider-Man cleans his suit on a rooftop. But as he gets ready to leave, Wade asks to hear him out for a second. Deadpool explains that he's been trying to change and thought that if he spent more time with Spider-Man, he could start to earn his respect. But knowing that it probably won't happen, Wade jumps off the roof while Peter swings away, saying that he needs a lot of therapy.\""""
+
+def condense_examples(examples: str, sentences: int = 3) -> str:
+    """Each example cut to its title and opening sentences, which show the profile's setup and voice."""
+    condensed = []
+    for block in examples.split("\n\n"):
+        title, _, body = block.partition("\n")
+        opening = re.split(r"(?<=[.!?])\s+", body.strip())
+        condensed.append(f'{title}\n{" ".join(opening[:sentences])} ..."' if len(opening) > sentences else block)
+    return "\n\n".join(condensed)
+
+IMAGE_MIME_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+]
+
+def sniff_image_mime(image_bytes: bytes) -> str:
+    """Return the MIME type implied by an image's magic bytes (JPEG if unknown)."""
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in IMAGE_MIME_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return mime_type
+    return 'image/jpeg'
 
 class ComicProcessorFixed:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-        self.temp_dir = None
+    def __init__(self, api_key: str, max_workers: int = 4, requests_per_minute: int = 60,
+                 image_max_edge: int = 1024, image_format: str = "JPEG", image_quality: int = 85,
+                 cache_dir: Optional[str] = os.path.join(".cache", "page_analyses"),
+                 cache_max_bytes: int = 50 * 1024 * 1024, client: Optional[OpenAI] = None,
+                 llm: Optional[LLMClient] = None, extraction_slots: Optional[threading.Semaphore] = None,
+                 page_selection: str = "smart", max_vision_pages: int = DEFAULT_MAX_VISION_PAGES,
+                 pages_per_request: int = 1, coverage: str = "sampled", coverage_workers: int = 16,
+                 scene_size: int = 6, summary_fan_in: int = 4):
+        if page_selection not in PAGE_SELECTION_MODES:
+            raise ValueError(f"Unknown page selection '{page_selection}'. Expected one of: {', '.join(PAGE_SELECTION_MODES)}")
+        if coverage not in COVERAGE_MODES:
+            raise ValueError(f"Unknown coverage '{coverage}'. Expected one of: {', '.join(COVERAGE_MODES)}")
+        self.client = client or OpenAI(api_key=api_key)
+        # Pipelines share one rate-limited LLM client across agents; batches also cap how many comics decode archives at once
+        self.llm = llm or LLMClient(self.client, RateLimiter(requests_per_minute))
+        self.extraction_slots = extraction_slots or contextlib.nullcontext()
+        self.vision_model = "gpt-4.1" # Using a model known for vision
+        self.page_cache = DiskCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.image_max_edge = image_max_edge
+        self.image_format = image_format.upper()
+        self.image_quality = image_quality
+        self.archive = None
+        self.max_workers = max(1, max_workers)
+        # Vision calls per comic, spent on the pages the local scorer ranks highest (or on fixed positions)
+        self.page_selection = page_selection
+        self.max_vision_pages = max(1, max_vision_pages)
+        # Pages packed into one Vision request; more per request means fewer requests under a per-minute cap
+        self.pages_per_request = max(1, pages_per_request)
+        self.coverage = coverage
+        self.scene_size = max(2, scene_size)
+        self.summary_fan_in = max(2, summary_fan_in)
+        if coverage == "full":
+            # Every page is analyzed, so each gets a cheaper model, a brief answer and wider concurrency
+            self.vision_model = FULL_COVERAGE_VISION_MODEL
+            self.page_analysis_focus = BRIEF_PAGE_ANALYSIS_FOCUS
+            self.page_max_tokens = 300
+            self.page_prompt_version = BRIEF_PAGE_ANALYSIS_PROMPT_VERSION
+            self.max_workers = max(self.max_workers, coverage_workers)
+        else:
+            self.page_analysis_focus = PAGE_ANALYSIS_FOCUS
+            self.page_max_tokens = 800
+            self.page_prompt_version = PAGE_ANALYSIS_PROMPT_VERSION
         
     def extract_cbr_images_robust(self, cbr_path: str) -> List[str]:
-        """Extract images using multiple fallback methods."""
-        if not os.path.exists(cbr_path):
-            raise FileNotFoundError(f"CBR file not found: {cbr_path}")
-            
-        self.temp_dir = tempfile.mkdtemp()
-        image_paths = []
+        """List image pages in the archive (natural order) without extracting them to disk."""
+        self.cleanup()
+        self.archive = ComicArchive(cbr_path)
         
-        print(f"Attempting to extract: {cbr_path}")
-        
-        # Method 1: Try as ZIP/CBZ
-        try:
-            print("Method 1: Trying ZIP extraction...")
-            with zipfile.ZipFile(cbr_path, 'r') as archive:
-                for file_info in archive.infolist():
-                    if file_info.filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                        archive.extract(file_info, self.temp_dir)
-                        image_paths.append(os.path.join(self.temp_dir, file_info.filename))
-                        
-            if image_paths:
-                print(f"✅ ZIP extraction successful: {len(image_paths)} images")
-                image_paths.sort()
-                return image_paths
-                
-        except zipfile.BadZipFile:
-            print("❌ Not a valid ZIP file")
-        except Exception as e:
-            print(f"❌ ZIP extraction failed: {e}")
-        
-        # Method 2: Try system unar command
-        try:
-            print("Method 2: Trying system unar command...")
-            result = subprocess.run(['unar', '-o', self.temp_dir, cbr_path], 
-                                  capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                # Find extracted images
-                for root, dirs, files in os.walk(self.temp_dir):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                            image_paths.append(os.path.join(root, file))
-                            
-                if image_paths:
-                    print(f"✅ Unar extraction successful: {len(image_paths)} images")
-                    image_paths.sort()
-                    return image_paths
-            else:
-                print(f"❌ Unar failed: {result.stderr}")
-                
-        except subprocess.TimeoutExpired:
-            print("❌ Unar extraction timed out")
-        except FileNotFoundError:
-            print("❌ Unar command not found")
-        except Exception as e:
-            print(f"❌ Unar extraction failed: {e}")
+        print(f"Attempting to open: {cbr_path}")
+        with self.extraction_slots:
+            return self.archive.open()
+    
+    def prepare_image_for_vision(self, image_bytes: bytes) -> Dict[str, Any]:
+        """Downscale a page to the configured longest edge and re-encode it for upload.
         
-        # Method 3: Try rarfile library with better configuration
+        Falls back to the original bytes (with a sniffed MIME type) when Pillow is not
+        installed, the image cannot be decoded, or re-encoding would not make it smaller.
+        """
+        prepared = {
+            "data": image_bytes,
+            "mime_type": sniff_image_mime(image_bytes),
+            "original_bytes": len(image_bytes),
+            "uploaded_bytes": len(image_bytes)
+        }
+        with span("image_prepare", "image", original_bytes=len(image_bytes)) as prepare:
+            self._downscale_for_vision(prepared)
+            prepare["uploaded_bytes"] = prepared["uploaded_bytes"]
+        return prepared
+    
+    def _downscale_for_vision(self, prepared: Dict[str, Any]):
+        image_bytes = prepared["data"]
         try:
-            print("Method 3: Trying rarfile library...")
-            import rarfile
-            
-            # Configure rarfile to use system unar
-            rarfile.UNRAR_TOOL = "unar" 
-            
-            with rarfile.RarFile(cbr_path, 'r') as archive:
-                file_list = archive.namelist()
-                print(f"Found {len(file_list)} files in RAR")
-                
-                for file_info in archive.infolist():
-                    if file_info.filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                        try:
-                            archive.extract(file_info, self.temp_dir)
-                            extracted_path = os.path.join(self.temp_dir, file_info.filename)
-                            if os.path.exists(extracted_path):
-                                image_paths.append(extracted_path)
-                        except Exception as e:
-                            print(f"⚠️ Failed to extract {file_info.filename}: {e}")
-                            
-                if image_paths:
-                    print(f"✅ Rarfile extraction successful: {len(image_paths)} images")
-                    image_paths.sort()
-                    return image_paths
-                    
+            from PIL import Image
         except ImportError:
-            print("❌ Rarfile library not available")
-        except Exception as e:
-            print(f"❌ Rarfile extraction failed: {e}")
-            
-        # Method 4: Try py7zr (for 7zip format CBR files)
+            return
+        
         try:
-            print("Method 4: Trying py7zr extraction...")
-            import py7zr
-            
-            with py7zr.SevenZipFile(cbr_path, mode='r') as archive:
-                file_list = archive.getnames()
-                print(f"Found {len(file_list)} files in 7zip archive")
-                
-                # Extract to temp directory
-                archive.extractall(path=self.temp_dir)
-                
-                # Find image files
-                for root, dirs, files in os.walk(self.temp_dir):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                            image_paths.append(os.path.join(root, file))
-                            
-                if image_paths:
-                    print(f"✅ Py7zr extraction successful: {len(image_paths)} images")
-                    image_paths.sort()
-                    return image_paths
-                    
-        except ImportError:
-            print("❌ Py7zr library not yes available")
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                # Let the JPEG decoder downscale while decoding when it can
+                image.draft('RGB', (self.image_max_edge, self.image_max_edge))
+                image = image.convert('RGB')
+                image.thumbnail((self.image_max_edge, self.image_max_edge), Image.LANCZOS)
+                output = io.BytesIO()
+                image.save(output, format=self.image_format, quality=self.image_quality)
         except Exception as e:
-            print(f"❌ Py7zr extraction failed: {e}")
+            print(f"⚠️ Could not preprocess image, uploading original: {e}")
+            return
         
-        print("❌ All extraction methods failed")
-        return []
+        encoded = output.getvalue()
+        if len(encoded) < len(image_bytes):
+            prepared.update({
+                "data": encoded,
+                "mime_type": f"image/{self.image_format.lower()}",
+                "uploaded_bytes": len(encoded)
+            })
     
     def encode_image_to_base64(self, image_path: str) -> str:
-        """Convert image to base64 for API transmission."""
+        """Convert image to base64 for API transmission, downscaling it first."""
         with open(image_path, 'rb') as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            prepared = self.prepare_image_for_vision(image_file.read())
+        return base64.b64encode(prepared["data"]).decode('utf-8')
     
-    def analyze_comic_pages_fixed(self, image_paths: List[str]) -> Dict[str, Any]:
-        """Analyze comic pages using compatible Vision API calls."""
-        if not image_paths:
-            return {"error": "No images found in comic"}
-            
-        # Sample key pages for analysis
-        total_pages = len(image_paths)
+    def _select_sample_indices(self, total_pages: int) -> List[int]:
+        """Pick the page indices worth sending to Vision."""
         if total_pages <= 6:
             sample_indices = list(range(total_pages))
         else:
@@ -163,111 +202,422 @@ class ComicProcessorFixed:
                 3 * total_pages // 4,  # Third quarter
                 total_pages - 2, total_pages - 1  # Ending
             ]
+        # Short comics map several strategic positions onto the same page (e.g. 7 pages: 7 // 4 == 1)
+        return list(dict.fromkeys(i for i in sample_indices if 0 <= i < total_pages))
+    
+    def _select_pages(self, image_paths: List[str]) -> Dict[str, Any]:
+        """Pick the pages to send to Vision and read them.
         
-        sample_paths = [image_paths[i] for i in sample_indices if 0 <= i < total_pages]
-        
-        # Process images - try different vision approaches
-        extracted_text = []
+        Smart selection scores every page locally, reading a few pages at a time, then keeps the
+        most informative story pages within max_vision_pages and reads only those again; it falls
+        back to the fixed strategic positions when Pillow is missing or no page qualifies. Returns
+        the pages in order, their bytes and a summary of the selection. Full coverage takes every page.
+        """
+        if self.coverage == "full":
+            with self.extraction_slots:
+                page_bytes = self._read_page_bytes(image_paths)
+            return {
+                "pages": list(image_paths),
+                "page_bytes": page_bytes,
+                "mode": "full",
+                "selected_pages": list(range(1, len(image_paths) + 1))
+            }
+        budget = self.max_vision_pages
+        if self.page_selection == "smart" and page_scoring_available():
+            start = time.time()
+            features = []
+            with self.extraction_slots:
+                with span("page_selection", "image", pages=len(image_paths), budget=budget) as selecting, \
+                        ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    score = in_current_context(lambda page: page_features(*page))
+                    # Pages are read and scored a chunk at a time, so a comic never holds more than one chunk's bytes
+                    chunk_size = 2 * self.max_workers
+                    for offset in range(0, len(image_paths), chunk_size):
+                        chunk = image_paths[offset:offset + chunk_size]
+                        chunk_bytes = self._read_page_bytes(chunk)
+                        features += executor.map(score, [(offset + i, chunk_bytes[path]) for i, path in enumerate(chunk)])
+                        del chunk_bytes
+                    selection = select_pages(features, budget)
+                    selecting["selected"] = len(selection["indices"])
+                pages = [image_paths[i] for i in selection["indices"]]
+                # Only the selected pages are read again and kept for Vision
+                page_bytes = self._read_page_bytes(pages) if pages else {}
+            if pages:
+                print(f"🔎 Selected pages {', '.join(str(i + 1) for i in selection['indices'])} of {len(image_paths)} for Vision"
+                      + "".join(f"; skipped {len(numbers)} {reason.replace('_', ' ')}" for reason, numbers in selection["skipped"].items()))
+                return {
+                    "pages": pages,
+                    "page_bytes": page_bytes,
+                    "mode": "smart",
+                    "budget": budget,
+                    "selected_pages": [i + 1 for i in selection["indices"]],
+                    "page_classes": {i + 1: selection["classes"][i] for i in selection["indices"]},
+                    "skipped_pages": selection["skipped"],
+                    "near_duplicates": {i + 1: original + 1 for i, original in selection["duplicates"].items()},
+                    "duration": time.time() - start
+                }
+            print("⚠️ No page qualified for smart selection, using strategic sampling")
         
-        for i, path in enumerate(sample_paths[:4]):  # Limit to 4 images for cost control
-            try:
-                print(f"Analyzing page {i+1}/{len(sample_paths)}: {os.path.basename(path)}")
-                
+        indices = self._select_sample_indices(len(image_paths))[:budget]
+        pages = [image_paths[i] for i in indices]
+        # Strategic sampling reads only the sampled pages from the archive
+        with self.extraction_slots:
+            page_bytes = self._read_page_bytes(pages)
+        return {
+            "pages": pages,
+            "page_bytes": page_bytes,
+            "mode": "strategic",
+            "budget": budget,
+            "selected_pages": [i + 1 for i in indices]
+        }
+    
+    def _read_page_bytes(self, pages: List[str]) -> Dict[str, bytes]:
+        """Read page images from the open archive, or from disk for plain file paths."""
+        if self.archive and self.archive.backend:
+            return self.archive.read_pages(pages)
+        page_bytes = {}
+        with span("page_files_read", "io", pages=len(pages)) as read:
+            for path in pages:
                 with open(path, 'rb') as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-                try:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4.1", # Using a model known for vision
-                        messages=[
-                            {
-                                "role": "user", 
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": f"Analyze this comic book page {i+1}. Describe the characters, dialogue, action, and story elements visible."
-                                    },
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{base64_image}",
-                                            "detail": "low" # Added detail parameter
-                                        }
-                                    }
-                                ]
-                            }
-                        ],
-                        max_tokens=800
-                    )
-                    
-                    page_analysis = response.choices[0].message.content
-                    
-                except Exception as vision_error:
-                    print(f"Vision API failed: {vision_error}")
-                    response = self.client.chat.completions.create(
-                        model="gpt-4.1", 
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": f"I have a comic book page (page {i+1} of {len(sample_paths)}) but cannot process the image directly. Please provide a template analysis for what should be extracted from a comic book page, including: dialogue, character actions, visual elements, and story progression. Make this realistic for a superhero comic."
-                            }
-                        ],
-                        max_tokens=600
-                    )
-                    
-                    page_analysis = f"[MOCK ANALYSIS - Image processing unavailable]\n{response.choices[0].message.content}"
-                
-                extracted_text.append({
-                    "page": i + 1,
-                    "analysis": page_analysis,
-                    "source_file": os.path.basename(path)
-                })
-                
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error analyzing page {path}: {e}")
+                    page_bytes[path] = image_file.read()
+            read["bytes"] = sum(len(data) for data in page_bytes.values())
+        return page_bytes
+    
+    def prepare_page_sample(self, image_paths: List[str]) -> Dict[str, Any]:
+        """Local half of page analysis: pick the sampled pages, serve cache hits and downscale the rest for Vision."""
+        if not image_paths:
+            return {"error": "No images found in comic"}
+            
+        total_pages = len(image_paths)
+        try:
+            selection = self._select_pages(image_paths)
+        except Exception as e:
+            return {"error": f"Could not read sampled pages: {e}"}
+        pages_to_analyze = selection.pop("pages")
+        page_bytes = selection.pop("page_bytes")
+        
+        # Serve already-analyzed pages from the cache; only misses go to Vision
+        cache_keys = {path: self._page_cache_key(page_bytes[path]) for path in pages_to_analyze}
+        cached_analyses = {}
+        if self.page_cache:
+            with span("page_cache_lookup", "cache", pages=len(pages_to_analyze)) as lookup:
+                for path in pages_to_analyze:
+                    cached = self.page_cache.get(cache_keys[path])
+                    if cached:
+                        cached_analyses[path] = cached["analysis"]
+                        page_bytes.pop(path)
+                lookup["hits"] = len(cached_analyses)
+        pages_to_fetch = [path for path in pages_to_analyze if path not in cached_analyses]
+        
+        prepared_images = {}
+        if pages_to_fetch:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pages_to_fetch))) as executor:
+                with self.extraction_slots:
+                    prepared_images = dict(zip(pages_to_fetch, executor.map(
+                        in_current_context(lambda path: self.prepare_image_for_vision(page_bytes.pop(path))),
+                        pages_to_fetch
+                    )))
+        
+        return {
+            "total_pages": total_pages,
+            "pages_to_analyze": pages_to_analyze,
+            "pages_to_fetch": pages_to_fetch,
+            "page_numbers": {path: i + 1 for i, path in enumerate(pages_to_analyze)},
+            "cache_keys": cache_keys,
+            "cached_analyses": cached_analyses,
+            "prepared_images": prepared_images,
+            "page_selection": selection
+        }
+    
+    def page_groups(self, page_sample: Dict[str, Any]) -> List[List[str]]:
+        """The pages to fetch, split into one group per Vision request."""
+        pages = page_sample["pages_to_fetch"]
+        return [pages[i:i + self.pages_per_request] for i in range(0, len(pages), self.pages_per_request)]
+    
+    def analyze_sampled_page(self, page_sample: Dict[str, Any], path: str) -> Dict[str, Any]:
+        """Send one prepared page from prepare_page_sample to Vision."""
+        return self._analyze_page(
+            page_sample["page_numbers"][path], path, page_sample["prepared_images"][path],
+            len(page_sample["pages_to_analyze"]), page_sample["cache_keys"][path]
+        )
+    
+    def analyze_sampled_pages(self, page_sample: Dict[str, Any], paths: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Send a group of prepared pages from prepare_page_sample to Vision in one request. Returns analyses by path."""
+        if len(paths) == 1:
+            return {paths[0]: self.analyze_sampled_page(page_sample, paths[0])}
+        page_numbers = [page_sample["page_numbers"][path] for path in paths]
+        print(f"Analyzing pages {', '.join(map(str, page_numbers))}/{len(page_sample['pages_to_analyze'])} in one request")
+        
+        content = [{
+            "type": "text",
+            "text": f"Analyze these {len(paths)} comic book pages. For each page: {self.page_analysis_focus} "
+                    "Reply with one analysis per image, in the order the images are given."
+        }]
+        for number, path in zip(page_numbers, paths):
+            prepared_image = page_sample["prepared_images"][path]
+            content.append({"type": "text", "text": f"Page {number}:"})
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{prepared_image['mime_type']};base64,{base64.b64encode(prepared_image['data']).decode('utf-8')}",
+                    "detail": "low"
+                }
+            })
+        try:
+            reply = self.llm.create_json(
+                "page_analysis_batch",
+                "comic_page_analyses",
+                page_batch_schema(len(paths)),
+                model=self.vision_model,
+                messages=[{"role": "user", "content": content}],
+                max_tokens=self.page_max_tokens * len(paths)
+            )
+        except Exception as e:
+            print(f"Batched Vision request failed ({e}), analyzing its {len(paths)} pages one at a time")
+            return {path: self.analyze_sampled_page(page_sample, path) for path in paths}
+        
+        analyzed = {}
+        for number, path, page in zip(page_numbers, paths, reply["pages"]):
+            # Cached like single-page analyses: both answer the same question about the same page
+            if self.page_cache:
+                self.page_cache.set(page_sample["cache_keys"][path], {"analysis": page["analysis"], "model": self.vision_model})
+            analyzed[path] = {
+                "page": number,
+                "analysis": page["analysis"],
+                "source_file": os.path.basename(path)
+            }
+        return analyzed
+    
+    def build_story_analysis(self, page_sample: Dict[str, Any], analyzed: Dict[str, Dict[str, Any]],
+                             workers: int = 0, page_analysis_duration: float = 0.0) -> Dict[str, Any]:
+        """Combine cached and freshly analyzed pages in page order and summarize the story."""
+        cached_analyses = page_sample["cached_analyses"]
+        extracted_text = []
+        for i, path in enumerate(page_sample["pages_to_analyze"]):
+            if path in cached_analyses:
                 extracted_text.append({
                     "page": i + 1,
-                    "analysis": f"[ERROR] Could not analyze page {i+1}: {e}. This would contain dialogue, character interactions, and visual storytelling elements typical of a comic book page.",
+                    "analysis": cached_analyses[path],
                     "source_file": os.path.basename(path)
                 })
-                continue
+            else:
+                extracted_text.append(analyzed[path])
         
         if not extracted_text:
             return {"error": "Failed to analyze any pages"}
         
+        total_pages = page_sample["total_pages"]
         try:
-            story_summary = self._generate_story_summary_fixed(extracted_text, total_pages)
+            scene_summaries = None
+            if self.coverage == "full":
+                scene_summaries, summary_levels = self._summarize_scenes(extracted_text)
+            story_summary = self._generate_story_summary_fixed(extracted_text, total_pages, scene_summaries)
+            if scene_summaries:
+                story_summary["scene_summaries"] = scene_summaries
+                story_summary["summary_levels"] = summary_levels
             return {
                 "page_analyses": extracted_text,
                 "story_summary": story_summary,
                 "total_pages": total_pages,
                 "analyzed_pages": len(extracted_text),
-                "extraction_method": "multi-method CBR extraction"
+                "extraction_method": self.archive.method if self.archive and self.archive.method else "file paths",
+                "extraction_stats": self.archive.stats() if self.archive else {},
+                "image_preprocessing": self._summarize_image_preprocessing(list(page_sample["prepared_images"].values())),
+                "page_cache": {
+                    "hits": len(cached_analyses),
+                    "misses": len(page_sample["pages_to_fetch"]),
+                    "enabled": self.page_cache is not None
+                },
+                "page_selection": page_sample["page_selection"],
+                "coverage": self.coverage,
+                "pages_per_request": self.pages_per_request,
+                "vision_requests": len(self.page_groups(page_sample)),
+                "page_analysis_workers": workers,
+                "page_analysis_duration": page_analysis_duration
             }
         except Exception as e:
             return {"error": f"Story analysis failed: {e}"}
     
-    def _generate_story_summary_fixed(self, page_analyses: List[Dict], total_pages: int) -> Dict[str, Any]:
-        """Generate story summary with error handling."""
-        combined_analysis = "\n\n".join([
-            f"Page {p['page']}: {p['analysis']}" for p in page_analyses
-        ])
+    def analyze_comic_pages_fixed(self, image_paths: List[str]) -> Dict[str, Any]:
+        """Analyze comic pages using compatible Vision API calls."""
+        page_sample = self.prepare_page_sample(image_paths)
+        if "error" in page_sample:
+            return page_sample
+        
+        pages_to_fetch = page_sample["pages_to_fetch"]
+        analyzed = {}
+        workers = 0
+        analysis_start = time.time()
+        if pages_to_fetch:
+            # Analyze groups of pages concurrently; the analyses are put back in page order when combined
+            groups = self.page_groups(page_sample)
+            workers = min(self.max_workers, len(groups))
+            print(f"Analyzing {len(pages_to_fetch)} pages in {len(groups)} request(s) with {workers} worker(s) ({len(page_sample['cached_analyses'])} cached)...")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for group_analyses in executor.map(in_current_context(lambda paths: self.analyze_sampled_pages(page_sample, paths)), groups):
+                    analyzed.update(group_analyses)
+        else:
+            print(f"All {len(page_sample['pages_to_analyze'])} sampled pages served from cache, skipping Vision calls")
+        page_analysis_duration = time.time() - analysis_start
+        print(f"✅ Page analysis finished in {page_analysis_duration:.2f}s")
         
+        return self.build_story_analysis(page_sample, analyzed, workers, page_analysis_duration)
+    
+    def _summarize_image_preprocessing(self, prepared_images: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Total upload sizes before and after downscaling."""
+        original_bytes = sum(p["original_bytes"] for p in prepared_images)
+        uploaded_bytes = sum(p["uploaded_bytes"] for p in prepared_images)
+        return {
+            "max_edge": self.image_max_edge,
+            "format": self.image_format,
+            "quality": self.image_quality,
+            "original_bytes": original_bytes,
+            "uploaded_bytes": uploaded_bytes,
+            "bytes_saved": original_bytes - uploaded_bytes
+        }
+    
+    def _page_cache_key(self, image_bytes: bytes) -> str:
+        """Cache key from the page content, the Vision model and the prompt version."""
+        page_hash = hashlib.sha256(image_bytes).hexdigest()
+        return DiskCache.make_key(page_hash, self.vision_model, self.page_prompt_version)
+    
+    def _analyze_page(self, page_number: int, path: str, prepared_image: Dict[str, Any], total_samples: int,
+                      cache_key: str = None) -> Dict[str, Any]:
+        """Analyze one sampled page; the shared LLM client paces requests and retries transient failures."""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
+            print(f"Analyzing page {page_number}/{total_samples}: {os.path.basename(path)}")
+            
+            base64_image = base64.b64encode(prepared_image["data"]).decode('utf-8')
+            
+            try:
+                response = self.llm.create(
+                    "page_analysis",
+                    model=self.vision_model,
+                    messages=[
+                        {
+                            "role": "user", 
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": f"Analyze this comic book page {page_number}. {self.page_analysis_focus}"
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": {
+                                        "url": f"data:{prepared_image['mime_type']};base64,{base64_image}",
+                                        "detail": "low" # Added detail parameter
+                                    }
+                                }
+                            ]
+                        }
+                    ],
+                    max_tokens=self.page_max_tokens
+                )
+                page_analysis = response.choices[0].message.content
+                if self.page_cache and cache_key:
+                    self.page_cache.set(cache_key, {"analysis": page_analysis, "model": self.vision_model})
+                return {
+                    "page": page_number,
+                    "analysis": page_analysis,
+                    "source_file": os.path.basename(path)
+                }
+            except Exception as e:
+                vision_error = e
+            
+            print(f"Vision API failed: {vision_error}")
+            response = self.llm.create(
+                "page_analysis_fallback",
+                model="gpt-4.1", 
                 messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert comic book analyst. Create a comprehensive story breakdown from the page analyses provided, focusing on elements suitable for YouTube script creation."
-                    },
                     {
                         "role": "user",
-                        "content": f"""Analyze these comic pages and create a story breakdown:
+                        "content": f"I have a comic book page (page {page_number} of {total_samples}) but cannot process the image directly. Please provide a template analysis for what should be extracted from a comic book page, including: dialogue, character actions, visual elements, and story progression. Make this realistic for a superhero comic."
+                    }
+                ],
+                max_tokens=600
+            )
+            
+            return {
+                "page": page_number,
+                "analysis": f"[MOCK ANALYSIS - Image processing unavailable]\n{response.choices[0].message.content}",
+                "source_file": os.path.basename(path)
+            }
+            
+        except Exception as e:
+            print(f"Error analyzing page {path}: {e}")
+            return {
+                "page": page_number,
+                "analysis": f"[ERROR] Could not analyze page {page_number}: {e}. This would contain dialogue, character interactions, and visual storytelling elements typical of a comic book page.",
+                "source_file": os.path.basename(path)
+            }
+    
+    def _summarize_scene(self, units: List[Dict[str, Any]], level: int) -> Dict[str, Any]:
+        """Summarize consecutive pages (level 0) or consecutive scene summaries into one summary of that stretch."""
+        if len(units) == 1:
+            return units[0]
+        pages = f"{units[0]['first']}-{units[-1]['last']}"
+        parts = "page analyses" if level == 0 else "scene summaries"
+        numbered = "\n\n".join(f"{'Page' if level == 0 else 'Pages'} {unit['pages']}: {unit['summary']}" for unit in units)
+        try:
+            response = self.llm.create(
+                "scene_summary" if level == 0 else "scene_merge",
+                model="gpt-4.1",
+                messages=[
+                    {"role": "system", "content": "You are an expert comic book analyst summarizing an issue one stretch of pages at a time."},
+                    {"role": "user", "content": f"""These {parts} cover pages {pages} of a comic, in reading order. Summarize what happens in them as one continuous stretch of the story: who is involved, the key events and dialogue in order, and how the stretch ends. Keep character names exactly as given. Stay under 200 words.
 
-{combined_analysis}
+{numbered}"""}
+                ],
+                max_tokens=400
+            )
+            summary = response.choices[0].message.content
+        except Exception as e:
+            # The issue summary can still work from the unmerged text; the prompt budget trims it if needed
+            print(f"⚠️ Summary of pages {pages} failed ({e}), passing its {parts} on unmerged")
+            summary = numbered
+        return {"pages": pages, "first": units[0]["first"], "last": units[-1]["last"], "summary": summary}
+    
+    def _summarize_scenes(self, page_analyses: List[Dict]) -> Tuple[List[Dict[str, Any]], int]:
+        """Summarize every page in a tree: runs of scene_size pages into scenes, then summary_fan_in scenes at a
+        time, one level at a time with each level's summaries written in parallel, until at most summary_fan_in
+        summaries remain for the issue summary. Returns those and the number of levels."""
+        units = [{"pages": str(p["page"]), "first": p["page"], "last": p["page"], "summary": p["analysis"]}
+                 for p in page_analyses]
+        group_size = self.scene_size
+        levels = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while levels == 0 or len(units) > self.summary_fan_in:
+                groups = [units[i:i + group_size] for i in range(0, len(units), group_size)]
+                units = list(executor.map(in_current_context(lambda group, level=levels: self._summarize_scene(group, level)), groups))
+                levels += 1
+                group_size = self.summary_fan_in
+                print(f"Summarized pages level {levels}: {len(groups)} group(s)")
+        return units, levels
+    
+    def _generate_story_summary_fixed(self, page_analyses: List[Dict], total_pages: int,
+                                      scene_summaries: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Generate story summary with error handling. With full coverage the scene summaries
+        of every page are summarized instead of the individual page analyses."""
+        if scene_summaries:
+            request = "These summaries cover every page of the comic in reading order. Create a story breakdown from them:"
+            combined_analysis = "\n\n".join(f"Pages {scene['pages']}: {scene['summary']}" for scene in scene_summaries)
+        else:
+            request = "Analyze these comic pages and create a story breakdown:"
+            combined_analysis = "\n\n".join([
+                f"Page {p['page']}: {p['analysis']}" for p in page_analyses
+            ])
+        
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "role": "system",
+                    "content": "You are an expert comic book analyst. Create a comprehensive story breakdown from the page analyses provided, focusing on elements suitable for YouTube script creation."
+                },
+                {
+                    "role": "user",
+                    "content": f"""{request}
+
+{sections['page_analyses']}
 
 Provide:
 **STORY STRUCTURE:** Setup, conflict, climax, resolution
@@ -276,8 +626,17 @@ Provide:
 **TIMING CONSIDERATIONS:** Essential vs optional elements for 60-90 second script
 
 Total pages: {total_pages}, Analyzed: {len(page_analyses)}"""
-                    }
-                ],
+                }
+            ]
+        messages = self.llm.prompt_budget.fit("story_summary", [
+            PromptSection("page_analyses", combined_analysis, min_tokens=500)
+        ], build_messages)
+        
+        try:
+            response = self.llm.create(
+                "story_summary",
+                model="gpt-4.1",
+                messages=messages,
                 max_tokens=1200
             )
             
@@ -318,11 +677,17 @@ Total pages analyzed: {len(page_analyses)} of {total_pages}""",
                 "fallback": True
             }
     
-    def generate_youtube_script_fixed(self, story_analysis: Dict[str, Any], target_duration: int = 75) -> Dict[str, Any]:
-        """Generate YouTube script with enhanced error handling and schema-aligned system prompt."""
+    def generate_youtube_script_fixed(self, story_analysis: Dict[str, Any], target_duration: int = 75,
+                                      on_script: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """Generate YouTube script with enhanced error handling and schema-aligned system prompt.
+
+        The JSON reply is streamed; on_script is called with the script field as soon as it is
+        complete, before the hook analysis and title suggestions have been generated.
+        """
         
         story_content = story_analysis.get("story_summary", {}).get("summary", "")
         page_details = story_analysis.get("page_analyses", [])
+        page_details_text = "\n".join(f"Page {p['page']}: {p['analysis'][:200]}..." for p in page_details)
         
         # --- START OF UPDATED SYSTEM PROMPT ---
         system_prompt_content = """You are a script writer tasked with generating concise, factual narrative summaries of comic book plotlines, suitable for short video formats. Your primary function is to create scripts that **strictly adhere to the `ComicShortsNarrativeProfile` (detailed in the SCRIPTING DIRECTIVES below) in style, structure, word choice, and overall narrative approach.**
@@ -331,14 +696,7 @@ You MUST analyze the following successful script examples and the subsequent SCR
 
 **SUCCESSFUL SCRIPT EXAMPLES (Study these carefully to understand the target style):**
 
-Example 1 - "How Did Dr Doom Take Over The World?":
-"After sorcerer Supreme Dr. Doom took over the world, he put an end to all senseless wars and promised every citizen free universal healthcare, leaving the Avengers with no other choice but to stop him. After gathering every useful hero available and Squirrel Girl, the Avengers arrive at Laaria to end Doom's reign, only to be completely humiliated in front of the whole world. As time went on and people's lives began to change for the better, Doom's followers started to grow in number. While the Avengers are desperately trying to come up with a plan to stop him, believing that Doom has every world leader under some form of mind control, Carol comes up with a plan to free them from Doom's influence. And while she believes that the Avengers are more than powerful enough to beat Victor, she's called in a few villains to help them. With the help of their new allies, Captain Marvel plans to distract Doom while Scarlet Witch frees every world leader from his mind control. And with everyone on board, they arrive at the Lavarian border once again. Having anticipated their arrival, Doom welcomes the Avengers with his dinosaur variant. And while he's surprised that Earth's mightiest heroes were desperate enough to team up with a group of villains, he reassures them that they stand no chance of winning. While the Avengers are keeping Doom distracted, Scarlet Witch enters the mind of every politician under Doom's influence. But after spending hours trying to break their mind control, she's shocked to learn the truth. Despite what they thought, Doom didn't use his powers to control the politicians. He simply offered to give them whatever they needed to gain their support, money, power, or drugs."
-
-Example 2 - "How Spider-Man Almost Ended Peter Parker?":
-"How did Spider-Man almost get Peter Parker killed? While Peter is out on a date with MJ, they are interrupted by a giant tric sentinel destroying Manhattan. MJ asks if he needs to get out of here, but Peter doesn't think he'll have to because Spider-Man is already there to deal with it. A few days ago, Peter went to visit Dr. Connors at the university to discuss the isotope genome accelerator, the device that gave him his powers all those years ago. Connors explains that with the accelerator's help, he plans to separate his human side from the lizard, but their talk is cut short by Taskmaster and Black Ant, who came to steal the device. Taskmaster throws Peter out of the way, only for him to accidentally turn on the accelerator, separating Spider-Man and Peter Parker from each other. Once Spider-Man has dealt with the villains, he and Peter swing away to talk about what just happened. But after realizing that they can finally live separate lives, Spidey goes to do some superhero stuff, leaving Peter alone on the rooftop. Without his powers, Peter can finally live a normal life. He can go back to school and settle down with the woman he loves. All while Spider-Man is having the time of his life, going on talk shows, and making millions of dollars with various sponsorships. But when he starts to swing people around the city for money, Peter decides it's time to have a talk. Realizing that the experiment left Spider-Man with no sense of responsibility or intellect, Peter tries to remind him of why they decided to become heroes in the first place, only for Spidey to web him to a wall and swing away. Knowing that he needs to get his powers back or somebody will get hurt, Peter steals the accelerator from Dr. Connors lab, but when he tries to turn everything back to normal, they are attacked by an army of Tsentinels. As they try to run away, a sentinel behind them is about to blow both of them up, only for Peter to save Spider-Man's life by pushing him away. Lying half dead on the ground, Peter hopes that Spider-Man has finally learned to be more responsible. But since it didn't really work, he activates the accelerator with his web shooter, merging their bodies back"
-
-Example 3 - "Deadpool Takes Spider-Man To Hell":
-"While Spider-Man is fighting with Hydroman, Deadpool interrupts them, telling Spidey that his villains are very boring. And after giving him a hug, Wade teleports both of them to hell, where they're captured by Dormamu. As Deadpool continues to annoy Spider-Man with his jokes, Peter asks Dormamu if he can torture them separately, buying Wade just enough time to dislocate his hip and cut themselves loose. When Dormamu's mindless ones attack them, Wade is confused why Spidey is angry with him, saying he only wanted to give him a battle worthy of an Avenger. But when even Dormamu questions why Spider-Man would team up with an idiot like Deadpool, Wade ends the battle by giving the mindless ones brains, causing them to turn against their master. Thinking that this must be a bad dream, Spider-Man tells Deadpool to immediately take them home. But by the time they arrive, Hydroman has absorbed all the water from the sewers, demanding $100 million or he'll drown the city in its own filth. After getting blasted with sewer water, Deadpool blames Spider-Man for unleashing a walking toilet on the city. But when Peter asks if he has any grenades on him, he throws Wade into Hydroman, causing both of them to explode. While Deadpool's legs are starting to grow back, Spider-Man cleans his suit on a rooftop. But as he gets ready to leave, Wade asks to hear him out for a second. Deadpool explains that he's been trying to change and thought that if he spent more time with Spider-Man, he could start to earn his respect. But knowing that it probably won't happen, Wade jumps off the roof while Peter swings away, saying that he needs a lot of therapy."
+{reference_examples}
 
 **SCRIPTING DIRECTIVES (Strictly Adhere to the `ComicShortsNarrativeProfile` Guidelines):**
 
@@ -378,43 +736,75 @@ You will now be provided with the `ComicShortsNarrativeProfile` JSON schema (or
 """
         # --- END OF UPDATED SYSTEM PROMPT ---
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1", 
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Create a {target_duration}-second YouTube script from this comic analysis:
+        started = time.time()
+        script_ready = {}
+        def script_complete(script: str):
+            if not script.strip():
+                return
+            script_ready["script"] = script
+            script_ready["seconds"] = time.time() - started
+            print(f"✅ Script section ready after {script_ready['seconds']:.1f}s")
+            if on_script:
+                on_script(script)
+        parser = JsonFieldParser("script", on_value=script_complete)
+
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "role": "system", 
+                    "content": system_prompt_content.format(reference_examples=sections["reference_examples"])
+                },
+                {
+                    "role": "user",
+                    "content": f"""Create a {target_duration}-second YouTube script from this comic analysis:
 
 **STORY ANALYSIS:**
-{story_content}
+{sections['story_analysis']}
 
 **PAGE DETAILS (first 200 chars for context):**
-{chr(10).join([f"Page {p['page']}: {p['analysis'][:200]}..." for p in page_details])}
+{sections['page_details']}
 
-Generate:
-1. **SCRIPT** - Complete narration The script should be a factual, narrative summary of the comic plot.
-2. **HOOK ANALYSIS** - Briefly explain why the opening of the generated script is effective according to the `ComicShortsNarrativeProfile` (e.g., direct question, character in situation).
-3. **TITLE SUGGESTIONS** - 3 titles that are factual and reflect the content, suitable for a short summary format.
+Return a JSON object with:
+1. **script** - Complete narration. The script should be a factual, narrative summary of the comic plot.
+2. **hook_analysis** - Briefly explain why the opening of the generated script is effective according to the `ComicShortsNarrativeProfile` (e.g., direct question, character in situation).
+3. **title_suggestions** - 3 titles that are factual and reflect the content, suitable for a short summary format.
 
 Make it accurate to the source, and optimized for YouTube Shorts, strictly adhering to the style, patterns, and directives of the `ComicShortsNarrativeProfile` and the provided examples.
 """
-                    }
-                ],
+                }
+            ]
+        condensed_examples = condense_examples(REFERENCE_SCRIPT_EXAMPLES)
+        messages = self.llm.prompt_budget.fit("script_generation", [
+            PromptSection("page_details", page_details_text, priority=0, min_tokens=200),
+            PromptSection("story_analysis", story_content, priority=1, min_tokens=400),
+            # The examples define the target style, so they are only ever cut back to their openings
+            PromptSection("reference_examples", REFERENCE_SCRIPT_EXAMPLES, priority=2,
+                          min_tokens=count_tokens(condensed_examples), condensed=condensed_examples)
+        ], build_messages)
+
+        try:
+            script_data = self.llm.create_json(
+                "script_generation",
+                "comic_short_script",
+                SCRIPT_OUTPUT_SCHEMA,
+                on_text=parser.feed,
+                model="gpt-4.1", 
+                messages=messages,
                 max_tokens=1800 
             )
             
-            script_content = response.choices[0].message.content
+            if "script" in script_ready:
+                # A repaired reply keeps the script that dependent work has already started from
+                script_data["script"] = script_ready["script"]
             
             return {
-                "script": script_content,
+                "script": render_markdown(script_data),
+                "script_section": script_data["script"],
+                "structured_output": script_data,
+                "script_ready_seconds": script_ready.get("seconds"),
                 "target_duration": target_duration,
                 "generated_timestamp": time.time(),
-                "word_count": len(script_content.split())
+                "word_count": len(script_data["script"].split())
             }
             
         except Exception as e:
@@ -437,6 +827,7 @@ Make it accurate to the source, and optimized for YouTube Shorts, strictly adher
             print(f"⚠️ Script generation API failed: {e}. Using fallback script.")
             return {
                 "script": fallback_script,
+                "script_section": fallback_script.split("**HOOK ANALYSIS:**")[0].strip(),
                 "target_duration": target_duration,
                 "generated_timestamp": time.time(),
                 "word_count": len(fallback_script.split()),
@@ -447,60 +838,78 @@ Make it accurate to the source, and optimized for YouTube Shorts, strictly adher
     def process_comic_to_script_fixed(self, cbr_path: str, target_duration: int = 75) -> Dict[str, Any]:
         """Complete pipeline with robust error handling."""
         try:
-            print("🔄 Extracting images from CBR...")
+            print("🔄 Listing images in CBR...")
             image_paths = self.extract_cbr_images_robust(cbr_path)
             
             if not image_paths:
                 return {"error": "No images found in CBR file after trying all extraction methods"}
                 
-            print(f"✅ Successfully extracted {len(image_paths)} images")
+            print(f"✅ Found {len(image_paths)} images")
             
             print("🔄 Analyzing comic story structure...")
             story_analysis = self.analyze_comic_pages_fixed(image_paths)
             
             if "error" in story_analysis:
                 return story_analysis
+            story_analysis["comic_filename"] = os.path.basename(cbr_path)
             
             print("🔄 Generating YouTube script...")
             script_result = self.generate_youtube_script_fixed(story_analysis, target_duration)
             
             # No explicit error check here as generate_youtube_script_fixed now has fallback
             
-            return {
-                "story_analysis": story_analysis,
-                "script_generation_result": script_result, # Renamed for clarity
-                "source_file": cbr_path,
-                "processing_timestamp": time.time(),
-                "status": "success" if "error_message" not in script_result else "success_with_fallback_script"
-            }
+            return self.build_processing_result(cbr_path, story_analysis, script_result)
             
         except Exception as e:
             print(f"❌ Top-level processing error: {e}") # Added print for better debugging
             return {"error": f"Processing failed: {e}"}
     
+    def build_processing_result(self, cbr_path: str, story_analysis: Dict[str, Any], script_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Agent 1's output document."""
+        return {
+            "story_analysis": story_analysis,
+            "script_generation_result": script_result, # Renamed for clarity
+            "source_file": cbr_path,
+            "processing_timestamp": time.time(),
+            "status": "success" if "error_message" not in script_result else "success_with_fallback_script"
+        }
+    
     def cleanup(self):
-        """Clean up temporary files."""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-            print(f"🧹 Cleaned up temp directory: {self.temp_dir}")
-            self.temp_dir = None # Reset temp_dir
+        """Close the open archive and any temporary files its backend created."""
+        if self.archive:
+            self.archive.close()
+            print(f"🧹 Closed archive: {self.archive.archive_path}")
+            self.archive = None
 
 def main():
     if len(sys.argv) < 3:
-        print("Usage: python agent_1_comic_processor_fixed.py <cbr_file> <openai_api_key> [target_duration]")
+        print("Usage: python agent_1_comic_processor.py <cbr_file> <openai_api_key> [target_duration] [output_json_path]")
+        print("Example: python agent_1_comic_processor.py comic.cbr sk-... 75 /path/to/output/agent_1.json")
         sys.exit(1)
     
     cbr_file = sys.argv[1]
     api_key = sys.argv[2]
     target_duration = int(sys.argv[3]) if len(sys.argv) > 3 else 75
+    output_json_path = sys.argv[4] if len(sys.argv) > 4 else f"agent_1_output_{os.path.basename(cbr_file)}_{int(time.time())}.json"
+    output_md_path = os.path.splitext(output_json_path)[0] + ".md"
+    
+    # Ensure output directory exists
+    output_dir = os.path.dirname(output_json_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"Created output directory: {output_dir}")
     
     processor = ComicProcessorFixed(api_key)
     
     try:
         result = processor.process_comic_to_script_fixed(cbr_file, target_duration)
         
-        if "error" in result and result["status"] != "success_with_fallback_script": # Allow fallback success
+        if "error" in result and result.get("status") != "success_with_fallback_script": # Allow fallback success
             print(f"❌ Error: {result['error']}")
+            # Still save the error information to the JSON file
+            with open(output_json_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            print(f"Error details saved to: {output_json_path}")
             sys.exit(1)
         
         print("\n" + "="*80)
@@ -529,8 +938,11 @@ def main():
         
         print(f"\nScript Word Count: {script_data.get('word_count', 'N/A')}")
         
-        output_file = f"agent_1_output_{os.path.basename(cbr_file)}_{int(time.time())}.md" # More descriptive filename
-        with open(output_file, 'w', encoding='utf-8') as f: # Added encoding
+        with open(output_json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n✅ Results (JSON) saved to: {output_json_path}")
+        
+        with open(output_md_path, 'w', encoding='utf-8') as f: # Added encoding
             f.write(f"# Agent 1: Comic Processor & Script Creator\n\n")
             f.write(f"**Source:** {result.get('source_file', 'N/A')}  \n")
             f.write(f"**Target Duration:** {script_data.get('target_duration', target_duration)} seconds  \n")
@@ -546,12 +958,18 @@ def main():
             f.write("---\n\n## Generated Script Content\n\n")
             f.write(str(script_data.get('script', 'N/A')) + "\n\n") # Ensure string
             f.write(f"**Script Word Count:** {script_data.get('word_count', 'N/A')}\n")
-        print(f"\n✅ Results saved to: {output_file}")
+        print(f"ℹ️  Readable summary (Markdown) saved to: {output_md_path}")
+
+        if processor.llm.stats["replay_misses"]:
+            # Fallbacks keep the run going, but a replay is only valid if every completion came from the cache
+            print(f"❌ Replay mode: {processor.llm.stats['replay_misses']} completion(s) were not in the cache")
+            sys.exit(1)
         
     except Exception as e: # Catch any unexpected errors during main execution
         print(f"❌ An unexpected error occurred in main: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
     finally:
         processor.cleanup()
 
@@ -11,53 +11,158 @@ import sys
 import json
 import csv
 import time
-from typing import List, Dict, Any
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from openai import OpenAI
+from disk_cache import DiskCache
+from llm_client import LLMClient
+from prompt_budget import PromptSection
+from script_sections import script_from_result
+from stage_scheduler import future_result
+from structured_output import render_fields, render_markdown, strict_object
+from tracing import span, in_current_context
+
+COMPETITOR_NOTES_SYSTEM_PROMPT = """You are a competitive content analyst for comic book YouTube Shorts. You condense batches of competitor videos into short, factual pattern notes that will later be merged with notes from other batches. Be terse and only report patterns you can see in the material."""
+
+SCORE_SCHEMA = {"type": "integer", "minimum": 1, "maximum": 10}
+
+ACCURACY_REVIEW_SCHEMA = strict_object({
+    "accuracy_assessment": {"type": "string", "description": "Story events, character portrayal and dialogue adaptation compared with the source"},
+    "profile_adherence": {"type": "string", "description": "Narrative voice and tense, factual recounting, structure and pacing, language, cinematic elements"},
+    "completeness_and_clarity": {"type": "string", "description": "Missing essential elements, plot coherence and clarity of the summary"},
+    "improvement_recommendations": {"type": "array", "items": {"type": "string"}, "minItems": 1,
+                                    "description": "Specific action items for accuracy and profile alignment"},
+    "scores": strict_object({
+        "accuracy_to_source": SCORE_SCHEMA,
+        "profile_adherence": SCORE_SCHEMA
+    })
+})
+# What later prompts need from a review when it has to be condensed to fit their budget
+ACCURACY_REVIEW_ACTION_FIELDS = ("scores", "improvement_recommendations")
+
+RECOMMENDATIONS_SCHEMA = strict_object({
+    "critical_fixes": {"type": "array", "items": {"type": "string"}, "description": "Priority 1: accuracy and profile alignment fixes"},
+    "narrative_enhancements": {"type": "array", "items": {"type": "string"}, "description": "Priority 2: enhancing the factual narrative summary"},
+    "competitive_insights": {"type": "array", "items": {"type": "string"}, "description": "Priority 3: compatible competitive insights"},
+    "specific_edits": {"type": "array", "items": strict_object({
+        "original": {"type": "string"},
+        "revised": {"type": "string"},
+        "reason": {"type": "string"}
+    }), "description": "Line-level edits illustrating the recommendations"},
+    "implementation_notes": {"type": "string", "description": "How the changes ensure source accuracy and profile adherence"}
+})
 
 class ScriptEditor:
-    def __init__(self, api_key: str, competitor_data_path: str):
-        self.client = OpenAI(api_key=api_key)
-        self.competitor_data = self._load_competitor_data(competitor_data_path)
-
-    def _load_competitor_data(self, csv_path: str) -> List[Dict[str, str]]:
-        """Load competitor YouTube shorts data from CSV."""
-        competitor_data = []
+    def __init__(self, api_key: str, competitor_data_path: str, client: Optional[OpenAI] = None,
+                 cache_dir: Optional[str] = os.path.join(".cache", "competitor_analysis"),
+                 chunk_size: int = 25, analysis_workers: int = 4, reduce_fan_in: int = 8,
+                 llm: Optional[LLMClient] = None):
+        self.client = client or OpenAI(api_key=api_key)
+        self.llm = llm or LLMClient(self.client)
+        self.analysis_model = "gpt-4.1"
+        self.chunk_size = max(1, chunk_size)
+        self.analysis_workers = max(1, analysis_workers)
+        self.reduce_fan_in = max(2, reduce_fan_in)
+        self.chunk_max_tokens = 800
+        self.description_chars = 200
+        self.transcript_chars = 500
+        # The CSV is streamed whenever it is analyzed rather than held in memory
+        self.competitor_data_path = competitor_data_path
+        # Reread whenever the file's signature changes, see _refresh_competitor_data
+        self.competitor_data_signature = self._competitor_data_signature()
+        self.competitor_data_hash = self._hash_file(competitor_data_path)
+        self.competitor_video_count = self._count_competitor_videos(competitor_data_path)
+        # The competitor CSV changes rarely, so its analysis is reused across runs until the CSV or prompt changes
+        self.analysis_cache = DiskCache(cache_dir) if cache_dir else None
+        self._analysis_lock = threading.Lock()
+
+    @staticmethod
+    def _hash_file(path: str) -> Optional[str]:
+        """SHA-256 of a file's contents, read in chunks; None if it cannot be read."""
+        if not path or not os.path.exists(path):
+            return None
+        digest = hashlib.sha256()
+        try:
+            with span("competitor_csv_hash", "io", bytes=os.path.getsize(path)), open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def _competitor_data_signature(self) -> Optional[Tuple[int, int]]:
+        """Modification time and size of the competitor CSV; None if it cannot be read."""
+        try:
+            stat = os.stat(self.competitor_data_path)
+        except (OSError, TypeError, ValueError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh_competitor_data(self):
+        """Rehash and recount the competitor CSV if it changed since it was last read,
+        so a long-lived editor (e.g. in the pipeline service) never analyzes a stale corpus."""
+        signature = self._competitor_data_signature()
+        if signature == self.competitor_data_signature:
+            return
+        print(f"Competitor data changed, re-reading {self.competitor_data_path}")
+        self.competitor_data_signature = signature
+        self.competitor_data_hash = self._hash_file(self.competitor_data_path)
+        self.competitor_video_count = self._count_competitor_videos(self.competitor_data_path)
+
+    def _iter_competitor_rows(self) -> Iterator[Dict[str, str]]:
+        """Stream competitor rows from the CSV one at a time, trimmed to the fields and lengths the prompts use."""
+        with open(self.competitor_data_path, 'r', encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                yield {
+                    'video_id': row.get('Video ID', ''),
+                    'title': row.get('Title', ''),
+                    'description': (row.get('Description') or '')[:self.description_chars],
+                    'transcript': (row.get('Transcript') or '')[:self.transcript_chars],
+                    'url': row.get('URL', '')
+                }
+
+    def _count_competitor_videos(self, csv_path: str) -> int:
+        """Count competitor rows with a streaming pass, without keeping them in memory."""
         if not csv_path or not os.path.exists(csv_path):
             print(f"Warning: Competitor data file not found or path not provided: {csv_path}. Competitive analysis will be limited.")
-            return competitor_data
+            return 0
         try:
-            with open(csv_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    competitor_data.append({
-                        'video_id': row.get('Video ID', ''),
-                        'title': row.get('Title', ''),
-                        'description': row.get('Description', ''),
-                        'transcript': row.get('Transcript', ''),
-                        'url': row.get('URL', '')
-                    })
-            print(f"Loaded {len(competitor_data)} competitor videos for analysis from {csv_path}")
+            with span("competitor_csv_count", "io", bytes=os.path.getsize(csv_path)) as counting:
+                count = sum(1 for _ in self._iter_competitor_rows())
+                counting["rows"] = count
+            print(f"Found {count} competitor videos for analysis in {csv_path}")
+            return count
         except Exception as e:
             print(f"Warning: Could not load competitor data from {csv_path}: {e}")
-
-        return competitor_data
-
-    def analyze_competitor_patterns(self) -> Dict[str, Any]:
-        """Analyze competitor data to identify successful patterns, benchmarked against ComicShortsNarrativeProfile."""
-        if not self.competitor_data:
-            return {"info": "No competitor data available or loaded for analysis.", "competitive_analysis": "Not performed."}
-
+            return 0
+
+    def _iter_competitor_chunks(self) -> Iterator[List[Dict[str, str]]]:
+        """Group the streamed rows into chunks of chunk_size videos."""
+        chunk = []
+        for row in self._iter_competitor_rows():
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _format_competitor_videos(videos: List[Dict[str, str]], first_number: int = 1) -> str:
         competitor_examples = []
-        for i, video in enumerate(self.competitor_data[:10]):
+        for i, video in enumerate(videos):
             competitor_examples.append(f"""
-VIDEO {i+1}:
+VIDEO {first_number + i}:
 Title: {video['title']}
-Description: {video['description'][:200]}...
-Transcript: {video['transcript'][:500]}...
+Description: {video['description']}...
+Transcript: {video['transcript']}...
 """)
+        return "\n".join(competitor_examples)
 
-        combined_examples = "\n".join(competitor_examples)
-
+    def _competitor_analysis_prompts(self, material: str, material_description: str) -> Tuple[str, str]:
+        """System and user prompts for the final competitive analysis over either raw videos or merged pattern notes."""
         system_prompt_content = """You are a competitive content analyst specializing in YouTube Shorts for comic book content. Your primary goal is to identify how competitor content aligns with or deviates from the **`ComicShortsNarrativeProfile`** style, which emphasizes factual, third-person narrative summaries.
 
 **REFERENCE `ComicShortsNarrativeProfile` STYLE (Derived from successful examples - this is the target style):**
@@ -76,19 +181,9 @@ Example 3 - "Deadpool Takes Spider-Man To Hell": ...
 
 Your task is to analyze competitor content and identify patterns specifically in relation to this `ComicShortsNarrativeProfile` style. Focus on how they achieve engagement while adhering to, or deviating from, these factual narrative summary principles.
 """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Analyze these YouTube Shorts about comic books. Identify key patterns in their titles, content structure, narrative techniques, and engagement optimization, **specifically in relation to the `ComicShortsNarrativeProfile` style (factual, narrative summary) described in the system prompt and exemplified by the provided successful scripts.**
+        user_prompt_content = f"""Analyze {material_description}. Identify key patterns in their titles, content structure, narrative techniques, and engagement optimization, **specifically in relation to the `ComicShortsNarrativeProfile` style (factual, narrative summary) described in the system prompt and exemplified by the provided successful scripts.**
 
-{combined_examples}
+{material}
 
 Provide detailed analysis covering:
 
@@ -117,19 +212,151 @@ Provide detailed analysis covering:
 
 Provide specific, actionable recommendations for creating or improving scripts to better align with the `ComicShortsNarrativeProfile` style, based on observed competitor strategies that are compatible with this factual narrative approach.
 """
-                    }
-                ],
-                max_tokens=2000
-            )
+        return system_prompt_content, user_prompt_content
+
+    def _chat(self, system_prompt: str, user_prompt: str, max_tokens: int, label: str) -> str:
+        response = self.llm.create(
+            label,
+            model=self.analysis_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+    def _cached_chat(self, system_prompt: str, user_prompt: str, max_tokens: int, label: str) -> str:
+        """Chat completion backed by the analysis cache, so unchanged chunks and merges are not re-billed."""
+        cache_key = DiskCache.make_key(self.analysis_model, system_prompt, user_prompt, str(max_tokens))
+        if self.analysis_cache:
+            cached = self.analysis_cache.get(cache_key)
+            if cached:
+                return cached["content"]
+        content = self._chat(system_prompt, user_prompt, max_tokens, label)
+        if self.analysis_cache:
+            self.analysis_cache.set(cache_key, {"content": content})
+        return content
+
+    def _analyze_competitor_chunk(self, first_number: int, videos: List[Dict[str, str]]) -> str:
+        """Map step: distill one chunk of competitor videos into compact pattern notes."""
+        user_prompt = f"""Summarize the recurring patterns in these {len(videos)} comic book YouTube Shorts as compact bullet notes under these headings: TITLE PATTERNS, CONTENT STRUCTURE, NARRATIVE TECHNIQUES, ENGAGEMENT OPTIMIZATION, WEAKNESSES. Note how common each pattern is (e.g. "7/{len(videos)} videos") and quote at most one short example title per pattern.
+
+{self._format_competitor_videos(videos, first_number)}
+"""
+        return self._cached_chat(COMPETITOR_NOTES_SYSTEM_PROMPT, user_prompt, self.chunk_max_tokens, "competitor_chunk_notes")
 
-            return {
-                "competitive_analysis": response.choices[0].message.content,
-                "videos_analyzed": len(self.competitor_data[:10]),
-                "analysis_timestamp": time.time()
-            }
+    def _merge_pattern_notes(self, notes: List[str]) -> str:
+        """Reduce step: merge several sets of pattern notes into one, keeping the same headings."""
+        numbered_notes = "\n\n".join(f"NOTES {i+1}:\n{note}" for i, note in enumerate(notes))
+        user_prompt = f"""Merge these {len(notes)} sets of pattern notes from comic book YouTube Shorts into a single set with the same headings (TITLE PATTERNS, CONTENT STRUCTURE, NARRATIVE TECHNIQUES, ENGAGEMENT OPTIMIZATION, WEAKNESSES). Combine duplicate patterns, add up how common they are, and keep the most prevalent patterns first.
 
-        except Exception as e:
-            return {"error": f"Competitive analysis failed: {e}"}
+{numbered_notes}
+"""
+        return self._cached_chat(COMPETITOR_NOTES_SYSTEM_PROMPT, user_prompt, self.chunk_max_tokens, "competitor_notes_merge")
+
+    def _map_competitor_chunks(self, executor: ThreadPoolExecutor) -> Tuple[List[str], int]:
+        """Analyze every chunk concurrently, keeping at most a couple of chunks per worker in memory."""
+        notes: Dict[int, str] = {}
+        failed_chunks = 0
+        in_flight = {}
+        max_in_flight = self.analysis_workers * 2
+
+        def collect(done_futures):
+            nonlocal failed_chunks
+            for future in done_futures:
+                chunk_index = in_flight.pop(future)
+                try:
+                    notes[chunk_index] = future.result()
+                except Exception as e:
+                    failed_chunks += 1
+                    print(f"⚠️  Competitor chunk {chunk_index + 1} failed: {e}")
+
+        for chunk_index, chunk in enumerate(self._iter_competitor_chunks()):
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(in_current_context(self._analyze_competitor_chunk), chunk_index * self.chunk_size + 1, chunk)
+            in_flight[future] = chunk_index
+        collect(list(in_flight))
+
+        return [notes[i] for i in sorted(notes)], failed_chunks
+
+    def _reduce_pattern_notes(self, executor: ThreadPoolExecutor, notes: List[str]) -> Tuple[str, int]:
+        """Merge notes in a tree of reduce_fan_in-sized groups, one level at a time, until one set remains."""
+        levels = 0
+        while len(notes) > 1:
+            groups = [notes[i:i + self.reduce_fan_in] for i in range(0, len(notes), self.reduce_fan_in)]
+            notes = list(executor.map(in_current_context(lambda group: group[0] if len(group) == 1 else self._merge_pattern_notes(group)), groups))
+            levels += 1
+            print(f"Merged competitor notes level {levels}: {len(groups)} group(s)")
+        return notes[0], levels
+
+    def analyze_competitor_patterns(self) -> Dict[str, Any]:
+        """Analyze the whole competitor corpus to identify successful patterns, benchmarked against ComicShortsNarrativeProfile.
+
+        Small corpora go to the model directly. Larger ones are analyzed chunk by chunk (map),
+        the chunk notes are merged in a tree (reduce), and the merged notes feed the final analysis.
+        """
+        # Held across the refresh, lookup and generation so concurrent reviews share a single analysis
+        # of one version of the CSV
+        with self._analysis_lock:
+            self._refresh_competitor_data()
+            if not self.competitor_video_count:
+                return {"info": "No competitor data available or loaded for analysis.", "competitive_analysis": "Not performed."}
+
+            max_tokens = 2000
+            analysis_settings = f"chunk_size={self.chunk_size};fan_in={self.reduce_fan_in};chunk_max_tokens={self.chunk_max_tokens}"
+            template_system, template_user = self._competitor_analysis_prompts("{material}", "{material_description}")
+            cache_key = DiskCache.make_key(self.competitor_data_hash or "", self.analysis_model,
+                                           template_system, template_user, COMPETITOR_NOTES_SYSTEM_PROMPT,
+                                           analysis_settings, str(max_tokens))
+
+            if self.analysis_cache:
+                cached = self.analysis_cache.get(cache_key)
+                if cached:
+                    print("Using cached competitive analysis (competitor CSV, model and prompt unchanged)")
+                    return dict(cached, used_cached_analysis=True)
+
+            try:
+                analysis_start = time.time()
+                chunks_analyzed = 0
+                failed_chunks = 0
+                reduce_levels = 0
+
+                if self.competitor_video_count <= self.chunk_size:
+                    videos = list(self._iter_competitor_rows())
+                    material = self._format_competitor_videos(videos)
+                    material_description = "these YouTube Shorts about comic books"
+                else:
+                    print(f"Analyzing {self.competitor_video_count} competitor videos in chunks of {self.chunk_size} with {self.analysis_workers} workers...")
+                    with ThreadPoolExecutor(max_workers=self.analysis_workers) as executor:
+                        notes, failed_chunks = self._map_competitor_chunks(executor)
+                        if not notes:
+                            return {"error": f"Competitive analysis failed: all {failed_chunks} competitor chunks failed"}
+                        chunks_analyzed = len(notes)
+                        material, reduce_levels = self._reduce_pattern_notes(executor, notes)
+                    material_description = (f"these pattern notes, distilled from {self.competitor_video_count} "
+                                            f"YouTube Shorts about comic books")
+
+                system_prompt_content, user_prompt_content = self._competitor_analysis_prompts(material, material_description)
+                analysis = {
+                    "competitive_analysis": self._chat(system_prompt_content, user_prompt_content, max_tokens, "competitive_analysis"),
+                    "videos_analyzed": self.competitor_video_count,
+                    "chunks_analyzed": chunks_analyzed,
+                    "failed_chunks": failed_chunks,
+                    "reduce_levels": reduce_levels,
+                    "analysis_duration": time.time() - analysis_start,
+                    "analysis_timestamp": time.time(),
+                    "competitor_data_hash": self.competitor_data_hash
+                }
+                # A partial corpus analysis is returned but not cached, so the next run retries the failed chunks
+                if self.analysis_cache and not failed_chunks:
+                    self.analysis_cache.set(cache_key, analysis)
+                return dict(analysis, used_cached_analysis=False)
+
+            except Exception as e:
+                return {"error": f"Competitive analysis failed: {e}"}
 
     def review_script_accuracy(self, agent_1_output: Dict[str, Any]) -> Dict[str, Any]:
         """Review script accuracy against original comic content and adherence to ComicShortsNarrativeProfile."""
@@ -140,36 +367,7 @@ Provide specific, actionable recommendations for creating or improving scripts t
 
         story_summary = story_analysis.get("story_summary", {}).get("summary", "")
         page_analyses = story_analysis.get("page_analyses", [])
-        raw_script_output = script_generation_result.get("script", "")
-
-        generated_script_content = raw_script_output
-        if "SCRIPT" in raw_script_output.upper(): # More robust check for "SCRIPT"
-            try:
-                # Find "SCRIPT" then find "HOOK ANALYSIS" or "TITLE SUGGESTIONS"
-                script_start_keyword = "SCRIPT"
-                script_end_keywords = ["HOOK ANALYSIS", "TITLE SUGGESTIONS"]
-
-                script_text_upper = raw_script_output.upper()
-                script_start_index = script_text_upper.find(script_start_keyword)
-
-                if script_start_index != -1:
-                    actual_script_start = script_start_index + len(script_start_keyword)
-                    # Find the earliest end keyword after the script start
-                    script_end_index = len(raw_script_output) # Default to end of string
-                    for end_keyword in script_end_keywords:
-                        found_end_index = script_text_upper.find(end_keyword, actual_script_start)
-                        if found_end_index != -1:
-                            script_end_index = min(script_end_index, found_end_index)
-                    
-                    generated_script_content = raw_script_output[actual_script_start:script_end_index].strip()
-                else: # "SCRIPT" keyword not found, use the whole thing but log it
-                    print("Warning: 'SCRIPT' keyword not found in Agent 1 output, using raw output for script content.")
-
-
-            except Exception as e:
-                print(f"Could not parse script from Agent 1 output, using raw output. Error: {e}")
-                generated_script_content = raw_script_output
-
+        generated_script_content = script_from_result(script_generation_result)
 
         detailed_story_from_pages = "\n".join([
             f"Comic Page {p.get('page_number_in_comic', 'N/A')} (Sample {p.get('sample_index', 'N/A')} of '{comic_filename}'):\n{p.get('analysis', 'N/A')}" for p in page_analyses
@@ -192,60 +390,72 @@ Provide specific, actionable recommendations for creating or improving scripts t
 
 You have a keen eye for detail and deep understanding of storytelling principles as they apply to factual narrative summaries in the style of the `ComicShortsNarrativeProfile`.
 """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Review this YouTube script for the comic '{comic_filename}'. Evaluate its accuracy against the original comic content AND its adherence to the `ComicShortsNarrativeProfile` style (factual, third-person narrative summary, present tense, no cinematic hooks, etc.).
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "role": "system",
+                    "content": system_prompt_content
+                },
+                {
+                    "role": "user",
+                    "content": f"""Review this YouTube script for the comic '{comic_filename}'. Evaluate its accuracy against the original comic content AND its adherence to the `ComicShortsNarrativeProfile` style (factual, third-person narrative summary, present tense, no cinematic hooks, etc.).
 
 **ORIGINAL COMIC STORY ANALYSIS (Source Material Summary for '{comic_filename}'):**
-{story_summary}
+{sections['story_summary']}
 
 **DETAILED PAGE CONTENT (Source Material Details from analyzed pages of '{comic_filename}'):**
-{detailed_story_from_pages}
+{sections['page_details']}
 
 **GENERATED SCRIPT (to be evaluated for '{comic_filename}'):**
 {generated_script_content}
 
 Provide comprehensive review covering:
 
-**ACCURACY ASSESSMENT (vs. Source Material for '{comic_filename}'):**
+**ACCURACY ASSESSMENT (vs. Source Material for '{comic_filename}') - field accuracy_assessment:**
 - Story events: Are key plot points from the source represented correctly in the script?
 - Character portrayal: Are characters depicted accurately as per the source?
 - Dialogue adaptation: Is important dialogue from the source preserved or adapted well into the narrative?
 
-**ADHERENCE TO `ComicShortsNarrativeProfile` STYLE:**
+**ADHERENCE TO `ComicShortsNarrativeProfile` STYLE - field profile_adherence:**
 - **Narrative Voice & Tense:** Is it consistently third-person, primarily present tense?
 - **Factual Recounting:** Does it stick to summarizing events without adding interpretation or embellishment?
 - **Structure & Pacing:** Does it follow the expected structure for a factual summary (e.g., clear beginning of the summarized arc, chronological flow, factual conclusion of the arc)?
 - **Language & Word Choice:** Is the language direct, with active verbs? Are direct quotes minimized and integrated?
 - **Avoidance of Cinematic Elements:** Are there any cinematic directions, scene headings, or artificial hooks for the short itself?
 
-**COMPLETENESS & CLARITY OF SUMMARY:**
+**COMPLETENESS & CLARITY OF SUMMARY - field completeness_and_clarity:**
 - Essential elements: Are crucial components of the summarized comic segment missing?
 - Plot coherence: Does the script tell a coherent summary of the intended comic segment?
 - Clarity: Will viewers understand the summarized events?
 
-**IMPROVEMENT RECOMMENDATIONS (for closer alignment with source and `ComicShortsNarrativeProfile`):**
+**IMPROVEMENT RECOMMENDATIONS (for closer alignment with source and `ComicShortsNarrativeProfile`) - field improvement_recommendations, one action item per entry:**
 - Specific additions/corrections for accuracy to the source material of '{comic_filename}'.
 - Edits to improve adherence to the `ComicShortsNarrativeProfile` (e.g., tense changes, removing subjective language, ensuring factual conclusion).
 - Suggestions for clarity or completeness of the summary.
 
-Rate overall accuracy to source (1-10) AND overall adherence to `ComicShortsNarrativeProfile` style (1-10). Provide specific action items.
+Rate overall accuracy to source (1-10) AND overall adherence to `ComicShortsNarrativeProfile` style (1-10) in the scores field.
 """
-                    }
-                ],
+                }
+            ]
+        messages = self.llm.prompt_budget.fit("accuracy_review", [
+            PromptSection("page_details", detailed_story_from_pages, priority=0, min_tokens=400),
+            PromptSection("story_summary", story_summary, priority=1, min_tokens=400)
+        ], build_messages)
+
+        try:
+            review_data = self.llm.create_json(
+                "accuracy_review",
+                "accuracy_review",
+                ACCURACY_REVIEW_SCHEMA,
+                model="gpt-4.1",
+                messages=messages,
                 max_tokens=2000
             )
 
             return {
-                "accuracy_review": response.choices[0].message.content,
+                "accuracy_review": render_markdown(review_data),
+                "scores": review_data["scores"],
+                "structured_output": review_data,
                 "source_pages_analyzed_count": len(page_analyses),
                 "comic_filename_reviewed": comic_filename,
                 "review_timestamp": time.time()
@@ -256,35 +466,13 @@ Rate overall accuracy to source (1-10) AND overall adherence to `ComicShortsNarr
 
     def generate_improvement_recommendations(self, accuracy_review: Dict[str, Any],
                                            competitive_analysis: Dict[str, Any],
-                                           original_script_output: str,
+                                           current_script_content: str,
                                            comic_filename: str = "the comic") -> Dict[str, Any]:
         """Generate specific improvement recommendations based on reviews, focusing on ComicShortsNarrativeProfile."""
 
         accuracy_content = accuracy_review.get("accuracy_review", "")
         competitive_content = competitive_analysis.get("competitive_analysis", "")
 
-        current_script_content = original_script_output
-        if "SCRIPT" in original_script_output.upper(): # More robust check
-            try:
-                script_start_keyword = "SCRIPT"
-                script_end_keywords = ["HOOK ANALYSIS", "TITLE SUGGESTIONS"]
-                script_text_upper = original_script_output.upper()
-                script_start_index = script_text_upper.find(script_start_keyword)
-
-                if script_start_index != -1:
-                    actual_script_start = script_start_index + len(script_start_keyword)
-                    script_end_index = len(original_script_output)
-                    for end_keyword in script_end_keywords:
-                        found_end_index = script_text_upper.find(end_keyword, actual_script_start)
-                        if found_end_index != -1:
-                            script_end_index = min(script_end_index, found_end_index)
-                    current_script_content = original_script_output[actual_script_start:script_end_index].strip()
-                else:
-                    print("Warning: 'SCRIPT' keyword not found in original script output for recommendations, using raw output.")
-            except Exception as e:
-                print(f"Could not parse script from original output for recommendations. Error: {e}")
-                pass
-
         system_prompt_content = f"""You are an expert script optimization consultant for comic book content, specifically for '{comic_filename}'. Your goal is to synthesize accuracy reviews and competitive intelligence to provide actionable recommendations for improving scripts to **strictly align with the `ComicShortsNarrativeProfile` style (factual, third-person narrative summary).**
 
 **`ComicShortsNarrativeProfile` KEY CHARACTERISTICS (The Target Style):**
@@ -296,64 +484,77 @@ Rate overall accuracy to source (1-10) AND overall adherence to `ComicShortsNarr
 
 Focus on practical, specific recommendations that can be directly applied to elevate the script to meet the standards of the `ComicShortsNarrativeProfile`, using insights from competitor analysis only where they support this specific style.
 """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Based on the accuracy review (which includes adherence to the `ComicShortsNarrativeProfile`) and competitive analysis (benchmarked against this profile), provide optimization recommendations for the script for '{comic_filename}'. The primary goal is to ensure the script is an excellent example of the `ComicShortsNarrativeProfile` style.
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "role": "system",
+                    "content": system_prompt_content
+                },
+                {
+                    "role": "user",
+                    "content": f"""Based on the accuracy review (which includes adherence to the `ComicShortsNarrativeProfile`) and competitive analysis (benchmarked against this profile), provide optimization recommendations for the script for '{comic_filename}'. The primary goal is to ensure the script is an excellent example of the `ComicShortsNarrativeProfile` style.
 
 **ACCURACY & PROFILE ADHERENCE REVIEW FINDINGS (for '{comic_filename}'):**
-{accuracy_content}
+{sections['accuracy_review']}
 
 **COMPETITIVE ANALYSIS INSIGHTS (Relevant to `ComicShortsNarrativeProfile` style):**
-{competitive_content}
+{sections['competitive_analysis']}
 
 **CURRENT SCRIPT (to be improved for '{comic_filename}'):**
 {current_script_content}
 
 Generate a comprehensive improvement plan with:
 
-**PRIORITY 1 - CRITICAL FIXES FOR ACCURACY & PROFILE ALIGNMENT:**
+**PRIORITY 1 - CRITICAL FIXES FOR ACCURACY & PROFILE ALIGNMENT (field critical_fixes):**
 - Accuracy issues (deviations from source material of '{comic_filename}') that must be addressed.
 - Deviations from `ComicShortsNarrativeProfile` style (e.g., wrong tense, subjective language, cinematic elements, artificial hooks) that must be corrected.
 - Missing essential story elements for a complete summary of the comic segment from '{comic_filename}'.
 - Clarity problems that confuse viewers of the summary.
 
-**PRIORITY 2 - ENHANCING THE FACTUAL NARRATIVE SUMMARY (within `ComicShortsNarrativeProfile`):**
+**PRIORITY 2 - ENHANCING THE FACTUAL NARRATIVE SUMMARY (within `ComicShortsNarrativeProfile`) (field narrative_enhancements):**
 - Strengthening the opening of the summary (e.g., clearer setup of the summarized situation/question).
 - Improving pacing for a concise and effective factual recount.
 - Enhancing clarity of the summarized plot progression.
 - Ensuring the ending provides a factual conclusion to the summarized arc.
 - Word choice and narration style refinements to better fit the direct, objective, present-tense narrative style.
 
-**PRIORITY 3 - CONSIDERING COMPATIBLE COMPETITIVE INSIGHTS:**
+**PRIORITY 3 - CONSIDERING COMPATIBLE COMPETITIVE INSIGHTS (field competitive_insights):**
 - Ways to make the factual summary more engaging *without* deviating from the `ComicShortsNarrativeProfile` (e.g., more vivid verbs, better transitions if supported by profile-compatible competitor examples).
 
-**SPECIFIC EDITS (Illustrative examples for `ComicShortsNarrativeProfile` alignment):**
+**SPECIFIC EDITS (Illustrative examples for `ComicShortsNarrativeProfile` alignment) (field specific_edits, each with the original line, the revised line and the reason):**
 - Line-by-line suggestions for key improvements (e.g., changing "He felt sad" to "He looks down," if the former is too interpretive for the profile).
 - Alternative phrasing for better factual recounting.
 - Stronger transition phrases suitable for narrative summaries.
 - Edits to ensure the ending is a factual resolution of the segment, not a hook.
 
-**IMPLEMENTATION NOTES:**
+**IMPLEMENTATION NOTES (field implementation_notes):**
 - How changes ensure both source accuracy for '{comic_filename}' and strict adherence to the `ComicShortsNarrativeProfile`.
 - Rationale for why suggestions improve the script as a factual narrative summary.
 
 Provide specific, actionable recommendations with clear rationale, always prioritizing alignment with the `ComicShortsNarrativeProfile`.
 """
-                    }
-                ],
+                }
+            ]
+        # The competitive analysis is general to the channel, so it gives way before this comic's review does
+        messages = self.llm.prompt_budget.fit("improvement_recommendations", [
+            PromptSection("competitive_analysis", competitive_content, priority=0, min_tokens=400),
+            PromptSection("accuracy_review", accuracy_content, priority=1, min_tokens=300,
+                          condensed=render_fields(accuracy_review.get("structured_output"), ACCURACY_REVIEW_ACTION_FIELDS))
+        ], build_messages)
+
+        try:
+            recommendations_data = self.llm.create_json(
+                "improvement_recommendations",
+                "improvement_recommendations",
+                RECOMMENDATIONS_SCHEMA,
+                model="gpt-4.1",
+                messages=messages,
                 max_tokens=2500
             )
 
             return {
-                "improvement_recommendations": response.choices[0].message.content,
+                "improvement_recommendations": render_markdown(recommendations_data),
+                "structured_output": recommendations_data,
                 "recommendation_timestamp": time.time(),
                 "priority_breakdown": "Critical Fixes (Accuracy & Profile Alignment) → Enhancing Factual Summary → Compatible Competitive Insights"
             }
@@ -364,56 +565,74 @@ Provide specific, actionable recommendations with clear rationale, always priori
     def perform_complete_review(self, agent_1_output_path: str) -> Dict[str, Any]:
         """Perform complete script review and analysis."""
         try:
-            with open(agent_1_output_path, 'r', encoding='utf-8') as f:
+            with span("load_agent_1_output", "io", path=agent_1_output_path), open(agent_1_output_path, 'r', encoding='utf-8') as f:
                 agent_1_output = json.load(f)
+        except FileNotFoundError:
+            return {"error": f"Agent 1 output file not found: {agent_1_output_path}"}
+        except json.JSONDecodeError:
+            return {"error": f"Error decoding JSON from Agent 1 output file: {agent_1_output_path}"}
 
+        return self.review_agent_1_output(agent_1_output, agent_1_output_path)
+
+    def recommend_improvements(self, agent_1_output: Dict[str, Any], accuracy_review: Dict[str, Any],
+                               competitive_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Recommendation step, taking the two independent reviews as inputs."""
+        comic_filename_from_agent1 = agent_1_output.get("story_analysis", {}).get("comic_filename", "UnknownComic")
+        current_script = script_from_result(agent_1_output.get("script_generation_result", {}), "original script output for recommendations")
+        return self.generate_improvement_recommendations(
+            accuracy_review, competitive_analysis, current_script, comic_filename_from_agent1
+        )
+
+    def build_review(self, agent_1_output: Dict[str, Any], agent_1_output_path: Optional[str],
+                     competitive_analysis: Dict[str, Any], accuracy_review: Dict[str, Any],
+                     recommendations: Dict[str, Any]) -> Dict[str, Any]:
+        """Agent 2's output document."""
+        return {
+            "comic_filename_reviewed": agent_1_output.get("story_analysis", {}).get("comic_filename", "UnknownComic"),
+            "original_agent_1_output_path": agent_1_output_path,
+            "competitive_analysis_results": competitive_analysis,
+            "used_cached_competitive_analysis": competitive_analysis.get("used_cached_analysis", False),
+            "accuracy_and_profile_review": accuracy_review,
+            "improvement_recommendations_for_profile": recommendations,
+            "review_timestamp": time.time(),
+            "reviewer": "Agent 2: Script Editor & Competitive Analyst (Profile-Focused)"
+        }
+
+    def review_agent_1_output(self, agent_1_output: Dict[str, Any], agent_1_output_path: Optional[str] = None) -> Dict[str, Any]:
+        """Perform complete script review and analysis on an in-memory Agent 1 result."""
+        try:
             comic_filename_from_agent1 = agent_1_output.get("story_analysis", {}).get("comic_filename", "UnknownComic")
             print(f"Starting Agent 2 review for comic: {comic_filename_from_agent1}")
 
-            print("Performing competitive analysis (benchmarked against ComicShortsNarrativeProfile)...")
-            competitive_analysis = self.analyze_competitor_patterns()
+            # Competitive analysis and the accuracy review are independent; only the recommendations need both
+            print("Performing competitive analysis and reviewing script accuracy (ComicShortsNarrativeProfile)...")
+            independent_steps_start = time.time()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                competitive_analysis_future = executor.submit(in_current_context(self.analyze_competitor_patterns))
+                accuracy_review_future = executor.submit(in_current_context(self.review_script_accuracy), agent_1_output)
+                competitive_analysis = future_result(competitive_analysis_future, "Competitive analysis")
+                accuracy_review = future_result(accuracy_review_future, "Script accuracy review")
+            print(f"Competitive analysis and accuracy review finished in {time.time() - independent_steps_start:.2f}s")
 
             if "error" in competitive_analysis:
                 print(f"Warning: Competitive analysis error - {competitive_analysis['error']}")
             if "info" in competitive_analysis: # Handle no data case
                 print(f"Info: {competitive_analysis['info']}")
 
-
-            print("Reviewing script accuracy and adherence to ComicShortsNarrativeProfile...")
-            accuracy_review = self.review_script_accuracy(agent_1_output)
-
             if "error" in accuracy_review:
                 return accuracy_review
 
             print("Generating improvement recommendations for ComicShortsNarrativeProfile alignment...")
-            original_script_output_str = agent_1_output.get("script_generation_result", {}).get("script", "")
-
-            recommendations = self.generate_improvement_recommendations(
-                accuracy_review, competitive_analysis, original_script_output_str, comic_filename_from_agent1
-            )
+            recommendations = self.recommend_improvements(agent_1_output, accuracy_review, competitive_analysis)
 
             if "error" in recommendations:
                 return recommendations
 
-            complete_review = {
-                "comic_filename_reviewed": comic_filename_from_agent1,
-                "original_agent_1_output_path": agent_1_output_path,
-                "competitive_analysis_results": competitive_analysis,
-                "accuracy_and_profile_review": accuracy_review,
-                "improvement_recommendations_for_profile": recommendations,
-                "review_timestamp": time.time(),
-                "reviewer": "Agent 2: Script Editor & Competitive Analyst (Profile-Focused)"
-            }
+            return self.build_review(agent_1_output, agent_1_output_path, competitive_analysis, accuracy_review, recommendations)
 
-            return complete_review
-
-        except FileNotFoundError:
-            return {"error": f"Agent 1 output file not found: {agent_1_output_path}"}
-        except json.JSONDecodeError:
-            return {"error": f"Error decoding JSON from Agent 1 output file: {agent_1_output_path}"}
         except Exception as e:
             import traceback
-            print(f"Unexpected error in perform_complete_review: {e}")
+            print(f"Unexpected error in review_agent_1_output: {e}")
             traceback.print_exc()
             return {"error": f"Complete review failed due to an unexpected error: {e}"}
 
@@ -489,8 +708,7 @@ def main():
         print(f"\n✅ Complete review (JSON) saved to: {output_json_path_arg}")
 
         # Optional: Save a Markdown summary if needed for quick human review
-        output_file_basename = os.path.splitext(os.path.basename(agent_1_output_path_arg))[0]
-        md_summary_path = os.path.join(os.path.dirname(output_json_path_arg), f"agent_2_summary_{output_file_basename}_{int(time.time())}.md")
+        md_summary_path = os.path.splitext(output_json_path_arg)[0] + ".md"
         try:
             with open(md_summary_path, 'w', encoding='utf-8') as f_md:
                 f_md.write(f"# Agent 2: Review Summary for {result.get('comic_filename_reviewed', 'UnknownComic')}\n\n")
@@ -505,6 +723,10 @@ def main():
         except Exception as md_e:
             print(f"Warning: Could not save Markdown summary: {md_e}")
 
+        if editor.llm.stats["replay_misses"]:
+            print(f"❌ Replay mode: {editor.llm.stats['replay_misses']} completion(s) were not in the cache")
+            sys.exit(1)
+
 
     except Exception as e:
         print(f"❌ Unexpected error in main execution: {e}")
@@ -6,11 +6,19 @@ Handles output paths for JSON and MD results.
 """
 
 import os
+import re
 import sys
 import json
 import time
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
 from openai import OpenAI
+from llm_client import LLMClient
+from prompt_budget import PromptSection, compact_json, count_tokens
+from script_sections import JsonFieldParser, script_from_result
+from stage_scheduler import future_result
+from structured_output import render_fields, render_markdown, strict_object
+from tracing import span, in_current_context
 
 COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA = """
 {
@@ -53,9 +61,60 @@ COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA = """
 }
 """
 
+SCORE_SCHEMA = {"type": "integer", "minimum": 1, "maximum": 10}
+# Validation passes when either headline score reaches this
+PROFILE_SCORE_THRESHOLD = 8
+TIMESTAMP_MARKER = re.compile(r"\[\d{1,2}:\d{2}\]")
+
+FINAL_PACKAGE_SCHEMA = strict_object({
+    "final_script": {"type": "string", "description": "Complete, production-ready narration with [MM:SS] timestamp markers about every 15 seconds"},
+    "integration_decisions": {"type": "string", "description": "Key decisions resolving the feedback, and how the script now exemplifies the profile"},
+    "optimization_summary": {"type": "array", "items": {"type": "string"}, "description": "Key improvements aligning the script with the profile"},
+    "production_notes": {"type": "string", "description": "Brief guidance for creating the video"}
+})
+
+VALIDATION_SCHEMA = strict_object({
+    "profile_adherence": {"type": "string", "description": "Narrative style, tense and voice, structure, language and prohibited elements"},
+    "technical_validation": strict_object({
+        "estimated_duration_seconds": {"type": "integer", "minimum": 0},
+        "script_word_count": {"type": "integer", "minimum": 0},
+        "assessment": {"type": "string"}
+    }),
+    "content_validation": {"type": "string", "description": "Accuracy of the summarized events and clarity of the summary"},
+    "scores": strict_object({
+        "profile_adherence": SCORE_SCHEMA,
+        "clarity": SCORE_SCHEMA,
+        "accuracy_to_source": SCORE_SCHEMA,
+        "overall": SCORE_SCHEMA
+    }),
+    "remaining_changes": {"type": "array", "items": {"type": "string"}},
+    "ready_for_production": {"type": "boolean"}
+})
+
+TITLE_OPTIONS_SCHEMA = strict_object({
+    "titles": {"type": "array", "minItems": 5, "maxItems": 7, "description": "Ranked by effectiveness, best first",
+               "items": strict_object({
+                   "title": {"type": "string"},
+                   "approach": {"type": "string", "enum": ["question", "factual_statement", "character_event"]},
+                   "rationale": {"type": "string"},
+                   "audience_appeal": {"type": "string"}
+               })}
+})
+
+# What synthesis needs from Agent 2's review and recommendations when they have to be condensed to fit its budget
+ACCURACY_REVIEW_ACTION_FIELDS = ("scores", "improvement_recommendations")
+RECOMMENDATION_ACTION_FIELDS = ("critical_fixes", "specific_edits", "narrative_enhancements")
+
+def check_final_package(package: Dict[str, Any]) -> List[str]:
+    """Rules the package schema cannot express."""
+    if not TIMESTAMP_MARKER.search(package["final_script"]):
+        return ["$.final_script: has no [MM:SS] timestamp markers"]
+    return []
+
 class FinalIntegrator:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, client: Optional[OpenAI] = None, llm: Optional[LLMClient] = None):
+        self.client = client or OpenAI(api_key=api_key)
+        self.llm = llm or LLMClient(self.client)
         try:
             self.profile_schema = json.loads(COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA)
         except json.JSONDecodeError:
@@ -80,71 +139,66 @@ class FinalIntegrator:
         summary_points.append(f"- Avoid: {', '.join(avoid.keys())}")
         return "\n".join(summary_points)
 
+    def _profile_schema_section(self, priority: int) -> PromptSection:
+        """The full profile schema as a prompt section; over budget it is sent as compact JSON, never cut."""
+        condensed = compact_json(self.profile_schema) if self.profile_schema else None
+        return PromptSection("profile_schema", COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA, priority=priority,
+                             min_tokens=count_tokens(condensed or COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA), condensed=condensed)
+
     def synthesize_final_script(self,
                                 agent_1_data: Dict[str, Any],
                                 competitive_analysis_text: str,
                                 accuracy_review_text: str,
                                 recommendations_text: str,
                                 comic_filename: str = "the comic",
-                                target_duration: int = 75) -> Dict[str, Any]:
-        """Synthesize final script, strictly adhering to ComicShortsNarrativeProfile."""
+                                target_duration: int = 75,
+                                on_script: Optional[Callable[[str], Any]] = None,
+                                condensed_feedback: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Synthesize final script, strictly adhering to ComicShortsNarrativeProfile.
 
-        original_script_output_str = agent_1_data.get("script_generation_result", {}).get("script", "")
-        original_script_content = original_script_output_str # Default
-        if "SCRIPT" in original_script_output_str.upper(): # More robust check
-            try:
-                script_start_keyword = "SCRIPT"
-                script_end_keywords = ["HOOK ANALYSIS", "TITLE SUGGESTIONS"]
-                script_text_upper = original_script_output_str.upper()
-                script_start_index = script_text_upper.find(script_start_keyword)
-
-                if script_start_index != -1:
-                    actual_script_start = script_start_index + len(script_start_keyword)
-                    script_end_index = len(original_script_output_str)
-                    for end_keyword in script_end_keywords:
-                        found_end_index = script_text_upper.find(end_keyword, actual_script_start)
-                        if found_end_index != -1:
-                            script_end_index = min(script_end_index, found_end_index)
-                    original_script_content = original_script_output_str[actual_script_start:script_end_index].strip()
-                else:
-                    print("Warning: 'SCRIPT' keyword not found in Agent 1 script output for synthesis, using raw output.")
-            except Exception as e:
-                print(f"Could not parse script from Agent 1 output for synthesis. Error: {e}")
-                pass
+        The JSON package is streamed; on_script is called with the final_script field as soon as
+        it is complete, while the rationale and production notes are still being generated.
+        condensed_feedback holds shorter "accuracy_review" and "recommendations" texts that the
+        prompt budget swaps in before cutting the full ones.
+        """
+
+        original_script_content = script_from_result(agent_1_data.get("script_generation_result", {}), "Agent 1 script output for synthesis")
 
         story_analysis_summary = agent_1_data.get("story_analysis", {}).get("story_summary", {}).get("summary", "No story analysis available from Agent 1 data.")
 
-        integration_context = f"""
+        profile_summary_for_prompt = self._get_profile_guideline_summary()
+        reference_script_examples = """
+Example 1 - "How Did Dr Doom Take Over The World?": ...
+Example 2 - "How Spider-Man Almost Ended Peter Parker?": ...
+Example 3 - "Deadpool Takes Spider-Man To Hell": ...
+        """.strip() # Keep this concise for the log, actual prompt has full examples
+
+
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            integration_context = f"""
 **ORIGINAL SCRIPT DRAFT (from Agent 1 for '{comic_filename}', potentially pre-edit):**
 {original_script_content}
 
 **STORY ANALYSIS (Source Material Summary for '{comic_filename}'):**
-{story_analysis_summary}
+{sections['story_summary']}
 
 **COMPETITIVE INSIGHTS (Benchmarked against `ComicShortsNarrativeProfile`):**
-{competitive_analysis_text}
+{sections['competitive_analysis']}
 
 **ACCURACY & PROFILE ADHERENCE REVIEW (from Agent 2 for '{comic_filename}'):**
-{accuracy_review_text}
+{sections['accuracy_review']}
 
 **IMPROVEMENT RECOMMENDATIONS (from Agent 2 for `ComicShortsNarrativeProfile` alignment for '{comic_filename}'):**
-{recommendations_text}
+{sections['recommendations']}
 """
-        profile_summary_for_prompt = self._get_profile_guideline_summary()
-        reference_script_examples = """
-Example 1 - "How Did Dr Doom Take Over The World?": ...
-Example 2 - "How Spider-Man Almost Ended Peter Parker?": ...
-Example 3 - "Deadpool Takes Spider-Man To Hell": ...
-        """.strip() # Keep this concise for the log, actual prompt has full examples
-
-        system_prompt_content = f"""You are the Final Integration Specialist. Your mission is to synthesize all feedback into a perfectly optimized {target_duration}-second script for the comic '{comic_filename}' that **strictly embodies the `ComicShortsNarrativeProfile`**. This profile emphasizes factual, third-person narrative summaries of comic book plotlines.
+            system_prompt_content = f"""You are the Final Integration Specialist. Your mission is to synthesize all feedback into a perfectly optimized {target_duration}-second script for the comic '{comic_filename}' that **strictly embodies the `ComicShortsNarrativeProfile`**. This profile emphasizes factual, third-person narrative summaries of comic book plotlines.
 
 **YOUR PRIMARY GOAL: Adherence to `ComicShortsNarrativeProfile`**
 The final script MUST be a prime example of this profile. "Engagement" and "viral potential" are achieved by masterfully executing this specific narrative summary style.
 
 **`ComicShortsNarrativeProfile` - KEY CHARACTERISTICS TO EMBODY:**
 {profile_summary_for_prompt}
-(Full schema: {COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA})
+(Full schema: {sections['profile_schema']})
 
 **REFERENCE SCRIPT EXAMPLES (These perfectly exemplify the `ComicShortsNarrativeProfile`):**
 {reference_script_examples}
@@ -166,46 +220,77 @@ The final script MUST be a prime example of this profile. "Engagement" and "vira
 - Include [TIMESTAMP] markers for pacing the narrative summary (e.g., [00:00], [00:15]).
 - End with a factual conclusion of the summarized comic segment, as per the profile (no artificial hooks for the short itself).
 """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Create the final optimized YouTube script for '{comic_filename}'. Integrate all feedback and analysis, ensuring the output **strictly adheres to the `ComicShortsNarrativeProfile` style (factual, third-person narrative summary)** as detailed in the system prompt and exemplified by the reference scripts.
+            return [
+                {
+                    "role": "system",
+                    "content": system_prompt_content
+                },
+                {
+                    "role": "user",
+                    "content": f"""Create the final optimized YouTube script for '{comic_filename}'. Integrate all feedback and analysis, ensuring the output **strictly adheres to the `ComicShortsNarrativeProfile` style (factual, third-person narrative summary)** as detailed in the system prompt and exemplified by the reference scripts.
 
 {integration_context}
 
 **TARGET DURATION FOR SCRIPT NARRATION:** {target_duration} seconds
 
-Deliver:
+Deliver a JSON object with:
 
-1.  **FINAL OPTIMIZED SCRIPT (Adhering to `ComicShortsNarrativeProfile` for '{comic_filename}')**
+1.  **final_script - FINAL OPTIMIZED SCRIPT (Adhering to `ComicShortsNarrativeProfile` for '{comic_filename}')**
     *   Complete, production-ready narration with [TIMESTAMP] markers every ~15 seconds.
     *   The script must be a factual, third-person narrative summary, primarily in present tense, avoiding cinematic language or artificial hooks for the short itself.
-2.  **INTEGRATION DECISIONS & PROFILE ALIGNMENT RATIONALE**
+2.  **integration_decisions - INTEGRATION DECISIONS & PROFILE ALIGNMENT RATIONALE**
     *   Explain key decisions made to resolve feedback and ensure strict adherence to the `ComicShortsNarrativeProfile` for '{comic_filename}'.
     *   Highlight how the script now exemplifies the profile's characteristics.
-3.  **OPTIMIZATION SUMMARY FOR `ComicShortsNarrativeProfile`**
+3.  **optimization_summary - OPTIMIZATION SUMMARY FOR `ComicShortsNarrativeProfile`**
     *   List key improvements made to align the script with the profile (e.g., tense corrections, removal of subjective language, ensuring factual conclusion).
-4.  **PRODUCTION NOTES (for a `ComicShortsNarrativeProfile` video of '{comic_filename}')**
+4.  **production_notes - PRODUCTION NOTES (for a `ComicShortsNarrativeProfile` video of '{comic_filename}')**
     *   Brief guidance for video creation that complements a factual narrative summary (e.g., focus on clear comic panel visuals from '{comic_filename}').
 
 Ensure the final script is a prime example of the `ComicShortsNarrativeProfile`.
 """
-                    }
-                ],
+                }
+            ]
+        # The recommendations already fold in the review and the competitive analysis, so those give way first
+        condensed_feedback = condensed_feedback or {}
+        messages = self.llm.prompt_budget.fit("final_synthesis", [
+            PromptSection("competitive_analysis", competitive_analysis_text, priority=0, min_tokens=200),
+            PromptSection("accuracy_review", accuracy_review_text, priority=1, min_tokens=200,
+                          condensed=condensed_feedback.get("accuracy_review")),
+            PromptSection("story_summary", story_analysis_summary, priority=2, min_tokens=400),
+            PromptSection("recommendations", recommendations_text, priority=3, min_tokens=400,
+                          condensed=condensed_feedback.get("recommendations")),
+            self._profile_schema_section(priority=4)
+        ], build_messages)
+
+        early = {}
+        def script_complete(script: str):
+            # Only a script that would pass validation is worth starting dependent work from
+            if script.strip() and not check_final_package({"final_script": script}):
+                early["final_script"] = script
+                if on_script:
+                    on_script(script)
+        parser = JsonFieldParser("final_script", on_value=script_complete)
+        try:
+            package = self.llm.create_json(
+                "final_synthesis",
+                "final_script_package",
+                FINAL_PACKAGE_SCHEMA,
+                check=check_final_package,
+                on_text=parser.feed,
+                model="gpt-4.1",
+                messages=messages,
                 max_tokens=3000
             )
 
-            final_content = response.choices[0].message.content
+            if "final_script" in early:
+                # A repaired reply keeps the script that validation and titles have already started from
+                package["final_script"] = early["final_script"]
+            final_content = render_markdown(package)
 
             return {
                 "final_script_package_content": final_content,
+                "final_script": package["final_script"],
+                "structured_output": package,
                 "target_duration": target_duration,
                 "integration_timestamp": time.time(),
                 "word_count_of_package": len(final_content.split()),
@@ -218,19 +303,23 @@ Ensure the final script is a prime example of the `ComicShortsNarrativeProfile`.
     def validate_final_output(self, final_script_package_data: Dict[str, Any],
                              original_story_analysis_summary: str,
                              comic_filename: str = "the comic") -> Dict[str, Any]:
-        """Validate final script meets ComicShortsNarrativeProfile criteria."""
+        """Validate final script meets ComicShortsNarrativeProfile criteria.
+
+        Only the script section is validated, so this can run before the rest of the package is generated.
+        """
 
-        final_script_package_content = final_script_package_data.get("final_script_package_content", "")
+        final_script_content = final_script_package_data.get("final_script") or final_script_package_data.get("final_script_package_content", "")
         target_duration = final_script_package_data.get("target_duration", 75)
         profile_summary_for_prompt = self._get_profile_guideline_summary()
         reference_script_examples_short = "[Same examples as in synthesize_final_script - omitted for brevity]"
 
 
-        system_prompt_content = f"""You are a Quality Assurance Specialist for YouTube content. Your role is to validate that final scripts for '{comic_filename}' **strictly adhere to the `ComicShortsNarrativeProfile`** and meet all quality criteria for a factual narrative summary. The provided successful script examples are the gold standard for this profile.
+        def build_messages(sections: Dict[str, str]) -> List[Dict[str, Any]]:
+            system_prompt_content = f"""You are a Quality Assurance Specialist for YouTube content. Your role is to validate that final scripts for '{comic_filename}' **strictly adhere to the `ComicShortsNarrativeProfile`** and meet all quality criteria for a factual narrative summary. The provided successful script examples are the gold standard for this profile.
 
 **`ComicShortsNarrativeProfile` - KEY CHARACTERISTICS FOR VALIDATION:**
 {profile_summary_for_prompt}
-(Full schema: {COMIC_SHORTS_NARRATIVE_PROFILE_SCHEMA})
+(Full schema: {sections['profile_schema']})
 
 **VALIDATION CRITERIA (Judged against the `ComicShortsNarrativeProfile` and its exemplars):**
 1.  **Profile Adherence (CRUCIAL)**: Does the script strictly follow all guidelines of the `ComicShortsNarrativeProfile` (tense, voice, factual recounting, no cinematic hooks, objective tone, narrative summary structure, etc.)?
@@ -252,72 +341,80 @@ Ensure the final script is a prime example of the `ComicShortsNarrativeProfile`.
 
 Provide detailed analysis with specific scores and actionable feedback if it deviates from the `ComicShortsNarrativeProfile`.
 """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt_content
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Validate this final YouTube script package for '{comic_filename}'. The primary focus is its strict adherence to the `ComicShortsNarrativeProfile` (factual, third-person narrative summary) as detailed in the system prompt and exemplified by the reference scripts.
-
-**FINAL SCRIPT PACKAGE (includes script, rationale, etc. for '{comic_filename}'):**
-{final_script_package_content}
+            return [
+                {
+                    "role": "system",
+                    "content": system_prompt_content
+                },
+                {
+                    "role": "user",
+                    "content": f"""Validate this final YouTube script package for '{comic_filename}'. The primary focus is its strict adherence to the `ComicShortsNarrativeProfile` (factual, third-person narrative summary) as detailed in the system prompt and exemplified by the reference scripts.
+
+**FINAL SCRIPT (for '{comic_filename}'):**
+{final_script_content}
 
 **TARGET DURATION FOR SCRIPT NARRATION:** {target_duration} seconds
 
 **ORIGINAL STORY SUMMARY (for context of source material '{comic_filename}'):**
-{original_story_analysis_summary}
+{sections['story_summary']}
 
 Provide comprehensive validation covering:
 
-**PROFILE ADHERENCE VALIDATION (Primary Focus):**
+**PROFILE ADHERENCE VALIDATION (Primary Focus) - field profile_adherence:**
 -   **Narrative Style:** Is it a third-person, objective, factual recount?
 -   **Tense & Voice:** Primarily present tense, active voice?
 -   **Structure:** Does it follow the summary structure (e.g., setup of summarized arc, chronological flow, factual conclusion of the arc)?
 -   **Language:** Direct, concise, appropriate for a factual summary? Minimized and integrated quotes?
 -   **Avoidance of Prohibited Elements:** Free of cinematic directions, subjective interpretations, artificial hooks for the short itself?
 
-**TECHNICAL VALIDATION (for the script part within the package):**
--   Estimated duration compliance for script narration.
--   Word count assessment for script narration.
+**TECHNICAL VALIDATION - field technical_validation:**
+-   Estimated duration of the script narration in seconds, and compliance with the target.
+-   Word count of the script narration, and its assessment.
 
-**CONTENT VALIDATION (for the script part):**
+**CONTENT VALIDATION - field content_validation:**
 -   Accuracy of the summarized events vs. original comic context for '{comic_filename}'.
 -   Clarity and coherence of the factual summary.
 
-**QUALITY SCORES (1-10, based on `ComicShortsNarrativeProfile` adherence):**
--   Profile Adherence Score: X/10
--   Clarity of Factual Summary Score: X/10
--   Accuracy to Source (for summarized segment of '{comic_filename}') Score: X/10
--   Overall Quality as a `ComicShortsNarrativeProfile` Script Score: X/10
+**QUALITY SCORES (1-10, based on `ComicShortsNarrativeProfile` adherence) - field scores:**
+-   profile_adherence: Profile Adherence Score
+-   clarity: Clarity of Factual Summary Score
+-   accuracy_to_source: Accuracy to Source (for summarized segment of '{comic_filename}') Score
+-   overall: Overall Quality as a `ComicShortsNarrativeProfile` Script Score
 
 **FINAL RECOMMENDATIONS:**
--   Any remaining critical changes needed for strict `ComicShortsNarrativeProfile` alignment.
--   Confirmation of readiness if all criteria for the profile are met.
+-   remaining_changes: Any remaining critical changes needed for strict `ComicShortsNarrativeProfile` alignment.
+-   ready_for_production: true if all criteria for the profile are met.
 
-Provide specific scores and detailed reasoning, focusing on how well the script (within the package) embodies the `ComicShortsNarrativeProfile`.
+Provide specific scores and detailed reasoning, focusing on how well the script embodies the `ComicShortsNarrativeProfile`.
 """
-                    }
-                ],
+                }
+            ]
+        messages = self.llm.prompt_budget.fit("final_validation", [
+            PromptSection("story_summary", original_story_analysis_summary, priority=0, min_tokens=400),
+            self._profile_schema_section(priority=1)
+        ], build_messages)
+
+        try:
+            validation_data = self.llm.create_json(
+                "final_validation",
+                "final_validation",
+                VALIDATION_SCHEMA,
+                model="gpt-4.1",
+                messages=messages,
                 max_tokens=2000
             )
 
-            validation_content = response.choices[0].message.content
-            # Basic check if validation seems positive. Robust parsing would be better.
-            meets_profile_criteria = "profile adherence score: [8-9]/10" in validation_content.lower() or \
-                                     "profile adherence score: 10/10" in validation_content.lower() or \
-                                     "overall quality as a comicshortsnarrativeprofile script score: [8-9]/10" in validation_content.lower() or \
-                                     "overall quality as a comicshortsnarrativeprofile script score: 10/10" in validation_content.lower()
-
+            validation_content = render_markdown(validation_data)
+            scores = validation_data["scores"]
+            meets_profile_criteria = scores["profile_adherence"] >= PROFILE_SCORE_THRESHOLD or \
+                                     scores["overall"] >= PROFILE_SCORE_THRESHOLD
 
             return {
                 "validation_results_content": validation_content,
+                "scores": scores,
+                "structured_output": validation_data,
                 "validation_timestamp": time.time(),
-                "validated_script_package_content": final_script_package_content, # For reference
+                "validated_script_content": final_script_content, # For reference
                 "meets_profile_criteria": meets_profile_criteria
             }
 
@@ -327,7 +424,7 @@ Provide specific scores and detailed reasoning, focusing on how well the script
     def generate_title_options(self, final_script_package_data: Dict[str, Any], comic_filename: str = "the comic") -> Dict[str, Any]:
         """Generate title options suitable for a ComicShortsNarrativeProfile video."""
 
-        final_script_package_content = final_script_package_data.get("final_script_package_content", "")
+        final_script_content = final_script_package_data.get("final_script") or final_script_package_data.get("final_script_package_content", "")
         reference_script_examples_short = "[Same examples as in synthesize_final_script - titles like 'How Did Dr Doom Take Over The World?' are good examples]"
 
         system_prompt_content = f"""You are a YouTube Title Optimization Expert. Your task is to generate titles for comic book summary videos for '{comic_filename}' that **strictly adhere to the `ComicShortsNarrativeProfile` style.** This means titles should be factual, direct, and accurately reflect the content of a narrative summary.
@@ -346,7 +443,10 @@ Provide specific scores and detailed reasoning, focusing on how well the script
 Generate diverse title options that are appropriate for a factual comic summary video adhering to the `ComicShortsNarrativeProfile`.
 """
         try:
-            response = self.client.chat.completions.create(
+            title_data = self.llm.create_json(
+                "title_options",
+                "title_options",
+                TITLE_OPTIONS_SCHEMA,
                 model="gpt-4.1",
                 messages=[
                     {
@@ -355,27 +455,28 @@ Generate diverse title options that are appropriate for a factual comic summary
                     },
                     {
                         "role": "user",
-                        "content": f"""Generate YouTube titles for a comic summary video of '{comic_filename}'. The video script (embedded within the package below) follows the `ComicShortsNarrativeProfile` (factual, third-person narrative summary). Titles should reflect this style.
+                        "content": f"""Generate YouTube titles for a comic summary video of '{comic_filename}'. The video script below follows the `ComicShortsNarrativeProfile` (factual, third-person narrative summary). Titles should reflect this style.
 
-**SCRIPT PACKAGE CONTENT (The script summary for '{comic_filename}' is embedded within this text):**
-{final_script_package_content}
+**FINAL SCRIPT (The script summary for '{comic_filename}'):**
+{final_script_content}
 
 Create 5-7 title variations that are factual, direct, and suitable for a comic summary video adhering to the `ComicShortsNarrativeProfile`:
 
 **TITLE APPROACHES (for `ComicShortsNarrativeProfile`):**
-1.  **Question-Based Summary Hook (2-3 titles):**
+1.  **Question-Based Summary Hook (2-3 titles, approach question):**
     *   e.g., "How Did [Character from '{comic_filename}'] [Summarized Action]?", "What Was [Character]'s Role in [Event from '{comic_filename}']?"
-2.  **Factual Statement/Intrigue (2-3 titles):**
+2.  **Factual Statement/Intrigue (2-3 titles, approach factual_statement):**
     *   e.g., "[Character]'s [Key Plot Point from '{comic_filename}'] Explained", "The Full Story of [Character]'s [Summarized Arc from '{comic_filename}']"
-3.  **Direct Character/Event Focus (1-2 titles):**
+3.  **Direct Character/Event Focus (1-2 titles, approach character_event):**
     *   e.g., "{comic_filename}: [Comic Event/Character Arc] Summary"
 
-For each title provide:
--   The title text (under 70 characters preferably).
--   Brief rationale on why it fits the `ComicShortsNarrativeProfile` style for a summary video of '{comic_filename}'.
--   Target audience appeal (e.g., fans wanting a recap of X from '{comic_filename}').
+For each entry in titles provide:
+-   title: The title text (under 70 characters preferably).
+-   approach: question, factual_statement or character_event, as above.
+-   rationale: Brief rationale on why it fits the `ComicShortsNarrativeProfile` style for a summary video of '{comic_filename}'.
+-   audience_appeal: Target audience appeal (e.g., fans wanting a recap of X from '{comic_filename}').
 
-Rank titles by their effectiveness in accurately representing a factual comic summary video.
+Rank titles by their effectiveness in accurately representing a factual comic summary video, best first.
 """
                     }
                 ],
@@ -383,7 +484,9 @@ Rank titles by their effectiveness in accurately representing a factual comic su
             )
 
             return {
-                "title_options_content": response.choices[0].message.content,
+                "title_options_content": render_markdown(title_data),
+                "titles": [option["title"] for option in title_data["titles"]],
+                "structured_output": title_data,
                 "generation_timestamp": time.time()
             }
 
@@ -393,89 +496,133 @@ Rank titles by their effectiveness in accurately representing a factual comic su
     def perform_final_integration(self, agent_2_output_path: str, target_duration: int = 75) -> Dict[str, Any]:
         """Perform complete final integration process, focusing on ComicShortsNarrativeProfile."""
         agent_1_data_for_integration = {}
-        original_story_summary_for_validation = "Original story summary not available (Agent 1 data load issue)."
-        comic_filename_from_review = "UnknownComic"
 
         try:
-            with open(agent_2_output_path, 'r', encoding='utf-8') as f:
+            with span("load_agent_2_output", "io", path=agent_2_output_path), open(agent_2_output_path, 'r', encoding='utf-8') as f:
                 agent_2_output = json.load(f)
+        except FileNotFoundError:
+            return {"error": f"Agent 2 output file not found: {agent_2_output_path}"}
+        except json.JSONDecodeError:
+            return {"error": f"Error decoding JSON from Agent 2 output file: {agent_2_output_path}"}
 
-            comic_filename_from_review = agent_2_output.get("comic_filename_reviewed", "UnknownComic")
-            print(f"Starting final integration for: {agent_2_output_path} (Comic: {comic_filename_from_review})")
-            print(f"Target duration for script narration: {target_duration} seconds")
-            print(f"Ensuring adherence to: {self.profile_schema.get('profile_name', 'ComicShortsNarrativeProfile')}")
+        # Load Agent 1 data using the path from Agent 2's output
+        agent_1_output_path_from_agent2 = agent_2_output.get("original_agent_1_output_path")
+        if agent_1_output_path_from_agent2 and os.path.exists(agent_1_output_path_from_agent2):
+            try:
+                with span("load_agent_1_output", "io", path=agent_1_output_path_from_agent2), \
+                        open(agent_1_output_path_from_agent2, 'r', encoding='utf-8') as f_agent1:
+                    agent_1_data_for_integration = json.load(f_agent1)
+                print(f"Successfully loaded Agent 1 data for integration from: {agent_1_output_path_from_agent2}")
+            except Exception as e:
+                print(f"Error loading Agent 1 data from {agent_1_output_path_from_agent2}: {e}")
+                # agent_1_data_for_integration remains {}
+        else:
+            print(f"Warning: Agent 1 output path not found or invalid in Agent 2's output: {agent_1_output_path_from_agent2}")
+
+        return self.integrate_review(agent_2_output, agent_1_data_for_integration, target_duration, agent_2_output_path)
+
+    def synthesize_from_review(self, agent_2_output: Dict[str, Any], agent_1_data_for_integration: Dict[str, Any],
+                               target_duration: int = 75, on_script: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """Synthesis step, pulling the editor feedback out of Agent 2's output."""
+        return self.synthesize_final_script(
+            agent_1_data_for_integration,
+            agent_2_output.get("competitive_analysis_results", {}).get("competitive_analysis", "No competitive analysis available"),
+            agent_2_output.get("accuracy_and_profile_review", {}).get("accuracy_review", "No accuracy review available"),
+            agent_2_output.get("improvement_recommendations_for_profile", {}).get("improvement_recommendations", "No recommendations available"),
+            agent_2_output.get("comic_filename_reviewed", "UnknownComic"),
+            target_duration,
+            on_script,
+            {
+                "accuracy_review": render_fields(agent_2_output.get("accuracy_and_profile_review", {}).get("structured_output"),
+                                                 ACCURACY_REVIEW_ACTION_FIELDS),
+                "recommendations": render_fields(agent_2_output.get("improvement_recommendations_for_profile", {}).get("structured_output"),
+                                                 RECOMMENDATION_ACTION_FIELDS)
+            }
+        )
 
-            # Load Agent 1 data using the path from Agent 2's output
-            agent_1_output_path_from_agent2 = agent_2_output.get("original_agent_1_output_path")
-            if agent_1_output_path_from_agent2 and os.path.exists(agent_1_output_path_from_agent2):
-                try:
-                    with open(agent_1_output_path_from_agent2, 'r', encoding='utf-8') as f_agent1:
-                        agent_1_data_for_integration = json.load(f_agent1)
-                    print(f"Successfully loaded Agent 1 data for integration from: {agent_1_output_path_from_agent2}")
-                    original_story_summary_for_validation = agent_1_data_for_integration.get("story_analysis", {})\
-                                                                                  .get("story_summary", {})\
-                                                                                  .get("summary", "Original story summary not available in loaded Agent 1 data.")
-                except Exception as e:
-                    print(f"Error loading Agent 1 data from {agent_1_output_path_from_agent2}: {e}")
-                    # agent_1_data_for_integration remains {}
-            else:
-                print(f"Warning: Agent 1 output path not found or invalid in Agent 2's output: {agent_1_output_path_from_agent2}")
+    def validate_against_source(self, final_script_package_data: Dict[str, Any], agent_2_output: Dict[str, Any],
+                                agent_1_data_for_integration: Dict[str, Any]) -> Dict[str, Any]:
+        """Validation step, checking the synthesized package against Agent 1's story summary."""
+        original_story_summary_for_validation = "Original story summary not available (Agent 1 data load issue)."
+        if agent_1_data_for_integration:
+            original_story_summary_for_validation = agent_1_data_for_integration.get("story_analysis", {})\
+                                                                              .get("story_summary", {})\
+                                                                              .get("summary", "Original story summary not available in loaded Agent 1 data.")
+        return self.validate_final_output(
+            final_script_package_data,
+            original_story_summary_for_validation,
+            agent_2_output.get("comic_filename_reviewed", "UnknownComic")
+        )
+
+    def build_final_output(self, agent_2_output: Dict[str, Any], final_script_package_data: Dict[str, Any],
+                           validation_results_data: Dict[str, Any], title_options_data: Dict[str, Any],
+                           agent_2_output_path: Optional[str] = None) -> Dict[str, Any]:
+        """Agent 3's output document, substituting fallbacks for failed validation or title steps."""
+        if "error" in validation_results_data:
+            print(f"Warning: Validation failed - {validation_results_data['error']}")
+            validation_results_data = {"validation_results_content": f"Validation unavailable due to error: {validation_results_data['error']}", "meets_profile_criteria": False}
+
+        if "error" in title_options_data:
+            print(f"Warning: Title generation failed - {title_options_data['error']}")
+            title_options_data = {"title_options_content": f"Title generation unavailable due to error: {title_options_data['error']}"}
+
+        return {
+            "comic_filename_integrated": agent_2_output.get("comic_filename_reviewed", "UnknownComic"),
+            "final_script_package": final_script_package_data,
+            "validation_results": validation_results_data,
+            "title_options": title_options_data,
+            "source_agent_2_output_path": agent_2_output_path,
+            "source_agent_1_output_path": agent_2_output.get("original_agent_1_output_path"), # Added for traceability
+            "integration_completed_timestamp": time.time(),
+            "integrator_agent_name": "Agent 3: Final Integration Specialist (Profile-Focused)",
+            "profile_applied": self.profile_schema.get("profile_name", "ComicShortsNarrativeProfile")
+        }
+
+    def integrate_review(self, agent_2_output: Dict[str, Any], agent_1_data_for_integration: Dict[str, Any],
+                         target_duration: int = 75, agent_2_output_path: Optional[str] = None) -> Dict[str, Any]:
+        """Run synthesis, then validation and title generation concurrently, on in-memory Agent 1 and Agent 2 results."""
+        comic_filename_from_review = agent_2_output.get("comic_filename_reviewed", "UnknownComic")
 
+        try:
+            print(f"Starting final integration for: {agent_2_output_path or 'in-memory Agent 2 output'} (Comic: {comic_filename_from_review})")
+            print(f"Target duration for script narration: {target_duration} seconds")
+            print(f"Ensuring adherence to: {self.profile_schema.get('profile_name', 'ComicShortsNarrativeProfile')}")
 
+            # Validation and titles only read the script, so they start (side by side) as soon as its
+            # section has streamed in, while synthesis is still writing the rationale and notes
             print("Synthesizing final script (adhering to ComicShortsNarrativeProfile)...")
-            final_script_package_data = self.synthesize_final_script(
-                agent_1_data_for_integration,
-                agent_2_output.get("competitive_analysis_results", {}).get("competitive_analysis", "No competitive analysis available"),
-                agent_2_output.get("accuracy_and_profile_review", {}).get("accuracy_review", "No accuracy review available"),
-                agent_2_output.get("improvement_recommendations_for_profile", {}).get("improvement_recommendations", "No recommendations available"),
-                comic_filename_from_review,
-                target_duration
+            synthesis_start = time.time()
+            futures = {}
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                def start_checks(script: str):
+                    print(f"Final script ready after {time.time() - synthesis_start:.2f}s; validating and generating title options...")
+                    provisional_package = {"final_script": script, "target_duration": target_duration}
+                    futures["validation"] = executor.submit(
+                        in_current_context(self.validate_against_source), provisional_package, agent_2_output, agent_1_data_for_integration
+                    )
+                    futures["titles"] = executor.submit(in_current_context(self.generate_title_options), provisional_package, comic_filename_from_review)
+
+                final_script_package_data = self.synthesize_from_review(agent_2_output, agent_1_data_for_integration, target_duration, start_checks)
+
+                if "error" in final_script_package_data:
+                    print(f"Error during script synthesis: {final_script_package_data['error']}")
+                    return final_script_package_data
+                if not futures:
+                    start_checks(final_script_package_data["final_script"])
+                validation_results_data = future_result(futures["validation"], "Validation")
+                title_options_data = future_result(futures["titles"], "Title generation")
+            print(f"Synthesis, validation and title generation finished in {time.time() - synthesis_start:.2f}s")
+
+            final_output = self.build_final_output(
+                agent_2_output, final_script_package_data, validation_results_data, title_options_data, agent_2_output_path
             )
 
-            if "error" in final_script_package_data:
-                print(f"Error during script synthesis: {final_script_package_data['error']}")
-                return final_script_package_data
-
-            print("Validating final output against ComicShortsNarrativeProfile...")
-            validation_results_data = self.validate_final_output(
-                final_script_package_data,
-                original_story_summary_for_validation,
-                comic_filename_from_review
-            )
-
-            if "error" in validation_results_data:
-                print(f"Warning: Validation failed - {validation_results_data['error']}")
-                validation_results_data = {"validation_results_content": f"Validation unavailable due to error: {validation_results_data['error']}", "meets_profile_criteria": False}
-
-            print("Generating title options (suitable for ComicShortsNarrativeProfile)...")
-            title_options_data = self.generate_title_options(final_script_package_data, comic_filename_from_review)
-
-            if "error" in title_options_data:
-                print(f"Warning: Title generation failed - {title_options_data['error']}")
-                title_options_data = {"title_options_content": f"Title generation unavailable due to error: {title_options_data['error']}"}
-
-            final_output = {
-                "comic_filename_integrated": comic_filename_from_review,
-                "final_script_package": final_script_package_data,
-                "validation_results": validation_results_data,
-                "title_options": title_options_data,
-                "source_agent_2_output_path": agent_2_output_path,
-                "source_agent_1_output_path": agent_1_output_path_from_agent2, # Added for traceability
-                "integration_completed_timestamp": time.time(),
-                "integrator_agent_name": "Agent 3: Final Integration Specialist (Profile-Focused)",
-                "profile_applied": self.profile_schema.get("profile_name", "ComicShortsNarrativeProfile")
-            }
-
             print("Final integration process completed.")
             return final_output
 
-        except FileNotFoundError:
-            return {"error": f"Agent 2 output file not found: {agent_2_output_path}"}
-        except json.JSONDecodeError:
-            return {"error": f"Error decoding JSON from Agent 2 output file: {agent_2_output_path}"}
         except Exception as e:
             import traceback
-            print(f"Unexpected error in perform_final_integration: {e}")
+            print(f"Unexpected error in integrate_review: {e}")
             traceback.print_exc()
             return {"error": f"Final integration process failed due to an unexpected error: {e}"}
 
@@ -579,6 +726,9 @@ def main():
             f_md.write(str(titles_text) + "\n")
             f_md.write("```\n\n")
         print(f"✅ Readable summary (Markdown) saved to: {output_md_path_arg}")
+        if integrator.llm.stats["replay_misses"]:
+            print(f"❌ Replay mode: {integrator.llm.stats['replay_misses']} completion(s) were not in the cache")
+            sys.exit(1)
         print(f"\n🎬 PRODUCTION READY - Script optimized for factual narrative summary style ({result.get('profile_applied', 'ComicShortsNarrativeProfile')})!")
 
     except Exception as e:
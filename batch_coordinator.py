@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Batch Coordinator
+Runs a whole directory (or glob) of CBR/CBZ files through the three-agent pipeline
+with per-comic retries and a consolidated batch report. In-process batches run every
+comic's stages on a shared stage scheduler; subprocess batches use a pool of comic workers.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+from comic_archive import natural_sort_key
+from pipeline_coordinator import PipelineCoordinator, PIPELINE_MODES, pipeline_error, schedule_competitor_analysis
+from stage_scheduler import StageScheduler
+from llm_client import COMPLETION_CACHE_MODES
+from prompt_budget import DEFAULT_PROMPT_BUDGET_TOKENS
+from page_selection import COVERAGE_MODES, DEFAULT_MAX_VISION_PAGES, PAGE_SELECTION_MODES
+from tracing import Tracer, load_trace, write_chrome_trace
+
+COMIC_EXTENSIONS = ('.cbr', '.cbz', '.zip')
+
+class BatchCoordinator:
+    def __init__(self, openai_api_key: str, competitor_data_path: str, mode: str = "in-process",
+                 api_workers: int = 4, extraction_workers: int = 2, max_retries: int = 2,
+                 retry_delay: float = 10.0, requests_per_minute: int = 60, tokens_per_minute: Optional[int] = None,
+                 completion_cache: str = "off", prompt_budget_tokens: Optional[int] = None,
+                 page_selection: str = "smart", max_vision_pages: int = DEFAULT_MAX_VISION_PAGES,
+                 pages_per_request: int = 1, coverage: str = "sampled", max_prepared_comics: int = 3):
+        self.openai_api_key = openai_api_key
+        self.competitor_data_path = competitor_data_path
+        self.mode = mode
+        self.api_workers = max(1, api_workers)
+        self.extraction_workers = max(1, extraction_workers)
+        self.max_retries = max(0, max_retries)
+        self.retry_delay = retry_delay
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_cache = completion_cache
+        self.prompt_budget_tokens = prompt_budget_tokens
+        self.page_selection = page_selection
+        self.max_vision_pages = max_vision_pages
+        self.pages_per_request = pages_per_request
+        self.coverage = coverage
+        # Comics that may be between their start and the end of their Vision tasks at once (in-process mode)
+        self.max_prepared_comics = max(1, max_prepared_comics)
+        self.batch_id = f"batch_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        self.results_dir = f"results_{self.batch_id}"
+        self.status_path = os.path.join(self.results_dir, "batch_status.json")
+        # Work shared by every comic (agent setup, competitor analysis) is traced here; each comic has its own trace
+        self.trace_path = os.path.join(self.results_dir, "shared_trace.jsonl")
+        self.tracer = Tracer(self.trace_path)
+
+        self.comic_status: Dict[str, Dict[str, Any]] = {}
+        self._status_lock = threading.Lock()
+
+        # Shared across every comic in the batch (in-process mode only)
+        self.client = None
+        self.llm = None
+        self.script_editor = None
+        self.final_integrator = None
+        self.processor_options: Dict[str, Any] = {}
+
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def build_shared_agents(self):
+        """Build one OpenAI client, rate-limited LLM client, ScriptEditor and FinalIntegrator for the whole batch."""
+        if self.mode != "in-process" or self.client is not None:
+            return
+        from openai import OpenAI
+        from llm_client import LLMClient, RateLimiter
+        from prompt_budget import PromptBudget
+        from agent_2_script_editor import ScriptEditor
+        from agent_3_final_integrator import FinalIntegrator
+
+        self.client = OpenAI(api_key=self.openai_api_key)
+        self.llm = LLMClient(self.client, RateLimiter(self.requests_per_minute, self.tokens_per_minute),
+                             cache_mode=self.completion_cache, prompt_budget=PromptBudget(self.prompt_budget_tokens))
+        self.script_editor = ScriptEditor(self.openai_api_key, self.competitor_data_path, client=self.client, llm=self.llm)
+        self.final_integrator = FinalIntegrator(self.openai_api_key, client=self.client, llm=self.llm)
+        self.processor_options = {
+            "extraction_slots": threading.BoundedSemaphore(self.extraction_workers),
+            "page_selection": self.page_selection,
+            "max_vision_pages": self.max_vision_pages,
+            "pages_per_request": self.pages_per_request,
+            "coverage": self.coverage
+        }
+
+    def discover_comics(self, source: str) -> List[str]:
+        """Expand a directory or glob pattern into a naturally sorted list of comic files."""
+        if os.path.isdir(source):
+            candidates = [os.path.join(source, name) for name in os.listdir(source)]
+        else:
+            candidates = glob.glob(source, recursive=True)
+        comics = [path for path in candidates if os.path.isfile(path) and path.lower().endswith(COMIC_EXTENSIONS)]
+        return sorted(comics, key=natural_sort_key)
+
+    def _update_status(self, cbr_path: str, **fields):
+        """Record a comic's latest status and persist the whole batch status file."""
+        with self._status_lock:
+            self.comic_status.setdefault(cbr_path, {"cbr_file": cbr_path}).update(fields)
+            with open(self.status_path, 'w', encoding='utf-8') as f:
+                json.dump(self.comic_status, f, indent=2)
+
+    def _new_coordinator(self, attempts: List[Dict[str, Any]] = ()) -> PipelineCoordinator:
+        """A coordinator for the next attempt; retries resume the previous attempt's pipeline so only failed stages rerun."""
+        return PipelineCoordinator(
+            self.openai_api_key, self.competitor_data_path, mode=self.mode,
+            results_root=self.results_dir, client=self.client,
+            script_editor=self.script_editor, final_integrator=self.final_integrator,
+            processor_options=self.processor_options, llm=self.llm,
+            requests_per_minute=self.requests_per_minute, tokens_per_minute=self.tokens_per_minute,
+            completion_cache=self.completion_cache, prompt_budget_tokens=self.prompt_budget_tokens,
+            pipeline_id=attempts[-1]["pipeline_id"] if attempts else None
+        )
+
+    def _record_attempt(self, coordinator: Optional[PipelineCoordinator], results: Dict[str, Any], attempt: int,
+                        duration: float) -> Dict[str, Any]:
+        """Summarize one pipeline attempt and write its report next to its artifacts (if its coordinator was built)."""
+        if coordinator:
+            with open(os.path.join(coordinator.results_dir, "pipeline_report.txt"), 'w', encoding='utf-8') as f:
+                f.write(coordinator.generate_pipeline_report(results))
+        return {
+            "attempt": attempt,
+            "pipeline_id": coordinator.pipeline_id if coordinator else None,
+            "success": bool(results.get("success")),
+            "failed_at": results.get("failed_at"),
+            "error": pipeline_error(results),
+            "duration": duration
+        }
+
+    def _finish_comic(self, cbr_path: str, attempts: List[Dict[str, Any]], results: Dict[str, Any]) -> Dict[str, Any]:
+        status = {
+            "status": "success" if results.get("success") else "failed",
+            "attempts": attempts,
+            "pipeline_id": attempts[-1]["pipeline_id"],
+            "results_directory": results.get("results_directory"),
+            "final_output_file": results.get("final_output_file"),
+            "failed_at": results.get("failed_at"),
+            "error": attempts[-1]["error"],
+            "issues": results.get("issues", []),
+            "duration": sum(a["duration"] for a in attempts)
+        }
+        self._update_status(cbr_path, **status)
+        return self.comic_status[cbr_path]
+
+    @staticmethod
+    def _should_retry(results: Dict[str, Any]) -> bool:
+        # Input validation failures will not go away on retry
+        return not results.get("success") and "issues" not in results
+
+    def run_comic(self, cbr_path: str, target_duration: int) -> Dict[str, Any]:
+        """Run one comic through the pipeline, retrying failed attempts."""
+        attempts = []
+        for attempt in range(1, self.max_retries + 2):
+            self._update_status(cbr_path, status="running", attempt=attempt)
+            coordinator = self._new_coordinator(attempts)
+            attempt_start = time.time()
+            try:
+                results = coordinator.run_complete_pipeline(cbr_path, target_duration)
+            except Exception as e:
+                results = {"success": False, "error": f"Pipeline coordinator error: {e}"}
+
+            attempts.append(self._record_attempt(coordinator, results, attempt, time.time() - attempt_start))
+
+            if not self._should_retry(results):
+                break
+            if attempt <= self.max_retries:
+                delay = self.retry_delay * attempt
+                print(f"⚠️  {os.path.basename(cbr_path)} failed (attempt {attempt}), retrying in {delay:.0f}s")
+                self._update_status(cbr_path, status="retrying", attempts=attempts)
+                time.sleep(delay)
+
+        return self._finish_comic(cbr_path, attempts, results)
+
+    def run_scheduled(self, comics: List[str], target_duration: int):
+        """Run every comic's tasks on one stage scheduler so extraction, API calls and file I/O overlap across comics.
+        
+        Failed comics are retried together in a further scheduler pass after the retry delay.
+        """
+        attempts: Dict[str, List[Dict[str, Any]]] = {cbr_path: [] for cbr_path in comics}
+        remaining = list(comics)
+        done_count = 0
+        for attempt in range(1, self.max_retries + 2):
+            scheduler = StageScheduler(cpu_workers=self.extraction_workers, api_workers=self.api_workers)
+            # One competitor analysis serves every comic in the pass
+            with self.tracer.activate():
+                competitor_task = schedule_competitor_analysis(scheduler, self.script_editor)
+            pass_results: Dict[str, Any] = {}
+
+            def on_finished(cbr_path: str, coordinator: PipelineCoordinator, results: Dict[str, Any]):
+                nonlocal done_count
+                attempts[cbr_path].append(self._record_attempt(
+                    coordinator, results, attempt, results.get("total_duration", 0.0)
+                ))
+                pass_results[cbr_path] = results
+                if self._should_retry(results) and attempt <= self.max_retries:
+                    self._update_status(cbr_path, status="retrying", attempts=attempts[cbr_path])
+                    return
+                result = self._finish_comic(cbr_path, attempts[cbr_path], results)
+                done_count += 1
+                icon = "✅" if result.get("status") == "success" else "❌"
+                print(f"{icon} [{done_count}/{len(comics)}] {os.path.basename(cbr_path)}: {result.get('status')}")
+
+            # Comics are admitted a few at a time: each one's coordinator, comic processor and prepared
+            # page images only exist from its start task until its Vision tasks are through
+            coordinators: Dict[str, PipelineCoordinator] = {}
+            waiting = list(enumerate(remaining))
+            admission_lock = threading.Lock()
+
+            def start_comic(priority: int, cbr_path: str):
+                try:
+                    coordinator = coordinators[cbr_path] = self._new_coordinator(attempts[cbr_path])
+                    coordinator.schedule_pipeline(
+                        scheduler, cbr_path, target_duration, competitor_task=competitor_task, priority=priority,
+                        on_finished=lambda results: on_finished(cbr_path, coordinator, results),
+                        on_pages_analyzed=admit_next
+                    )
+                except Exception as e:
+                    on_finished(cbr_path, coordinators.get(cbr_path), {"success": False, "error": f"Pipeline coordinator error: {e}"})
+                    admit_next()
+
+            def admit_next():
+                with admission_lock:
+                    if not waiting:
+                        return
+                    priority, cbr_path = waiting.pop(0)
+                self._update_status(cbr_path, status="running", attempt=attempt)
+                with self.tracer.activate():
+                    scheduler.add_task(f"start:{cbr_path}", lambda: start_comic(priority, cbr_path), pool="cpu", priority=priority)
+
+            for _ in range(self.max_prepared_comics):
+                admit_next()
+            scheduler.run()
+            for cbr_path in remaining:
+                if cbr_path not in pass_results:
+                    on_finished(cbr_path, coordinators.get(cbr_path), {"success": False, "error": "Pipeline tasks did not complete"})
+            busy = scheduler.summary()["pool_busy_seconds"]
+            print(f"⚙️  Pass {attempt}: CPU tasks busy {busy['cpu']:.1f}s, API tasks busy {busy['api']:.1f}s")
+
+            remaining = [cbr_path for cbr_path in remaining if self._should_retry(pass_results.get(cbr_path, {}))]
+            if not remaining or attempt > self.max_retries:
+                break
+            delay = self.retry_delay * attempt
+            print(f"⚠️  {len(remaining)} comic(s) failed (attempt {attempt}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+    def run_batch(self, source: str, target_duration: int = 75) -> Dict[str, Any]:
+        """Run every comic found at source through the pipeline using the worker pool."""
+        batch_start = time.time()
+        comics = self.discover_comics(source)
+
+        print(f"🚀 Starting batch {self.batch_id}: {len(comics)} comics from {source}")
+        print(f"📁 Results will be saved to: {self.results_dir}")
+        if self.mode == "in-process":
+            print(f"⚙️  API workers: {self.api_workers}, CPU workers: {self.extraction_workers}, "
+                  f"comics prepared ahead: {self.max_prepared_comics}, retries: {self.max_retries}")
+        else:
+            print(f"⚙️  Comic workers: {self.api_workers}, retries: {self.max_retries}")
+
+        for cbr_path in comics:
+            self._update_status(cbr_path, status="queued")
+
+        if comics and self.mode == "in-process":
+            with self.tracer.activate():
+                self.build_shared_agents()
+            self.run_scheduled(comics, target_duration)
+        elif comics:
+            with ThreadPoolExecutor(max_workers=min(self.api_workers, len(comics))) as executor:
+                futures = {executor.submit(self.run_comic, cbr_path, target_duration): cbr_path for cbr_path in comics}
+                for done_count, future in enumerate(as_completed(futures), start=1):
+                    cbr_path = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._update_status(cbr_path, status="failed", error=f"Unexpected batch error: {e}")
+                        result = self.comic_status[cbr_path]
+                    icon = "✅" if result.get("status") == "success" else "❌"
+                    print(f"{icon} [{done_count}/{len(comics)}] {os.path.basename(cbr_path)}: {result.get('status')}")
+
+        batch_end = time.time()
+        comic_results = [self.comic_status[path] for path in comics]
+        batch_results = {
+            "batch_id": self.batch_id,
+            "source": source,
+            "target_duration": target_duration,
+            "mode": self.mode,
+            "start_time": batch_start,
+            "end_time": batch_end,
+            "total_duration": batch_end - batch_start,
+            "total_comics": len(comics),
+            "succeeded": sum(1 for r in comic_results if r.get("status") == "success"),
+            "failed": sum(1 for r in comic_results if r.get("status") != "success"),
+            "comics": comic_results,
+            "results_directory": self.results_dir
+        }
+        self.tracer.close()
+        shared_events = load_trace(self.trace_path)
+        if shared_events:
+            batch_results["shared_trace_file"] = write_chrome_trace(shared_events, os.path.join(self.results_dir, "shared_trace.json"))
+        batch_results["success"] = bool(comics) and batch_results["failed"] == 0
+        if self.llm:
+            batch_results["api_calls"] = dict(self.llm.stats)
+            batch_results["prompt_budget"] = dict(self.llm.prompt_budget.stats)
+            # Agents fall back on failed calls, so replay misses fail the batch as a whole
+            if self.llm.stats["replay_misses"]:
+                batch_results["success"] = False
+                batch_results["error"] = f"Replay mode: {self.llm.stats['replay_misses']} completion(s) were not in the cache"
+
+        with open(os.path.join(self.results_dir, "batch_results.json"), 'w', encoding='utf-8') as f:
+            json.dump(batch_results, f, indent=2)
+
+        return batch_results
+
+    def generate_batch_report(self, batch_results: Dict[str, Any]) -> str:
+        """Generate a consolidated report covering every comic in the batch."""
+        report = f"""
+{'='*80}
+COMIC-TO-YOUTUBE SCRIPT BATCH REPORT
+{'='*80}
+
+Batch ID: {batch_results.get('batch_id', 'Unknown')}
+Source: {batch_results.get('source', 'Unknown')}
+Target Duration: {batch_results.get('target_duration', 'Unknown')} seconds
+Mode: {batch_results.get('mode', 'Unknown')}
+
+EXECUTION SUMMARY:
+Comics: {batch_results.get('total_comics', 0)}
+Succeeded: {batch_results.get('succeeded', 0)}
+Failed: {batch_results.get('failed', 0)}
+Total Duration: {batch_results.get('total_duration', 0):.2f} seconds
+"""
+        if batch_results.get('error'):
+            report += f"Error: {batch_results['error']}\n"
+        prompt_budget = batch_results.get('prompt_budget')
+        if prompt_budget and prompt_budget.get('prompts'):
+            report += (f"Prompt Budget: {prompt_budget['prompts_trimmed']}/{prompt_budget['prompts']} prompts trimmed, "
+                       f"{prompt_budget['tokens_saved']:,} of {prompt_budget['tokens_before']:,} input tokens saved\n")
+
+        report += "\nCOMIC BREAKDOWN:\n"
+        for comic in batch_results.get('comics', []):
+            status = comic.get('status', 'unknown').upper()
+            attempts = len(comic.get('attempts', []))
+            report += f"  {os.path.basename(comic.get('cbr_file', 'Unknown'))}: {status} ({comic.get('duration', 0):.2f}s, {attempts} attempt(s))\n"
+            if status == "SUCCESS":
+                report += f"    Output: {comic.get('final_output_file')}\n"
+            else:
+                if comic.get('failed_at'):
+                    report += f"    Failed At: {comic['failed_at']}\n"
+                if comic.get('error'):
+                    report += f"    Error: {comic['error']}\n"
+                for issue in comic.get('issues', []):
+                    report += f"    Issue: {issue}\n"
+
+        report += f"\nRESULTS SAVED TO: {batch_results.get('results_directory', 'Not saved')}\n"
+        if batch_results.get('shared_trace_file'):
+            report += f"SHARED WORK TRACE: {batch_results['shared_trace_file']} (per-comic traces are in each pipeline's results directory)\n"
+        report += "\n" + "="*80
+
+        return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run many comics through the comic-to-YouTube script pipeline.",
+        epilog='Example: python batch_coordinator.py "comics/*.cbr" competitor_data.csv sk-... 75 --api-workers 8'
+    )
+    parser.add_argument("source", help="Directory of comics or a glob pattern")
+    parser.add_argument("competitor_data")
+    parser.add_argument("api_key")
+    parser.add_argument("target_duration", nargs="?", type=int, default=75)
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default="in-process",
+                        help="Run agents in this process (default) or as one subprocess per agent")
+    parser.add_argument("--api-workers", type=int, default=4,
+                        help="API calls in flight across all comics (in-process mode), or comics run at once (subprocess mode)")
+    parser.add_argument("--extraction-workers", type=int, default=2,
+                        help="Local tasks (archive listing, page decoding, output writing) run at once (in-process mode)")
+    parser.add_argument("--max-prepared-comics", type=int, default=3,
+                        help="Comics whose archives are opened and pages prepared ahead of their Vision calls (in-process mode)")
+    parser.add_argument("--max-retries", type=int, default=2, help="Retries per failed comic")
+    parser.add_argument("--requests-per-minute", type=int, default=60,
+                        help="API request budget shared by the whole batch (in-process mode)")
+    parser.add_argument("--tokens-per-minute", type=int, default=None,
+                        help="API token budget shared by the whole batch (in-process mode, default: unlimited)")
+    parser.add_argument("--completion-cache", choices=COMPLETION_CACHE_MODES, default="off",
+                        help="Reuse identical completions from .cache/completions (on), or only replay cached ones and fail on a miss (replay)")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET_TOKENS,
+                        help="Input tokens allowed per API call; longer prompts have their least important sections condensed or trimmed (0: no limit)")
+    parser.add_argument("--page-selection", choices=PAGE_SELECTION_MODES, default="smart",
+                        help="Score every page locally and send the most informative story pages to Vision (smart), or sample fixed positions (in-process mode)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_VISION_PAGES,
+                        help="Vision calls per comic (in-process mode)")
+    parser.add_argument("--pages-per-request", type=int, default=1,
+                        help="Pages packed into each Vision request, cutting request count under per-minute caps (in-process mode)")
+    parser.add_argument("--coverage", choices=COVERAGE_MODES, default="sampled",
+                        help="Analyze selected pages (sampled), or every page with a cheaper pass summarized pages -> scenes -> issue (full, in-process mode)")
+    args = parser.parse_args()
+
+    batch = BatchCoordinator(
+        args.api_key, args.competitor_data, mode=args.mode,
+        api_workers=args.api_workers, extraction_workers=args.extraction_workers,
+        max_retries=args.max_retries, requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute, completion_cache=args.completion_cache,
+        prompt_budget_tokens=args.prompt_budget, page_selection=args.page_selection, max_vision_pages=args.max_pages,
+        pages_per_request=args.pages_per_request, coverage=args.coverage, max_prepared_comics=args.max_prepared_comics
+    )
+
+    try:
+        results = batch.run_batch(args.source, args.target_duration)
+
+        report = batch.generate_batch_report(results)
+        print(report)
+
+        report_file = os.path.join(batch.results_dir, "batch_report.txt")
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(report)
+
+        print(f"\n📊 Batch report saved to: {report_file}")
+
+        sys.exit(0 if results.get('success') else 1)
+
+    except KeyboardInterrupt:
+        print("\n⚠️  Batch interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Batch coordinator error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
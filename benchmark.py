@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+Measures pipeline performance offline, without API costs or network variance: a local
+stand-in for the OpenAI chat completions API (configurable latency, error rate and
+response size) serves every agent, and synthetic CBZ/CBR/7z comics of different page
+counts and image sizes stand in for real issues. Reports per-stage timings for archive
+listing, page analysis and the full pipeline, and compares them against a saved baseline.
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import shutil
+import random
+import struct
+import zipfile
+import argparse
+import tempfile
+import threading
+import statistics
+import contextlib
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+FIXTURE_FORMATS = ("cbz", "cbr", "cb7")
+BENCHMARK_API_KEY = "sk-benchmark"
+
+FILLER_WORDS = ("hero", "villain", "city", "battle", "secret", "power", "team", "betrayal",
+                "rescue", "portal", "armor", "legacy", "rival", "origin", "sacrifice", "return")
+
+class FakeChatCompletionsServer:
+    """Local HTTP server answering POST /v1/chat/completions like the OpenAI API.
+
+    Each request sleeps latency +/- jitter seconds, fails with a 429 or 503 at error_rate,
+    and otherwise returns a completion of about response_words words laid out in the
+    SCRIPT / HOOK ANALYSIS / INTEGRATION DECISIONS / TITLE SUGGESTIONS sections, or, for
+    requests with a json_schema response_format, a JSON object matching the schema.
+    Streamed requests get the same completion as server-sent events, a few words every
+    stream_interval seconds after the first.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0,
+                 response_words: int = 250, seed: int = 0, host: str = "127.0.0.1", port: int = 0,
+                 stream_interval: float = 0.002):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response_words = response_words
+        self.stream_interval = stream_interval
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "bytes_received": 0, "bytes_sent": 0}
+        self._stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def _draw(self) -> Tuple[float, Optional[int]]:
+        """This request's delay, and the error status to answer with, if any."""
+        with self._random_lock:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if self.random.random() >= self.error_rate:
+                return delay, None
+            return delay, self.random.choice((429, 503))
+
+    def completion_text(self) -> str:
+        with self._random_lock:
+            words = [self.random.choice(FILLER_WORDS) for _ in range(self.response_words)]
+        script_words = max(1, len(words) * 2 // 3)
+        hook_words = script_words + (len(words) - script_words) // 2
+        script = " ".join(words[:script_words]).capitalize() + "."
+        hook = " ".join(words[script_words:hook_words]).capitalize() + "."
+        decisions = " ".join(words[hook_words:]).capitalize() + "."
+        return (f"**SCRIPT:**\n{script}\n\n**HOOK ANALYSIS:**\n{hook}\n\n**INTEGRATION DECISIONS:**\n{decisions}\n\n"
+                f"**TITLE SUGGESTIONS:**\n1. The {words[0].title()} Returns\n2. Why the {words[-1].title()} Matters\n"
+                f"Profile adherence score: 8/10")
+
+    def completion_json(self, schema: Dict[str, Any]) -> str:
+        """A JSON reply matching schema: fields named like *script carry timestamped narration of
+        about two thirds of response_words, every other string a short filler sentence."""
+        with self._random_lock:
+            words = [self.random.choice(FILLER_WORDS) for _ in range(self.response_words)]
+        script_words = words[:max(4, len(words) * 2 // 3)]
+        quarter = max(1, len(script_words) // 4)
+        script = " ".join(f"[00:{i * 15:02d}] " + " ".join(script_words[i * quarter:(i + 1) * quarter]).capitalize() + "."
+                          for i in range(4))
+
+        def sample(node: Dict[str, Any], name: str = "") -> Any:
+            kind = node.get("type")
+            if "enum" in node:
+                return node["enum"][0]
+            if kind == "object":
+                return {key: sample(child, key) for key, child in node.get("properties", {}).items()}
+            if kind == "array":
+                count = min(max(node.get("minItems", 3), 3), node.get("maxItems", 3))
+                return [sample(node.get("items", {}), name) for _ in range(count)]
+            if kind == "integer" or kind == "number":
+                return max(node.get("minimum", 0), node.get("maximum", 10) - 2)
+            if kind == "boolean":
+                return True
+            if name.endswith("script"):
+                return script
+            with self._random_lock:
+                return " ".join(self.random.choice(FILLER_WORDS) for _ in range(12)).capitalize() + "."
+
+        return json.dumps(sample(schema))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count(bytes_sent=len(body))
+
+            def _send_stream(self, completion_id: str, model: str, content: str, usage: Dict[str, int]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                def event(choices: List[Dict[str, Any]], **extra) -> bytes:
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": choices, **extra}
+                    return f"data: {json.dumps(chunk)}\n\n".encode('utf-8')
+                words = content.split(" ")
+                pieces = [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+                events = [event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+                events += [event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]) for piece in pieces]
+                events.append(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                events.append(event([], usage=usage))
+                events.append(b"data: [DONE]\n\n")
+                for i, data in enumerate(events):
+                    if i > 1 and server.stream_interval:
+                        time.sleep(server.stream_interval)
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                    server._count(bytes_sent=len(data))
+                self.close_connection = True
+
+            def do_POST(self):
+                request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server._count(requests=1, bytes_received=len(request_body))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                delay, error_status = server._draw()
+                time.sleep(delay)
+                if error_status:
+                    server._count(errors=1)
+                    if error_status == 429:
+                        self._send_json(429, {"error": {"message": "Rate limit reached (benchmark)", "type": "rate_limit_error"}},
+                                        {"retry-after-ms": "100"})
+                    else:
+                        self._send_json(503, {"error": {"message": "Service unavailable (benchmark)", "type": "server_error"}})
+                    return
+                try:
+                    request = json.loads(request_body or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                    return
+                response_format = request.get("response_format") or {}
+                if response_format.get("type") == "json_schema":
+                    content = server.completion_json(response_format["json_schema"]["schema"])
+                else:
+                    content = server.completion_text()
+                prompt_tokens = len(request_body) // 4
+                completion_tokens = len(content) // 4
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+                completion_id = f"chatcmpl-benchmark-{server.stats['requests']}"
+                if request.get("stream"):
+                    self._send_stream(completion_id, request.get("model", "benchmark"), content, usage)
+                    return
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "benchmark"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": usage
+                })
+
+        return Handler
+
+    def start(self) -> "FakeChatCompletionsServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def synthetic_png(width: int, height: int, seed: int) -> bytes:
+    """A zlib-compressed RGB PNG mixing noisy bands (like scanned art) with flat panel gutters."""
+    rng = random.Random(seed)
+    raw = bytearray()
+    flat_row = bytes([245, 240, 230]) * width
+    for y in range(height):
+        raw.append(0)  # Filter type: none
+        raw += rng.randbytes(width * 3) if (y // 32) % 3 else flat_row
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(raw), 6)) + chunk(b"IEND", b"")
+
+def write_fixture(path: str, fmt: str, pages: int, width: int, height: int) -> bool:
+    """Write a synthetic comic archive. Returns False if no tool for the format is installed."""
+    page_dir = tempfile.mkdtemp(prefix="benchmark_pages_")
+    try:
+        names = []
+        for page in range(1, pages + 1):
+            # Unpadded names exercise natural sort order (page2 before page10)
+            name = f"page{page}.png"
+            with open(os.path.join(page_dir, name), 'wb') as f:
+                f.write(synthetic_png(width, height, seed=page))
+            names.append(name)
+
+        if fmt == "cbz":
+            # Comic archives are usually stored: the images are already compressed
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as archive:
+                for name in names:
+                    archive.write(os.path.join(page_dir, name), name)
+            return True
+        if fmt == "cb7":
+            try:
+                import py7zr
+                with py7zr.SevenZipFile(path, 'w') as archive:
+                    for name in names:
+                        archive.write(os.path.join(page_dir, name), name)
+                return True
+            except ImportError:
+                tool = shutil.which("7z") or shutil.which("7za")
+                if not tool:
+                    return False
+                subprocess.run([tool, "a", "-bd", os.path.abspath(path)] + names, cwd=page_dir,
+                               check=True, capture_output=True)
+                return True
+        if fmt == "cbr":
+            tool = shutil.which("rar")
+            if not tool:
+                return False
+            subprocess.run([tool, "a", "-idq", "-m0", os.path.abspath(path)] + names, cwd=page_dir,
+                           check=True, capture_output=True)
+            return True
+        raise ValueError(f"Unknown fixture format '{fmt}'. Expected one of: {', '.join(FIXTURE_FORMATS)}")
+    finally:
+        shutil.rmtree(page_dir, ignore_errors=True)
+
+def write_competitor_csv(path: str, rows: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=["Video ID", "Title", "Description", "Transcript", "URL"])
+        writer.writeheader()
+        for i in range(rows):
+            words = [rng.choice(FILLER_WORDS) for _ in range(120)]
+            writer.writerow({
+                "Video ID": f"video{i}",
+                "Title": f"How the {words[0]} beat the {words[1]}",
+                "Description": " ".join(words[:30]),
+                "Transcript": " ".join(words),
+                "URL": f"https://youtube.com/shorts/video{i}"
+            })
+
+def parse_size(text: str) -> Tuple[int, int]:
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+class Benchmark:
+    """Builds fixtures once, then times each stage repeat times against the fake API."""
+
+    def __init__(self, work_dir: str, server: FakeChatCompletionsServer, repeat: int = 3,
+                 requests_per_minute: int = 100000, target_duration: int = 75, verbose: bool = False):
+        self.work_dir = os.path.abspath(work_dir)
+        self.fixture_dir = os.path.join(self.work_dir, "fixtures")
+        self.server = server
+        self.repeat = max(1, repeat)
+        self.requests_per_minute = requests_per_minute
+        self.target_duration = target_duration
+        self.verbose = verbose
+        self.timings: Dict[str, List[float]] = {}
+        self.failures: Dict[str, List[str]] = {}
+        os.makedirs(self.fixture_dir, exist_ok=True)
+
+    def build_fixtures(self, formats: List[str], page_counts: List[int], sizes: List[Tuple[int, int]]) -> List[str]:
+        """Create (or reuse) one archive per format, page count and image size."""
+        fixtures = []
+        for fmt in formats:
+            for pages, (width, height) in [(pages, size) for pages in page_counts for size in sizes]:
+                path = os.path.join(self.fixture_dir, f"{fmt}-{pages}p-{width}x{height}.{fmt}")
+                if not os.path.exists(path):
+                    print(f"Creating fixture {os.path.basename(path)}...")
+                    if not write_fixture(path, fmt, pages, width, height):
+                        print(f"⚠️ Skipping {fmt} fixtures: no tool to create them is installed")
+                        break
+                fixtures.append(path)
+        return fixtures
+
+    @contextlib.contextmanager
+    def _quiet(self):
+        """Hide the agents' progress output unless running verbosely."""
+        if self.verbose:
+            yield
+            return
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+    @contextlib.contextmanager
+    def _fresh_cwd(self):
+        """Run in an empty directory so the relative .cache directories start cold."""
+        run_dir = tempfile.mkdtemp(prefix="run_", dir=self.work_dir)
+        previous = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            yield run_dir
+        finally:
+            os.chdir(previous)
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    def _record(self, stage: str, seconds: float):
+        self.timings.setdefault(stage, []).append(seconds)
+
+    def _fail(self, stage: str, error: Any):
+        self.failures.setdefault(stage, []).append(str(error))
+
+    def _client(self):
+        from openai import OpenAI
+        return OpenAI(api_key=BENCHMARK_API_KEY, base_url=self.server.base_url)
+
+    def _processor(self):
+        from agent_1_comic_processor import ComicProcessorFixed
+        from llm_client import LLMClient, RateLimiter
+        client = self._client()
+        return ComicProcessorFixed(BENCHMARK_API_KEY, client=client, cache_dir=None,
+                                   llm=LLMClient(client, RateLimiter(self.requests_per_minute)))
+
+    def bench_pages(self, fixture: str):
+        """Time extract_cbr_images_robust and analyze_comic_pages_fixed on one fixture."""
+        name = os.path.basename(fixture)
+        for _ in range(self.repeat):
+            processor = self._processor()
+            try:
+                with self._quiet():
+                    start = time.perf_counter()
+                    image_paths = processor.extract_cbr_images_robust(fixture)
+                    self._record(f"extract_cbr_images_robust[{name}]", time.perf_counter() - start)
+                    if not image_paths:
+                        self._fail(f"extract_cbr_images_robust[{name}]", "no pages listed")
+                        continue
+                    start = time.perf_counter()
+                    analysis = processor.analyze_comic_pages_fixed(image_paths)
+                    self._record(f"analyze_comic_pages_fixed[{name}]", time.perf_counter() - start)
+                    if "error" in analysis:
+                        self._fail(f"analyze_comic_pages_fixed[{name}]", analysis["error"])
+            finally:
+                with self._quiet():
+                    processor.cleanup()
+
+    def bench_pipeline(self, fixture: str, competitor_csv: str):
+        """Time run_complete_pipeline end to end, plus each agent stage, with cold caches."""
+        from pipeline_coordinator import PipelineCoordinator
+        name = os.path.basename(fixture)
+        for _ in range(self.repeat):
+            with self._fresh_cwd():
+                coordinator = PipelineCoordinator(BENCHMARK_API_KEY, competitor_csv, client=self._client(),
+                                                  requests_per_minute=self.requests_per_minute)
+                with self._quiet():
+                    start = time.perf_counter()
+                    results = coordinator.run_complete_pipeline(fixture, self.target_duration)
+                    elapsed = time.perf_counter() - start
+            if not results.get("success"):
+                self._fail(f"run_complete_pipeline[{name}]", results.get("error") or f"failed at {results.get('failed_at')}")
+                continue
+            self._record(f"run_complete_pipeline[{name}]", elapsed)
+            for stage, stage_result in results.get("stages", {}).items():
+                self._record(f"run_complete_pipeline[{name}].{stage}", stage_result.get("duration", 0.0))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "runs": len(samples),
+                "median": statistics.median(samples),
+                "min": min(samples),
+                "max": max(samples)
+            }
+            for stage, samples in self.timings.items()
+        }
+
+def compare_to_baseline(summary: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        max_regression: float, min_seconds: float = 0.05) -> List[str]:
+    """Stages whose median grew by more than max_regression (and min_seconds) over the baseline."""
+    regressions = []
+    for stage, stats in summary.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        growth = stats["median"] - previous["median"]
+        if growth > min_seconds and stats["median"] > previous["median"] * (1 + max_regression):
+            regressions.append(f"{stage}: {previous['median']:.3f}s -> {stats['median']:.3f}s "
+                               f"(+{growth / previous['median'] * 100:.0f}%)")
+    return regressions
+
+def generate_benchmark_report(results: Dict[str, Any]) -> str:
+    config = results["config"]
+    report = f"""
+{'='*80}
+COMIC-TO-YOUTUBE SCRIPT BENCHMARK REPORT
+{'='*80}
+
+Fake API: latency {config['latency']}s +/- {config['jitter']}s, error rate {config['error_rate']:.0%}, {config['response_words']} words per response
+Runs per stage: {config['repeat']}
+API requests served: {results['server']['requests']} ({results['server']['errors']} injected errors, {results['server']['bytes_received'] / 1024 / 1024:.1f} MB uploaded)
+
+STAGE TIMINGS (seconds):
+  {'stage':<64} {'median':>8} {'min':>8} {'max':>8}
+"""
+    for stage, stats in sorted(results["stages"].items()):
+        report += f"  {stage[:64]:<64} {stats['median']:>8.3f} {stats['min']:>8.3f} {stats['max']:>8.3f}\n"
+    for stage, errors in results["failures"].items():
+        report += f"  ❌ {stage}: {len(errors)} failed run(s), e.g. {errors[0]}\n"
+    if "regressions" in results:
+        if results["regressions"]:
+            report += "\nREGRESSIONS AGAINST BASELINE:\n"
+            for regression in results["regressions"]:
+                report += f"  {regression}\n"
+        else:
+            report += "\nNo regressions against baseline.\n"
+    report += "\n" + "="*80
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline offline against a local fake OpenAI API and synthetic comics.",
+        epilog="Example: python benchmark.py --pages 8,32 --image-sizes 1000x1500,1988x3056 --latency 0.3 --output baseline.json"
+    )
+    parser.add_argument("--work-dir", default=".benchmark", help="Where fixtures and scratch runs live (fixtures are reused)")
+    parser.add_argument("--formats", default="cbz,cbr,cb7", help=f"Fixture formats from: {', '.join(FIXTURE_FORMATS)}")
+    parser.add_argument("--pages", default="8,32", help="Comma-separated page counts")
+    parser.add_argument("--image-sizes", default="1000x1500", help="Comma-separated WIDTHxHEIGHT page sizes")
+    parser.add_argument("--competitor-rows", type=int, default=100, help="Rows in the synthetic competitor CSV")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake API latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or 503")
+    parser.add_argument("--response-words", type=int, default=250, help="Words per fake completion")
+    parser.add_argument("--stream-interval", type=float, default=0.002,
+                        help="Seconds between chunks of a streamed fake completion")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    parser.add_argument("--requests-per-minute", type=int, default=100000,
+                        help="Client-side rate limit (high by default so only the fake API's latency is measured)")
+    parser.add_argument("--skip-pipeline", action="store_true", help="Only time extraction and page analysis")
+    parser.add_argument("--output", help="Write the results as JSON, e.g. to use as a later --baseline")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Fail when a stage's median is this much slower than the baseline (default: 0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    args = parser.parse_args()
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    for fmt in formats:
+        if fmt not in FIXTURE_FORMATS:
+            parser.error(f"Unknown format '{fmt}'. Expected one of: {', '.join(FIXTURE_FORMATS)}")
+    page_counts = [int(pages) for pages in args.pages.split(",")]
+    sizes = [parse_size(size) for size in args.image_sizes.split(",")]
+
+    server = FakeChatCompletionsServer(args.latency, args.jitter, args.error_rate, args.response_words,
+                                       stream_interval=args.stream_interval).start()
+    # Anything that builds its own OpenAI client (e.g. subprocess agents) talks to the fake API too
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    print(f"🧪 Fake OpenAI API listening on {server.base_url}")
+
+    try:
+        benchmark = Benchmark(args.work_dir, server, args.repeat, args.requests_per_minute, verbose=args.verbose)
+        fixtures = benchmark.build_fixtures(formats, page_counts, sizes)
+        competitor_csv = os.path.join(benchmark.fixture_dir, f"competitors-{args.competitor_rows}.csv")
+        if not os.path.exists(competitor_csv):
+            write_competitor_csv(competitor_csv, args.competitor_rows)
+
+        for fixture in fixtures:
+            print(f"⏱️  Extraction and page analysis: {os.path.basename(fixture)}")
+            benchmark.bench_pages(fixture)
+            # The coordinator only accepts .cbr/.cbz/.zip inputs
+            if not args.skip_pipeline and fixture.lower().endswith(('.cbr', '.cbz', '.zip')):
+                print(f"⏱️  Full pipeline: {os.path.basename(fixture)}")
+                benchmark.bench_pipeline(fixture, competitor_csv)
+
+        results = {
+            "created_at": time.time(),
+            "config": {
+                "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                "response_words": args.response_words, "repeat": args.repeat,
+                "competitor_rows": args.competitor_rows, "fixtures": [os.path.basename(f) for f in fixtures]
+            },
+            "server": dict(server.stats),
+            "stages": benchmark.summary(),
+            "failures": benchmark.failures
+        }
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            results["regressions"] = compare_to_baseline(results["stages"], baseline.get("stages", {}), args.max_regression)
+    finally:
+        server.stop()
+
+    print(generate_benchmark_report(results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📊 Benchmark results saved to: {args.output}")
+
+    sys.exit(1 if results["failures"] or results.get("regressions") else 0)
+
+if __name__ == "__main__":
+    main()
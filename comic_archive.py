@@ -0,0 +1,276 @@
+"""
+Comic Archive Reader
+Lists the image pages inside CBR/CBZ/CB7 archives and reads only the members that
+are actually needed, instead of extracting the whole archive to a temp directory.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import subprocess
+import time
+from typing import List, Dict, Any, Optional
+
+from tracing import span
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Leading magic bytes for the container formats comics ship in
+ARCHIVE_SIGNATURES = [
+    (b'PK\x03\x04', 'zip'),
+    (b'PK\x05\x06', 'zip'),  # Empty archive
+    (b'Rar!\x1a\x07', 'rar'),  # Covers RAR 4.x (\x00) and RAR 5 (\x01\x00)
+    (b"7z\xbc\xaf'\x1c", '7z'),
+]
+
+def detect_archive_format(archive_path: str) -> Optional[str]:
+    """Identify an archive by its magic bytes rather than its extension."""
+    with open(archive_path, 'rb') as f:
+        header = f.read(8)
+    for signature, archive_format in ARCHIVE_SIGNATURES:
+        if header.startswith(signature):
+            return archive_format
+    return None
+
+def natural_sort_key(name: str) -> list:
+    """Sort key that orders 'page2' before 'page10'."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+def is_image_entry(name: str) -> bool:
+    """True for page images, skipping macOS resource forks and metadata folders."""
+    base = os.path.basename(name)
+    if not base or base.startswith('._') or '__MACOSX' in name:
+        return False
+    return base.lower().endswith(IMAGE_EXTENSIONS)
+
+class ArchiveBackend:
+    """Base class for a single archive format."""
+    name = "base"
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+
+    def list_entries(self) -> List[str]:
+        raise NotImplementedError
+
+    def read_entries(self, names: List[str]) -> Dict[str, bytes]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class ZipBackend(ArchiveBackend):
+    name = "zip"
+
+    def __init__(self, archive_path: str):
+        super().__init__(archive_path)
+        self.archive = zipfile.ZipFile(archive_path, 'r')
+
+    def list_entries(self) -> List[str]:
+        return [info.filename for info in self.archive.infolist() if not info.is_dir()]
+
+    def read_entries(self, names: List[str]) -> Dict[str, bytes]:
+        return {name: self.archive.read(name) for name in names}
+
+    def close(self):
+        self.archive.close()
+
+class RarBackend(ArchiveBackend):
+    name = "rar"
+
+    def __init__(self, archive_path: str):
+        super().__init__(archive_path)
+        import rarfile
+
+        # Configure rarfile to use system unar
+        rarfile.UNRAR_TOOL = "unar"
+        self.archive = rarfile.RarFile(archive_path, 'r')
+
+    def list_entries(self) -> List[str]:
+        return [info.filename for info in self.archive.infolist() if not info.is_dir()]
+
+    def read_entries(self, names: List[str]) -> Dict[str, bytes]:
+        return {name: self.archive.read(name) for name in names}
+
+    def close(self):
+        self.archive.close()
+
+class SevenZipBackend(ArchiveBackend):
+    name = "7z"
+
+    def __init__(self, archive_path: str):
+        super().__init__(archive_path)
+        import py7zr
+
+        self._py7zr = py7zr
+        with py7zr.SevenZipFile(archive_path, mode='r') as archive:
+            self._names = archive.getnames()
+
+    def list_entries(self) -> List[str]:
+        return list(self._names)
+
+    def read_entries(self, names: List[str]) -> Dict[str, bytes]:
+        # 7z archives are usually solid, so each read needs a freshly opened archive
+        with self._py7zr.SevenZipFile(self.archive_path, mode='r') as archive:
+            if hasattr(archive, 'read'):
+                return {name: data.read() for name, data in archive.read(targets=names).items()}
+            scratch_dir = tempfile.mkdtemp()
+            try:
+                archive.extract(path=scratch_dir, targets=names)
+                result = {}
+                for name in names:
+                    with open(os.path.join(scratch_dir, name), 'rb') as f:
+                        result[name] = f.read()
+                return result
+            finally:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+
+class UnarBackend(ArchiveBackend):
+    """Last resort: extract everything with the system unar command."""
+    name = "unar"
+
+    def __init__(self, archive_path: str):
+        super().__init__(archive_path)
+        self.temp_dir = tempfile.mkdtemp()
+        try:
+            result = subprocess.run(['unar', '-o', self.temp_dir, archive_path],
+                                    capture_output=True, text=True, timeout=120)
+        except Exception:
+            self.close()
+            raise
+        if result.returncode != 0:
+            self.close()
+            raise RuntimeError(f"unar failed: {result.stderr.strip()}")
+
+    def list_entries(self) -> List[str]:
+        entries = []
+        for root, dirs, files in os.walk(self.temp_dir):
+            for file in files:
+                entries.append(os.path.relpath(os.path.join(root, file), self.temp_dir))
+        return entries
+
+    def read_entries(self, names: List[str]) -> Dict[str, bytes]:
+        result = {}
+        for name in names:
+            with open(os.path.join(self.temp_dir, name), 'rb') as f:
+                result[name] = f.read()
+        return result
+
+    def close(self):
+        if self.temp_dir and os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.temp_dir = None
+
+class ComicArchive:
+    """Opens a comic archive with the backend matching its format and exposes its pages in reading order."""
+
+    BACKENDS = [ZipBackend, RarBackend, SevenZipBackend, UnarBackend]
+    BACKENDS_BY_FORMAT = {backend.name: backend for backend in BACKENDS}
+
+    def __init__(self, archive_path: str):
+        if not os.path.exists(archive_path):
+            raise FileNotFoundError(f"CBR file not found: {archive_path}")
+        self.archive_path = archive_path
+        self.backend = None
+        self.method = None
+        self.detected_format = None
+        self.pages: List[str] = []
+        self.timings: Dict[str, float] = {}
+        self.attempts: List[Dict[str, Any]] = []
+
+    def _candidate_backends(self) -> List[type]:
+        """The sniffed format's backend with unar as fallback, or every backend if the format is unknown."""
+        backend_cls = self.BACKENDS_BY_FORMAT.get(self.detected_format)
+        if backend_cls:
+            return [backend_cls, UnarBackend]
+        return list(self.BACKENDS)
+
+    def _record_time(self, backend_name: str, seconds: float):
+        self.timings[backend_name] = self.timings.get(backend_name, 0.0) + seconds
+
+    def _try_backend(self, backend_cls: type) -> List[str]:
+        print(f"Trying {backend_cls.name} backend...")
+        backend = backend_cls(self.archive_path)
+        try:
+            pages = sorted((name for name in backend.list_entries() if is_image_entry(name)), key=natural_sort_key)
+        except Exception:
+            backend.close()
+            raise
+        if pages:
+            self.backend = backend
+        else:
+            backend.close()
+        return pages
+
+    def open(self) -> List[str]:
+        """Sniff the archive format, open it with the matching backend and return the naturally sorted page entries."""
+        self.detected_format = detect_archive_format(self.archive_path)
+        print(f"Detected archive format: {self.detected_format or 'unknown'}")
+
+        for backend_cls in self._candidate_backends():
+            attempt_start = time.time()
+            error = None
+            pages = []
+            with span("archive_list", "extraction", backend=backend_cls.name, format=self.detected_format) as attempt:
+                try:
+                    pages = self._try_backend(backend_cls)
+                except ImportError:
+                    error = "backend library not available"
+                except Exception as e:
+                    error = str(e)
+                attempt.update(pages=len(pages), error=error)
+            elapsed = time.time() - attempt_start
+            self._record_time(backend_cls.name, elapsed)
+            self.attempts.append({
+                "backend": backend_cls.name,
+                "seconds": elapsed,
+                "success": bool(pages),
+                "error": error
+            })
+
+            if pages:
+                print(f"✅ {backend_cls.name} backend listed {len(pages)} images")
+                self.method = backend_cls.name
+                self.pages = pages
+                return pages
+            print(f"❌ {backend_cls.name} backend failed: {error or 'no images found'}")
+
+        print("❌ All extraction methods failed")
+        return []
+
+    def read_pages(self, names: List[str]) -> Dict[str, bytes]:
+        """Read only the requested page entries into memory."""
+        if not self.backend:
+            raise RuntimeError("Archive is not open")
+        read_start = time.time()
+        try:
+            with span("archive_read", "extraction", backend=self.method, pages=len(names)) as read:
+                entries = self.backend.read_entries(names)
+                read["bytes"] = sum(len(data) for data in entries.values())
+                return entries
+        finally:
+            self._record_time(self.method, time.time() - read_start)
+
+    def stats(self) -> Dict[str, Any]:
+        """Format detection result plus per-backend timings, for inclusion in result dicts."""
+        return {
+            "detected_format": self.detected_format,
+            "method": self.method,
+            "timings": dict(self.timings),
+            "attempts": list(self.attempts),
+            "total_seconds": sum(self.timings.values())
+        }
+
+    def close(self):
+        if self.backend:
+            self.backend.close()
+            self.backend = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,131 @@
+"""
+Disk Cache
+Content-addressed JSON cache on disk with size-bounded LRU eviction and an optional
+TTL, shared by the agents to avoid paying for the same API calls on re-runs.
+
+An entry's mtime is its write time (used for the TTL) and its atime is its last use
+(used for LRU eviction).
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import time
+import threading
+from typing import Any, Dict, Optional, Union
+
+def write_json_atomic(path: str, value: Any, indent: Optional[int] = None):
+    """Write JSON to a temporary file beside path and swap it in, so a crash mid-write never leaves a truncated file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(value, f, indent=indent)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class DiskCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 100 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._current_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    @staticmethod
+    def make_key(*parts: Union[str, bytes]) -> str:
+        """SHA-256 over the given parts, separated so ('ab', 'c') != ('a', 'bc')."""
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entry_paths(self):
+        for root, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.json'):
+                    yield os.path.join(root, file)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry. A hit refreshes the entry's LRU position."""
+        path = self._path(key)
+        try:
+            written_at = os.stat(path).st_mtime
+            if self.ttl_seconds is not None and time.time() - written_at > self.ttl_seconds:
+                self._remove(path)
+                with self._lock:
+                    self.expired += 1
+                    self.misses += 1
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # Bump only the access time so the write time keeps driving the TTL
+            os.utime(path, (time.time(), written_at))
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """Store a JSON-serialisable value, evicting least recently used entries if over budget."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        write_json_atomic(path, value)
+        with self._lock:
+            self._current_bytes += os.path.getsize(path) - previous_size
+            if self._current_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes. Caller holds the lock."""
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        self._current_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._current_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._current_bytes -= size
+            except OSError:
+                pass
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._current_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "cache_dir": self.cache_dir,
+            "size_bytes": self._current_bytes
+        }
@@ -0,0 +1,364 @@
+"""
+LLM Client
+Shared wrapper around the OpenAI chat completions API: a token-bucket rate limiter
+for requests-per-minute and tokens-per-minute budgets, retries with jittered
+exponential backoff that honor the server's Retry-After hints, an optional
+on-disk completion cache with a strict replay mode, streamed completions,
+JSON-schema constrained completions that are validated and repaired, and the
+per-call prompt budget the agents fit their prompts to.
+"""
+
+import os
+import json
+import time
+import types
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from disk_cache import DiskCache
+from tracing import span
+from prompt_budget import PromptBudget
+from structured_output import StructuredOutputError, parse_json_output, repair_prompt, response_format
+
+# Rough cost of a low-detail image input, used only for token budget estimates
+IMAGE_TOKEN_ESTIMATE = 85
+
+# off: always call the API; on: serve repeated requests from disk; replay: serve only from disk, never call the API
+COMPLETION_CACHE_MODES = ("off", "on", "replay")
+# Agents launched as subprocesses pick the coordinator's cache mode up from here
+COMPLETION_CACHE_ENV = "SCRIPT_GEN_COMPLETION_CACHE"
+DEFAULT_COMPLETION_CACHE_DIR = os.path.join(".cache", "completions")
+
+# Counters opened with count_calls() in this context; tasks and threads started from it share them
+_call_counters: contextvars.ContextVar[Tuple[Dict[str, int], ...]] = contextvars.ContextVar("script_gen_call_counters", default=())
+
+@contextmanager
+def count_calls() -> Iterator[Dict[str, int]]:
+    """Count the LLM client stats of calls made in this context (and the tasks and threads started from it)
+    apart from the shared totals, so e.g. one pipeline's replay misses are not mixed up with a concurrent one's."""
+    counter: Dict[str, int] = {}
+    token = _call_counters.set(_call_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _call_counters.reset(token)
+
+class CacheMissError(RuntimeError):
+    """Raised in replay mode when a request has no cached completion."""
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """Approximate tokens a request will consume: about four characters per prompt token, plus the completion budget."""
+    characters = 0
+    images = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                characters += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+    return characters // 4 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or 0)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The server's requested wait from Retry-After / retry-after-ms headers, if the error carries a response."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, timeouts, connection drops and server errors are worth retrying; bad requests are not."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Return True if an OpenAI error is a 429 rate-limit response."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared by every thread making API calls.
+
+    Each bucket holds burst_seconds worth of budget and refills continuously. A tokens_per_minute
+    of None disables the token budget.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, tokens_per_minute: Optional[int] = None,
+                 burst_seconds: float = 10.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_rate = requests_per_minute / 60.0 if requests_per_minute and requests_per_minute > 0 else None
+        self._token_rate = tokens_per_minute / 60.0 if tokens_per_minute and tokens_per_minute > 0 else None
+        self._request_capacity = max(1.0, self._request_rate * burst_seconds) if self._request_rate else 0.0
+        self._token_capacity = max(1.0, self._token_rate * burst_seconds) if self._token_rate else 0.0
+        self._requests = self._request_capacity
+        self._tokens = self._token_capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self._request_rate:
+            self._requests = min(self._request_capacity, self._requests + elapsed * self._request_rate)
+        if self._token_rate:
+            self._tokens = min(self._token_capacity, self._tokens + elapsed * self._token_rate)
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        """Block until one request and estimated_tokens fit in the budgets. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                delay = max(0.0, self._blocked_until - now)
+                if self._request_rate and self._requests < 1:
+                    delay = max(delay, (1 - self._requests) / self._request_rate)
+                # Requests larger than the whole bucket go through once it is full, leaving it in debt
+                needed_tokens = min(estimated_tokens, self._token_capacity)
+                if self._token_rate and self._tokens < needed_tokens:
+                    delay = max(delay, (needed_tokens - self._tokens) / self._token_rate)
+                if delay <= 0:
+                    if self._request_rate:
+                        self._requests -= 1
+                    if self._token_rate:
+                        self._tokens -= estimated_tokens
+                    self.total_wait += waited
+                    return waited
+            time.sleep(delay)
+            waited += delay
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the API reports what a request really cost."""
+        if not self._token_rate or actual_tokens is None:
+            return
+        with self._lock:
+            self._tokens = min(self._token_capacity, self._tokens + estimated_tokens - actual_tokens)
+
+    def back_off(self, seconds: float):
+        """Hold every caller back after the API reports a rate limit."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+def completion_cache_key(request: Dict[str, Any]) -> str:
+    """Cache key over every request parameter (model, messages, max_tokens, ...), independent of argument order."""
+    return DiskCache.make_key("chat-completion", json.dumps(request, sort_keys=True, default=str))
+
+def completion_response(content: str, usage: Any = None, cached: bool = False, finish_reason: str = "stop") -> Any:
+    """A minimal stand-in for a ChatCompletion, exposing the attributes the agents read.
+
+    Used for cache hits and for completions assembled from a stream; usage may be a dict or an object.
+    """
+    message = types.SimpleNamespace(content=content, role="assistant")
+    if isinstance(usage, dict):
+        usage = types.SimpleNamespace(**usage)
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason, index=0)],
+        usage=usage,
+        cached=cached
+    )
+
+class LLMClient:
+    """Rate-limited, retrying front end to client.chat.completions.create, meant to be shared by all agents."""
+
+    def __init__(self, client, rate_limiter: Optional[RateLimiter] = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0, cache_mode: Optional[str] = None,
+                 cache_dir: str = DEFAULT_COMPLETION_CACHE_DIR, cache_ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 cache_max_bytes: int = 200 * 1024 * 1024, prompt_budget: Optional[PromptBudget] = None):
+        # Retries happen here, so the SDK's own retry loop is turned off where supported
+        self.client = client.with_options(max_retries=0) if hasattr(client, "with_options") else client
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cache_mode = cache_mode or os.environ.get(COMPLETION_CACHE_ENV) or "off"
+        if self.cache_mode not in COMPLETION_CACHE_MODES:
+            raise ValueError(f"Unknown completion cache mode '{self.cache_mode}'. Expected one of: {', '.join(COMPLETION_CACHE_MODES)}")
+        self.cache = DiskCache(cache_dir, cache_max_bytes, cache_ttl_seconds) if self.cache_mode != "off" else None
+        self.prompt_budget = prompt_budget or PromptBudget()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "total_tokens": 0,
+                      "cache_hits": 0, "cache_misses": 0, "replay_misses": 0, "repairs": 0}
+
+    @property
+    def replay(self) -> bool:
+        return self.cache_mode == "replay"
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+            for counter in _call_counters.get():
+                counter[name] = counter.get(name, 0) + amount
+
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        server_delay = retry_after_seconds(error)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+        return delay
+
+    def create(self, label: str = "chat_completion", **kwargs) -> Any:
+        """Chat completion served from the completion cache when enabled, otherwise from the API.
+
+        label names the call in the trace (e.g. "story_summary"); it is not sent to the API.
+        """
+        return self._complete(label, kwargs)
+
+    def stream(self, label: str = "chat_completion", on_text: Optional[Callable[[str], Any]] = None, **kwargs) -> Any:
+        """Streamed chat completion: on_text receives each piece of text as it arrives.
+
+        Returns the assembled completion, shaped like create()'s response. Shares create()'s
+        cache entries; a cached completion is passed to on_text in one piece.
+        """
+        return self._complete(label, kwargs, stream=True, on_text=on_text)
+
+    def _complete(self, label: str, kwargs: Dict[str, Any], stream: bool = False,
+                  on_text: Optional[Callable[[str], Any]] = None) -> Any:
+        with span(label, "api", model=kwargs.get("model"),
+                  bytes_uploaded=len(json.dumps(kwargs.get("messages", []), default=str))) as call:
+            if stream:
+                call["stream"] = True
+            cache_key = None
+            if not self.cache:
+                call["cache"] = "off"
+            else:
+                cache_key = completion_cache_key(kwargs)
+                cached = self.cache.get(cache_key)
+                if cached:
+                    self._count("cache_hits")
+                    call["cache"] = "hit"
+                    if on_text:
+                        on_text(cached["content"])
+                    return completion_response(cached["content"], cached.get("usage"), cached=True)
+                self._count("cache_misses")
+                call["cache"] = "miss"
+                if self.replay:
+                    self._count("replay_misses")
+                    raise CacheMissError(f"Replay mode: no cached completion for this {kwargs.get('model', 'unknown')} request")
+
+            if stream:
+                request = lambda: self._read_stream(call, on_text, **kwargs)
+            else:
+                request = lambda: self.client.chat.completions.create(**kwargs)
+            response = self._create_uncached(call, request, estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens", 0)))
+            self._trace_usage(call, response)
+            if cache_key:
+                usage = getattr(response, "usage", None)
+                self.cache.set(cache_key, {
+                    "content": response.choices[0].message.content,
+                    "model": kwargs.get("model"),
+                    "usage": {name: getattr(usage, name) for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+                              if isinstance(getattr(usage, name, None), int)} if usage else None
+                })
+            return response
+
+    @staticmethod
+    def _trace_usage(call: Dict[str, Any], response: Any):
+        usage = getattr(response, "usage", None)
+        for name in ("prompt_tokens", "completion_tokens"):
+            if isinstance(getattr(usage, name, None), int):
+                call[name] = getattr(usage, name)
+
+    def _read_stream(self, call: Dict[str, Any], on_text: Optional[Callable[[str], Any]], **kwargs) -> Any:
+        """Consume a streamed completion, forwarding text deltas, and assemble it into one response."""
+        start = time.time()
+        pieces = []
+        usage = None
+        finish_reason = "stop"
+        for chunk in self.client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs):
+            # With include_usage the last chunk carries the usage and no choices
+            usage = getattr(chunk, "usage", None) or usage
+            for choice in getattr(chunk, "choices", None) or []:
+                text = getattr(choice.delta, "content", None)
+                if text:
+                    if "time_to_first_token" not in call:
+                        call["time_to_first_token"] = time.time() - start
+                    pieces.append(text)
+                    if on_text:
+                        on_text(text)
+                finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+        return completion_response("".join(pieces), usage, finish_reason=finish_reason)
+
+    def _create_uncached(self, call: Dict[str, Any], request: Callable[[], Any], estimated_tokens: int) -> Any:
+        """Run request() within the shared budgets, retrying transient failures."""
+        call["rate_limit_wait"] = 0.0
+        for attempt in range(self.max_retries + 1):
+            call["rate_limit_wait"] += self.rate_limiter.acquire(estimated_tokens)
+            call["attempts"] = attempt + 1
+            self._count("requests")
+            try:
+                response = request()
+            except Exception as e:
+                # Text already passed to on_text cannot be taken back, so a stream that broke off is not retried
+                if not is_retryable_error(e) or attempt == self.max_retries or "time_to_first_token" in call:
+                    self._count("failures")
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self._count("retries")
+                if is_rate_limit_error(e):
+                    self._count("rate_limited")
+                    # A 429 means the whole account is over budget, so every caller pauses
+                    self.rate_limiter.back_off(delay)
+                    print(f"⚠️ Rate limited by the API, backing off {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                else:
+                    print(f"⚠️ API call failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                    time.sleep(delay)
+                continue
+            usage = getattr(response, "usage", None)
+            actual_tokens = getattr(usage, "total_tokens", None)
+            self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+            if actual_tokens:
+                self._count("total_tokens", actual_tokens)
+            return response
+
+    def create_json(self, label: str, schema_name: str, schema: Dict[str, Any],
+                    check: Optional[Callable[[Dict[str, Any]], List[str]]] = None,
+                    on_text: Optional[Callable[[str], Any]] = None, max_repairs: int = 2, **kwargs) -> Dict[str, Any]:
+        """Chat completion constrained to a JSON schema, returned parsed and validated.
+
+        A reply that fails validation, or check(data) for rules the schema cannot express, is sent
+        back with the errors for a corrected reply (traced as "<label>_repair"), up to max_repairs
+        times. The first attempt is streamed to on_text when given. Raises StructuredOutputError.
+        """
+        kwargs["response_format"] = response_format(schema_name, schema)
+        messages = list(kwargs.pop("messages"))
+        errors: List[str] = []
+        for attempt in range(max_repairs + 1):
+            if attempt == 0 and on_text:
+                response = self.stream(label, on_text=on_text, messages=messages, **kwargs)
+            else:
+                response = self.create(label if attempt == 0 else f"{label}_repair", messages=messages, **kwargs)
+            content = response.choices[0].message.content or ""
+            data, errors = parse_json_output(content, schema, check)
+            if not errors:
+                return data
+            if attempt < max_repairs:
+                self._count("repairs")
+                print(f"⚠️ {label} reply failed validation ({'; '.join(errors[:3])}), asking for a correction")
+                messages = messages + [{"role": "assistant", "content": content}, {"role": "user", "content": repair_prompt(errors)}]
+        raise StructuredOutputError(f"{label} reply does not match the {schema_name} schema: {'; '.join(errors[:5])}", errors)
+
+    def chat_completion(self, label: str = "chat_completion", **kwargs) -> str:
+        """Message content of a chat completion."""
+        return self.create(label, **kwargs).choices[0].message.content
@@ -0,0 +1,226 @@
+"""
+Page Selection
+Picks the pages of a comic worth a Vision call with a local, CPU-only scorer instead of
+fixed positions. Each page is measured on a small grayscale thumbnail (perceptual hash,
+ink/paper/edge density, lettering, panel gutters, colour) and classified, so covers, ads,
+pin-ups, credits and blank pages are skipped and near-duplicate pages (variant covers,
+repeated ads) are only counted once. The most informative story pages are then chosen
+across the whole issue within the per-comic page budget.
+
+Needs Pillow; without it the coordinator keeps the fixed strategic sampling.
+"""
+
+import io
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image, ImageFilter, ImageStat
+except ImportError:
+    Image = None
+
+PAGE_SELECTION_MODES = ("smart", "strategic")
+# Sampled coverage sends the selected pages to Vision; full coverage sends every page and
+# summarizes the issue in a tree (pages -> scenes -> issue) instead of selecting
+COVERAGE_MODES = ("sampled", "full")
+# Vision calls per comic unless the processor is given another budget
+DEFAULT_MAX_VISION_PAGES = 4
+
+# Longest edge of the thumbnail every measurement is taken on
+ANALYSIS_EDGE = 192
+# dHash grid: HASH_SIZE x HASH_SIZE bits; pages this many bits apart or closer are near-duplicates
+HASH_SIZE = 16
+NEAR_DUPLICATE_BITS = 24
+# Gray levels counted as ink and as paper, and the edge strength counted as detail
+INK_LEVEL = 80
+PAPER_LEVEL = 200
+EDGE_LEVEL = 40
+# A row or column whose gray levels span no more than this is uniform (a gutter or margin)
+GUTTER_RANGE = 24
+# Side of the square tiles checked for lettering (dark strokes on a light balloon)
+TEXT_TILE = 8
+
+# Order in which classes fill the budget once the story pages run out; blank pages never do
+FALLBACK_CLASSES = ("full_page", "text", "cover")
+
+class PageFeatures:
+    """Measurements of one page. error is set (and everything else left empty) if it could not be decoded."""
+
+    def __init__(self, index: int, dhash: Optional[int] = None, ink: float = 0.0, paper: float = 0.0,
+                 edges: float = 0.0, lettering: float = 0.0, saturation: float = 0.0, gutters: int = 0,
+                 contrast: float = 0.0, error: Optional[str] = None):
+        self.index = index
+        self.dhash = dhash
+        self.ink = ink
+        self.paper = paper
+        self.edges = edges
+        self.lettering = lettering
+        self.saturation = saturation
+        self.gutters = gutters
+        self.contrast = contrast
+        self.error = error
+
+    def to_dict(self) -> Dict[str, object]:
+        if self.error:
+            return {"page": self.index + 1, "error": self.error}
+        return {
+            "page": self.index + 1,
+            "ink": round(self.ink, 3),
+            "paper": round(self.paper, 3),
+            "edges": round(self.edges, 3),
+            "lettering": round(self.lettering, 3),
+            "saturation": round(self.saturation, 3),
+            "gutters": self.gutters
+        }
+
+def available() -> bool:
+    return Image is not None
+
+def _dhash(gray) -> int:
+    """Difference hash: one bit per horizontally adjacent pair of cells in a (HASH_SIZE + 1) x HASH_SIZE grid."""
+    cells = list(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = (bits << 1) | (cells[offset + col] > cells[offset + col + 1])
+    return bits
+
+def _uniform_runs(lines: List[List[int]]) -> int:
+    """Runs of uniform lines that lie inside the page rather than along its margins."""
+    length = len(lines)
+    margin = max(1, length // 25)
+    runs = 0
+    start = None
+    for i, line in enumerate(lines + [[0, 255]]):
+        if max(line) - min(line) <= GUTTER_RANGE:
+            if start is None:
+                start = i
+        elif start is not None:
+            if start > margin and i < length - margin:
+                runs += 1
+            start = None
+    return runs
+
+def _count_gutters(gray) -> int:
+    """Full-width and full-height gutters: story pages are split into tiers and panels, covers and ads are not."""
+    width, height = gray.size
+    pixels = list(gray.getdata())
+    rows = [pixels[y * width:(y + 1) * width] for y in range(height)]
+    columns = [pixels[x::width] for x in range(width)]
+    return _uniform_runs(rows) + _uniform_runs(columns)
+
+def _lettering(gray) -> float:
+    """Share of tiles that look like lettering: mostly light with sharp dark strokes."""
+    tiles = (gray.width // TEXT_TILE, gray.height // TEXT_TILE)
+    if not tiles[0] or not tiles[1]:
+        return 0.0
+    box = (0, 0, tiles[0] * TEXT_TILE, tiles[1] * TEXT_TILE)
+    # Per-tile mean and mean square (scaled to 0-255) give each tile's spread without a per-tile loop
+    means = gray.resize(tiles, Image.BOX, box=box).getdata()
+    squares = gray.point(lambda v: v * v // 255).resize(tiles, Image.BOX, box=box).getdata()
+    lettered = sum(1 for mean, square in zip(means, squares) if mean > 170 and square * 255 - mean * mean > 45 * 45)
+    return lettered / (tiles[0] * tiles[1])
+
+def page_features(index: int, image_bytes: bytes) -> PageFeatures:
+    """Measure one page on a small thumbnail. Decoding errors are recorded, not raised."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # Let the JPEG decoder downscale while decoding when it can
+            image.draft('RGB', (ANALYSIS_EDGE * 2, ANALYSIS_EDGE * 2))
+            image = image.convert('RGB')
+        image.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.BILINEAR)
+        gray = image.convert('L')
+    except Exception as e:
+        return PageFeatures(index, error=str(e))
+
+    pixels = gray.width * gray.height
+    histogram = gray.histogram()
+    edge_histogram = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    return PageFeatures(
+        index,
+        dhash=_dhash(gray),
+        ink=sum(histogram[:INK_LEVEL]) / pixels,
+        paper=sum(histogram[PAPER_LEVEL:]) / pixels,
+        edges=sum(edge_histogram[EDGE_LEVEL:]) / pixels,
+        lettering=_lettering(gray),
+        saturation=ImageStat.Stat(image.convert('HSV').getchannel('S')).mean[0] / 255,
+        gutters=_count_gutters(gray),
+        contrast=ImageStat.Stat(gray).stddev[0]
+    )
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def classify_page(features: PageFeatures, total_pages: int) -> str:
+    """story, cover, full_page (ad, pin-up or splash), text (credits, recap, letters) or blank."""
+    if features.error:
+        # Undecodable pages may still be fine for Vision, so they are kept as a last resort
+        return "full_page"
+    if features.contrast < 8 or features.edges < 0.01:
+        return "blank"
+    # Mostly paper, split by the blank lines between lines of type (or nearly empty)
+    if features.paper >= 0.6 and (features.gutters > 12 or features.paper >= 0.85):
+        return "text"
+    if features.gutters == 0:
+        return "cover" if features.index in (0, total_pages - 1) else "full_page"
+    return "story"
+
+def page_score(features: PageFeatures) -> float:
+    """How much story a Vision call on this page is likely to return: lettering, detail and panel count."""
+    if features.error:
+        return 0.0
+    return (0.45 * min(features.lettering / 0.25, 1.0)
+            + 0.35 * min(features.edges / 0.25, 1.0)
+            + 0.2 * min(features.gutters, 3) / 3)
+
+def select_pages(features: List[PageFeatures], budget: int) -> Dict[str, object]:
+    """Choose up to budget page indices, in page order.
+
+    The story pages are split into budget consecutive stretches and the best page of each
+    is taken, so the picks cover the whole issue; slots left over go to the best remaining
+    story pages, then to full-page art, text pages and covers. Of a set of near-duplicates
+    only the first is eligible.
+    """
+    total_pages = len(features)
+    classes = {f.index: classify_page(f, total_pages) for f in features}
+    scores = {f.index: page_score(f) for f in features}
+
+    duplicates = {}
+    seen = []
+    for f in features:
+        if f.dhash is None or classes[f.index] == "blank":
+            continue
+        original = next((s.index for s in seen if hamming(s.dhash, f.dhash) <= NEAR_DUPLICATE_BITS), None)
+        if original is None:
+            seen.append(f)
+        else:
+            duplicates[f.index] = original
+
+    eligible = [f.index for f in features if f.index not in duplicates and classes[f.index] != "blank"]
+    story = [i for i in eligible if classes[i] == "story"]
+    selected = []
+    if story and budget > 0:
+        stretches = min(budget, len(story))
+        for n in range(stretches):
+            stretch = story[n * len(story) // stretches:(n + 1) * len(story) // stretches]
+            selected.append(max(stretch, key=lambda i: scores[i]))
+    fill_order = sorted((i for i in story if i not in selected), key=lambda i: -scores[i])
+    for page_class in FALLBACK_CLASSES:
+        fill_order += sorted((i for i in eligible if classes[i] == page_class), key=lambda i: -scores[i])
+    selected += fill_order[:max(0, budget - len(selected))]
+
+    skipped: Dict[str, List[int]] = {}
+    for index in range(total_pages):
+        if index not in selected:
+            if index in duplicates:
+                reason = "near_duplicate"
+            else:
+                reason = "over_budget" if classes[index] == "story" else classes[index]
+            skipped.setdefault(reason, []).append(index + 1)
+    return {
+        "indices": sorted(selected),
+        "classes": classes,
+        "scores": scores,
+        "duplicates": duplicates,
+        "skipped": skipped
+    }
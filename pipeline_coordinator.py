@@ -9,26 +9,233 @@ import os
 import sys
 import json
 import time
+import uuid
+import hashlib
+import argparse
+import threading
 import subprocess
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from pathlib import Path
 
+from disk_cache import write_json_atomic
+from stage_scheduler import StageScheduler
+from script_sections import script_from_result
+from llm_client import COMPLETION_CACHE_MODES, COMPLETION_CACHE_ENV, count_calls
+from prompt_budget import DEFAULT_PROMPT_BUDGET_TOKENS, PROMPT_BUDGET_ENV
+from page_selection import COVERAGE_MODES, DEFAULT_MAX_VISION_PAGES, PAGE_SELECTION_MODES
+from tracing import (TRACE_ENV, Tracer, span, load_trace, write_chrome_trace, summarize_trace,
+                     format_trace_summary)
+
+PIPELINE_MODES = ("in-process", "subprocess")
+
+ARTIFACT_FILENAMES = {
+    "agent_1_output": "agent_1_output.json",
+    "agent_1_summary": "agent_1_output.md",
+    "agent_2_output": "agent_2_output.json",
+    "agent_2_summary": "agent_2_output.md",
+    "final_output": "final_output.json",
+    "final_summary": "final_output.md",
+}
+
+def schedule_competitor_analysis(scheduler: StageScheduler, script_editor, task_id: str = "competitor_analysis",
+                                 priority: int = -1) -> str:
+    """Add a competitor analysis task that any number of scheduled pipelines can depend on.
+    
+    The task always succeeds; a failed analysis is returned as an error dict, which the
+    recommendations step tolerates just like the sequential pipeline does.
+    """
+    def competitor_analysis():
+        try:
+            return script_editor.analyze_competitor_patterns()
+        except Exception as e:
+            return {"error": f"Competitive analysis failed: {e}"}
+    return scheduler.add_task(task_id, competitor_analysis, pool="api", priority=priority)
+
+def degraded_reasons(stage: str, output: Dict[str, Any]) -> List[str]:
+    """Why a stage's output holds stand-ins instead of real results (fallback script, placeholder page
+    analyses, failed competitor analysis, ...). Such stages are checkpointed but redone on resume."""
+    reasons = []
+    if stage == "agent_1":
+        story_analysis = output.get("story_analysis", {})
+        placeholder_pages = [str(page.get("page")) for page in story_analysis.get("page_analyses", [])
+                             if str(page.get("analysis", "")).startswith(("[MOCK ANALYSIS", "[ERROR]"))]
+        if placeholder_pages:
+            reasons.append(f"placeholder analysis of page(s) {', '.join(placeholder_pages)}")
+        if story_analysis.get("story_summary", {}).get("fallback"):
+            reasons.append("fallback story summary")
+        if (output.get("status") == "success_with_fallback_script"
+                or output.get("script_generation_result", {}).get("fallback_script_used")):
+            reasons.append("fallback script")
+    elif stage == "agent_2":
+        if "error" in output.get("competitive_analysis_results", {}):
+            reasons.append("competitive analysis failed")
+    else:
+        if str(output.get("validation_results", {}).get("validation_results_content", "")).startswith("Validation unavailable"):
+            reasons.append("validation failed")
+        if str(output.get("title_options", {}).get("title_options_content", "")).startswith("Title generation unavailable"):
+            reasons.append("title generation failed")
+    return reasons
+
+def pipeline_error(results: Dict[str, Any]) -> Any:
+    """The pipeline-level error, or the error of the stage that failed."""
+    if results.get("error"):
+        return results["error"]
+    for stage_data in results.get("stages", {}).values():
+        if not stage_data.get("success") and stage_data.get("error"):
+            return stage_data["error"]
+    return None
+
 class PipelineCoordinator:
-    def __init__(self, openai_api_key: str, competitor_data_path: str):
+    def __init__(self, openai_api_key: str, competitor_data_path: str, mode: str = "in-process",
+                 results_root: Optional[str] = None, client=None, script_editor=None, final_integrator=None,
+                 processor_options: Optional[Dict[str, Any]] = None, llm=None,
+                 requests_per_minute: int = 60, tokens_per_minute: Optional[int] = None,
+                 completion_cache: str = "off", prompt_budget_tokens: Optional[int] = None,
+                 pipeline_id: Optional[str] = None):
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}'. Expected one of: {', '.join(PIPELINE_MODES)}")
         self.openai_api_key = openai_api_key
         self.competitor_data_path = competitor_data_path
-        self.pipeline_id = f"pipeline_{int(time.time())}"
+        self.mode = mode
+        # Random suffix keeps pipelines started in the same second apart; passing an existing
+        # pipeline's id resumes it, reusing every stage whose inputs have not changed
+        self.pipeline_id = pipeline_id or f"pipeline_{int(time.time())}_{uuid.uuid4().hex[:8]}"
         self.results_dir = f"results_{self.pipeline_id}"
+        if results_root:
+            self.results_dir = os.path.join(results_root, self.results_dir)
+        
+        # Every stage writes to a fixed path inside this pipeline's results directory
+        self.artifact_paths = {
+            name: os.path.join(self.results_dir, filename)
+            for name, filename in ARTIFACT_FILENAMES.items()
+        }
+        self.manifest_path = os.path.join(self.results_dir, "manifest.json")
+        # Spans from this pipeline, including its subprocess agents, are appended here
+        self.trace_path = os.path.join(self.results_dir, "trace.jsonl")
+        self.chrome_trace_path = os.path.join(self.results_dir, "trace.json")
+        self.manifest = {
+            "pipeline_id": self.pipeline_id,
+            "created_at": time.time(),
+            "mode": mode,
+            "artifacts": {},
+            "stages": {}
+        }
+        self.resumed = self._load_manifest()
+        self.tracer = Tracer(self.trace_path)
+        # Digests of input files, each hashed once per pipeline run
+        self._input_digests: Dict[str, str] = {}
+        # LLM client stats of this pipeline's own calls (see llm_client.count_calls), apart from concurrent pipelines
+        self.call_counts: Dict[str, int] = {}
+        
+        # In-process agents are built once and share one OpenAI client and rate-limited LLM client;
+        # callers such as the batch coordinator may pass in agents that are shared across pipelines
+        self.client = client
+        self.llm = llm
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_cache = completion_cache
+        # Input tokens allowed per API call (0 disables trimming); None leaves the default
+        self.prompt_budget_tokens = prompt_budget_tokens
+        self.comic_processor = None
+        self.script_editor = script_editor
+        self.final_integrator = final_integrator
+        self.processor_options = processor_options or {}
         
         # Create results directory
         os.makedirs(self.results_dir, exist_ok=True)
+    
+    def _load_manifest(self) -> bool:
+        """Pick up the manifest of an earlier run of this pipeline id. Returns True when resuming."""
+        if not os.path.exists(self.manifest_path):
+            return False
+        with open(self.manifest_path, encoding='utf-8') as f:
+            previous = json.load(f)
+        self.manifest.update(previous)
+        self.manifest.setdefault("stages", {})
+        resumed_at = self.manifest.setdefault("resumed_at", [])
+        # Keep the earlier run's trace next to this run's, e.g. trace_run1.jsonl
+        if os.path.exists(self.trace_path):
+            os.replace(self.trace_path, os.path.join(self.results_dir, f"trace_run{len(resumed_at) + 1}.jsonl"))
+        resumed_at.append(time.time())
+        self.manifest["mode"] = self.mode
+        return True
+    
+    def build_agents(self):
+        """Create the three agents once, sharing a single OpenAI client and its connection pool."""
+        if self.comic_processor is not None:
+            return
+        from openai import OpenAI
+        from agent_1_comic_processor import ComicProcessorFixed
+        from agent_2_script_editor import ScriptEditor
+        from agent_3_final_integrator import FinalIntegrator
+        from llm_client import LLMClient, RateLimiter
+        from prompt_budget import PromptBudget
         
-    def run_agent(self, agent_script: str, args: list, stage_name: str) -> Dict[str, Any]:
-        """Run an agent and handle errors."""
+        if self.client is None:
+            self.client = OpenAI(api_key=self.openai_api_key)
+        if self.llm is None:
+            self.llm = LLMClient(self.client, RateLimiter(self.requests_per_minute, self.tokens_per_minute),
+                                 cache_mode=self.completion_cache, prompt_budget=PromptBudget(self.prompt_budget_tokens))
+        # The comic processor holds per-comic archive state, so it is never shared
+        self.comic_processor = ComicProcessorFixed(self.openai_api_key, client=self.client, llm=self.llm, **self.processor_options)
+        if self.script_editor is None:
+            self.script_editor = ScriptEditor(self.openai_api_key, self.competitor_data_path, client=self.client, llm=self.llm)
+        if self.final_integrator is None:
+            self.final_integrator = FinalIntegrator(self.openai_api_key, client=self.client, llm=self.llm)
+    
+    def run_stage(self, stage_func, stage_name: str, checkpoint: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+        """Run an in-process agent stage and handle errors, mirroring run_agent's result shape.
+        
+        checkpoint is the (stage, artifact) whose saved output a resumed pipeline reuses instead.
+        """
         print(f"\n{'='*60}")
         print(f"RUNNING {stage_name}")
         print(f"{'='*60}")
         
+        reused = self.reusable_output(*checkpoint) if checkpoint else None
+        if reused is not None:
+            return self._reused_stage_result(stage_name, reused)
+        
+        start_time = time.time()
+        try:
+            with span(stage_name, "stage"):
+                output = stage_func()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to run stage: {e}",
+                "duration": time.time() - start_time,
+                "stage": stage_name
+            }
+        duration = time.time() - start_time
+        
+        if "error" in output:
+            return {
+                "success": False,
+                "error": output["error"],
+                "duration": duration,
+                "stage": stage_name
+            }
+        
+        return {
+            "success": True,
+            "output": output,
+            "duration": duration,
+            "stage": stage_name
+        }
+        
+    def run_agent(self, agent_script: str, args: list, stage_name: str,
+                  checkpoint: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+        """Run an agent and handle errors. A resumed pipeline skips it if checkpoint (see run_stage) is reusable."""
+        print(f"\n{'='*60}")
+        print(f"RUNNING {stage_name}")
+        print(f"{'='*60}")
+        
+        if checkpoint and self.reusable_output(*checkpoint) is not None:
+            result = self._reused_stage_result(stage_name)
+            result["stdout"] = result["stderr"] = ""
+            return result
+        
         try:
             # Construct command
             cmd = [sys.executable, agent_script] + args
@@ -36,7 +243,12 @@ class PipelineCoordinator:
             
             # Run agent
             start_time = time.time()
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10 min timeout
+            env = dict(os.environ, **{COMPLETION_CACHE_ENV: self.completion_cache, TRACE_ENV: os.path.abspath(self.trace_path)})
+            if self.prompt_budget_tokens is not None:
+                env[PROMPT_BUDGET_ENV] = str(self.prompt_budget_tokens)
+            with span(stage_name, "stage", script=agent_script) as stage_span:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=600, env=env)  # 10 min timeout
+                stage_span["returncode"] = result.returncode
             end_time = time.time()
             
             if result.returncode != 0:
@@ -69,18 +281,12 @@ class PipelineCoordinator:
                 "stage": stage_name
             }
     
-    def find_latest_output_file(self, pattern: str) -> Optional[str]:
-        """Find the most recent output file matching pattern."""
-        try:
-            files = [f for f in os.listdir('.') if f.startswith(pattern) and f.endswith('.json')]
-            if not files:
-                return None
-            # Sort by modification time, return newest
-            files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-            return files[0]
-        except Exception as e:
-            print(f"Error finding output file: {e}")
-            return None
+    @staticmethod
+    def _reused_stage_result(stage_name: str, output: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        result = {"success": True, "duration": 0.0, "stage": stage_name, "resumed": True}
+        if output is not None:
+            result["output"] = output
+        return result
     
     def validate_inputs(self, cbr_path: str) -> Dict[str, Any]:
         """Validate all inputs before starting pipeline."""
@@ -98,16 +304,17 @@ class PipelineCoordinator:
         elif not self.competitor_data_path.lower().endswith('.csv'):
             issues.append(f"Invalid competitor data format. Expected .csv: {self.competitor_data_path}")
         
-        # Check agent scripts
+        # Check agent scripts (only launched by path in subprocess mode)
         required_agents = [
             "agent_1_comic_processor.py",
             "agent_2_script_editor.py", 
             "agent_3_final_integrator.py"
         ]
         
-        for agent in required_agents:
-            if not os.path.exists(agent):
-                issues.append(f"Agent script not found: {agent}")
+        if self.mode == "subprocess":
+            for agent in required_agents:
+                if not os.path.exists(agent):
+                    issues.append(f"Agent script not found: {agent}")
         
         # Check API key format (basic validation)
         if not self.openai_api_key.startswith('sk-'):
@@ -118,11 +325,14 @@ class PipelineCoordinator:
             "issues": issues
         }
     
-    def run_complete_pipeline(self, cbr_path: str, target_duration: int = 75) -> Dict[str, Any]:
-        """Run the complete three-agent pipeline."""
+    def _start_pipeline(self, cbr_path: str, target_duration: int) -> Dict[str, Any]:
+        """Validate inputs and open the manifest. Returns the pipeline results skeleton, or a failure result."""
         pipeline_start = time.time()
         
-        print(f"🚀 Starting Comic-to-YouTube Pipeline: {self.pipeline_id}")
+        if self.resumed:
+            print(f"🔁 Resuming Comic-to-YouTube Pipeline: {self.pipeline_id} (completed stages: {', '.join(self.manifest['stages']) or 'none'})")
+        else:
+            print(f"🚀 Starting Comic-to-YouTube Pipeline: {self.pipeline_id}")
         print(f"📁 Results will be saved to: {self.results_dir}")
         
         # Validate inputs
@@ -136,19 +346,500 @@ class PipelineCoordinator:
         
         print("✅ Input validation passed")
         
-        pipeline_results = {
+        self.manifest["cbr_file"] = cbr_path
+        self.manifest["target_duration"] = target_duration
+        self.write_manifest()
+        
+        return {
             "pipeline_id": self.pipeline_id,
             "start_time": pipeline_start,
             "cbr_file": cbr_path,
             "target_duration": target_duration,
+            "mode": self.mode,
+            "resumed": self.resumed,
             "stages": {}
         }
+    
+    def run_complete_pipeline(self, cbr_path: str, target_duration: int = 75) -> Dict[str, Any]:
+        """Run the complete three-agent pipeline."""
+        pipeline_results = self._start_pipeline(cbr_path, target_duration)
+        if "issues" in pipeline_results:
+            return pipeline_results
+        
+        with self.tracer.activate(), count_calls() as self.call_counts:
+            if self.mode == "in-process":
+                pipeline_results = self._run_in_process_pipeline(cbr_path, target_duration, pipeline_results)
+            else:
+                pipeline_results = self._run_subprocess_pipeline(cbr_path, target_duration, pipeline_results)
+        return self._attach_trace(pipeline_results)
+    
+    def _attach_trace(self, pipeline_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert the pipeline's trace to Chrome format and add its per-span summary to the results."""
+        self.tracer.close()
+        events = load_trace(self.trace_path)
+        if not events:
+            return pipeline_results
+        pipeline_results["trace"] = {
+            "jsonl_file": self.trace_path,
+            "chrome_trace_file": write_chrome_trace(events, self.chrome_trace_path),
+            "spans": len(events),
+            "summary": summarize_trace(events)
+        }
+        return pipeline_results
+    
+    def _finish_pipeline(self, pipeline_results: Dict[str, Any], final_output: str) -> Dict[str, Any]:
+        """Stamp a successful run with its end time and output locations."""
+        pipeline_end = time.time()
+        pipeline_results.update({
+            "success": True,
+            "end_time": pipeline_end,
+            "total_duration": pipeline_end - pipeline_results["start_time"],
+            "final_output_file": final_output,
+            "results_directory": self.results_dir,
+            "manifest_file": self.manifest_path
+        })
+        return pipeline_results
+    
+    def _save_json(self, data: Dict[str, Any], artifact_name: str) -> str:
+        path = self.artifact_paths[artifact_name]
+        with span(f"save_{artifact_name}", "io") as save, open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+            save["bytes"] = f.tell()
+        return path
+    
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _input_sha256(self, path: str) -> str:
+        if path not in self._input_digests:
+            with span("hash_input", "io", file=os.path.basename(path)):
+                self._input_digests[path] = self._file_sha256(path)
+        return self._input_digests[path]
+    
+    def stage_input_hash(self, stage: str) -> str:
+        """Content hash of everything a stage's output depends on: source files, earlier artifacts and settings."""
+        artifacts = self.manifest["artifacts"]
+        if stage == "agent_1":
+            # Processor settings such as the page selection change which pages are analyzed
+            inputs = {"cbr_file": self._input_sha256(self.manifest["cbr_file"]),
+                      "target_duration": self.manifest["target_duration"],
+                      "processor_options": {name: value for name, value in self.processor_options.items()
+                                            if isinstance(value, (str, int, float, bool))}}
+        elif stage == "agent_2":
+            inputs = {"agent_1_output": artifacts.get("agent_1_output", {}).get("sha256"),
+                      "competitor_data": self._input_sha256(self.competitor_data_path)}
+        else:
+            inputs = {"agent_1_output": artifacts.get("agent_1_output", {}).get("sha256"),
+                      "agent_2_output": artifacts.get("agent_2_output", {}).get("sha256"),
+                      "target_duration": self.manifest["target_duration"]}
+        return hashlib.sha256(json.dumps({"stage": stage, **inputs}, sort_keys=True).encode()).hexdigest()
+    
+    def record_artifacts(self, stage: str, artifact_names: list, output: Optional[Dict[str, Any]] = None) -> bool:
+        """Add a stage's artifacts and the hash of its inputs to the pipeline manifest.
+        
+        output is the stage's primary artifact (read back from disk when not given); a stage whose
+        output fell back is recorded as degraded, so a resumed run does it again.
+        Returns False if the primary artifact is missing.
+        """
+        for artifact_name in artifact_names:
+            path = self.artifact_paths[artifact_name]
+            if not os.path.exists(path):
+                continue
+            with span("hash_artifact", "io", artifact=artifact_name):
+                digest = self._file_sha256(path)
+            self.manifest["artifacts"][artifact_name] = {
+                "stage": stage,
+                "path": path,
+                "bytes": os.path.getsize(path),
+                "sha256": digest,
+                "recorded_at": time.time()
+            }
+        recorded = artifact_names[0] in self.manifest["artifacts"]
+        if recorded:
+            if output is None:
+                with open(self.artifact_paths[artifact_names[0]], encoding='utf-8') as f:
+                    output = json.load(f)
+            record = {
+                "input_hash": self.stage_input_hash(stage),
+                "artifacts": [name for name in artifact_names if name in self.manifest["artifacts"]],
+                "completed_at": time.time()
+            }
+            degraded = degraded_reasons(stage, output)
+            if degraded:
+                record["degraded"] = degraded
+                print(f"⚠️  {stage}: output fell back ({'; '.join(degraded)}), a resumed run will redo this stage")
+            self.manifest["stages"][stage] = record
+        self.write_manifest()
+        return recorded
+    
+    def reusable_output(self, stage: str, artifact_name: str) -> Optional[Dict[str, Any]]:
+        """A resumed stage's saved output, or None if the stage has to run again.
+        
+        The checkpoint is only reused when the stage's inputs hash the same as when it was
+        recorded, its output did not fall back, and none of its artifacts has been changed or removed since.
+        """
+        record = self.manifest["stages"].get(stage) if self.resumed else None
+        if record and record.get("degraded"):
+            print(f"🔁 {stage}: the last run fell back ({'; '.join(record['degraded'])}), running it again")
+            return None
+        if not record or record["input_hash"] != self.stage_input_hash(stage):
+            return None
+        for name in record["artifacts"]:
+            path = self.artifact_paths[name]
+            if not os.path.exists(path) or self._file_sha256(path) != self.manifest["artifacts"][name]["sha256"]:
+                return None
+        path = self.artifact_paths[artifact_name]
+        with span(f"load_{artifact_name}", "io"), open(path, encoding='utf-8') as f:
+            output = json.load(f)
+        print(f"⏭️  {stage}: inputs unchanged since the last run, reusing {path}")
+        return output
+    
+    def write_manifest(self):
+        """Persist the list of artifacts this pipeline has produced; written atomically so a crash leaves the last complete manifest to resume from."""
+        write_json_atomic(self.manifest_path, self.manifest, indent=2)
+    
+    def _run_in_process_pipeline(self, cbr_path: str, target_duration: int, pipeline_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Run all three agents in this process, handing Python dicts between stages."""
+        self.build_agents()
+        
+        # Stage 1: Comic Processor & Script Creator
+        try:
+            stage_1_result = self.run_stage(
+                lambda: self.comic_processor.process_comic_to_script_fixed(cbr_path, target_duration),
+                "AGENT 1: Comic Processor & Script Creator",
+                checkpoint=("agent_1", "agent_1_output")
+            )
+        finally:
+            self.comic_processor.cleanup()
+        agent_1_output = stage_1_result.pop("output", None)
+        pipeline_results["stages"]["agent_1"] = stage_1_result
+        
+        if not stage_1_result["success"]:
+            pipeline_results["success"] = False
+            pipeline_results["failed_at"] = "Agent 1"
+            return pipeline_results
+        if self._replay_failed(pipeline_results):
+            return pipeline_results
+        
+        agent_1_path = self._save_json(agent_1_output, "agent_1_output")
+        self.record_artifacts("agent_1", ["agent_1_output"], agent_1_output)
+        print(f"✅ Agent 1 completed successfully. Output: {agent_1_path}")
+        
+        # Stage 2: Script Editor & Competitive Analyst
+        stage_2_result = self.run_stage(
+            lambda: self.script_editor.review_agent_1_output(agent_1_output, agent_1_path),
+            "AGENT 2: Script Editor & Competitive Analyst",
+            checkpoint=("agent_2", "agent_2_output")
+        )
+        agent_2_output = stage_2_result.pop("output", None)
+        pipeline_results["stages"]["agent_2"] = stage_2_result
+        
+        if not stage_2_result["success"]:
+            pipeline_results["success"] = False
+            pipeline_results["failed_at"] = "Agent 2"
+            return pipeline_results
+        if self._replay_failed(pipeline_results):
+            return pipeline_results
+        
+        agent_2_path = self._save_json(agent_2_output, "agent_2_output")
+        self.record_artifacts("agent_2", ["agent_2_output"], agent_2_output)
+        print(f"✅ Agent 2 completed successfully. Output: {agent_2_path}")
+        
+        # Stage 3: Final Integration Specialist
+        stage_3_result = self.run_stage(
+            lambda: self.final_integrator.integrate_review(agent_2_output, agent_1_output, target_duration, agent_2_path),
+            "AGENT 3: Final Integration Specialist",
+            checkpoint=("agent_3", "final_output")
+        )
+        final_output = stage_3_result.pop("output", None)
+        pipeline_results["stages"]["agent_3"] = stage_3_result
+        
+        if not stage_3_result["success"]:
+            pipeline_results["success"] = False
+            pipeline_results["failed_at"] = "Agent 3"
+            return pipeline_results
+        if self._replay_failed(pipeline_results):
+            return pipeline_results
+        
+        final_path = self._save_json(final_output, "final_output")
+        self.record_artifacts("agent_3", ["final_output"], final_output)
+        print(f"✅ Agent 3 completed successfully. Output: {final_path}")
+        
+        return self._finish_pipeline(pipeline_results, final_path)
+    
+    def replay_miss_error(self) -> Optional[str]:
+        """An error if any of this pipeline's completions were missing from the replay cache.
+        
+        Agents fall back on failed calls, so misses are checked before a stage's output is saved
+        and checkpointed; otherwise a resumed run would reuse the placeholders.
+        """
+        misses = self.call_counts.get("replay_misses", 0)
+        return f"Replay mode: {misses} completion(s) were not in the cache" if misses else None
+    
+    def _replay_failed(self, pipeline_results: Dict[str, Any]) -> bool:
+        error = self.replay_miss_error()
+        if error:
+            pipeline_results.update(success=False, failed_at="Completion cache replay", error=error)
+        return bool(error)
+    
+    def schedule_pipeline(self, scheduler: StageScheduler, cbr_path: str, target_duration: int = 75,
+                          competitor_task: Optional[str] = None, priority: int = 0,
+                          on_finished: Optional[Callable[[Dict[str, Any]], None]] = None,
+                          on_pages_analyzed: Optional[Callable[[], None]] = None) -> str:
+        """Register this comic's work as fine-grained tasks on a shared scheduler (in-process agents only).
+        
+        Returns the id of a final task whose result is the usual pipeline results dict. Pass
+        competitor_task to share one competitor analysis task between several pipelines.
+        on_pages_analyzed is called once the comic no longer holds prepared page images: when
+        its Vision tasks have finished, or when they will not run (reused or failed earlier).
+        """
+        if self.mode != "in-process":
+            raise ValueError("Only in-process pipelines can be scheduled as tasks")
+        # Tasks run in the context they are added from, so registering them here routes their spans to this trace
+        with self.tracer.activate(), count_calls() as self.call_counts:
+            return self._schedule_pipeline_tasks(scheduler, cbr_path, target_duration, competitor_task, priority,
+                                                 on_finished, on_pages_analyzed)
+    
+    def _schedule_pipeline_tasks(self, scheduler: StageScheduler, cbr_path: str, target_duration: int,
+                                 competitor_task: Optional[str], priority: int,
+                                 on_finished: Optional[Callable[[Dict[str, Any]], None]],
+                                 on_pages_analyzed: Optional[Callable[[], None]]) -> str:
+        prefix = f"{self.pipeline_id}:"
+        finish_task = f"{prefix}finish"
+        pages_released = threading.Lock()
+        
+        def pages_analyzed():
+            # Called from several places (story, reuse, finish); only the first call is passed on
+            if on_pages_analyzed and pages_released.acquire(blocking=False):
+                on_pages_analyzed()
+        
+        pipeline_results = self._start_pipeline(cbr_path, target_duration)
+        if "issues" in pipeline_results:
+            pipeline_results["pipeline_id"] = self.pipeline_id
+            def report_invalid():
+                pages_analyzed()
+                if on_finished:
+                    on_finished(pipeline_results)
+                return pipeline_results
+            return scheduler.add_task(finish_task, report_invalid, pool="cpu", priority=priority)
+        
+        self.build_agents()
+        processor = self.comic_processor
+        state: Dict[str, Any] = {}
+        
+        def add(name: str, func: Callable[[], Any], deps=(), pool: str = "api", shared_deps=()) -> str:
+            return scheduler.add_task(f"{prefix}{name}", func, [f"{prefix}{dep}" for dep in deps] + list(shared_deps),
+                                      pool=pool, priority=priority)
+        
+        def checked(output: Dict[str, Any]) -> Dict[str, Any]:
+            if "error" in output:
+                raise RuntimeError(output["error"])
+            return output
+        
+        def save_checkpoint(output: Dict[str, Any], stage: str, artifact_name: str):
+            # Outputs built on replay misses are placeholders, so they fail the stage instead of being checkpointed
+            error = self.replay_miss_error()
+            if error:
+                raise RuntimeError(error)
+            self._save_json(output, artifact_name)
+            self.record_artifacts(stage, [artifact_name], output)
+        
+        # Agent 1: archive listing and page preparation are local work; Vision, summary and script are API calls
+        def extract():
+            state["image_paths"] = processor.extract_cbr_images_robust(cbr_path)
+            if not state["image_paths"]:
+                raise RuntimeError("No images found in CBR file after trying all extraction methods")
+        
+        def sample_pages():
+            page_sample = checked(processor.prepare_page_sample(state["image_paths"]))
+            # Everything still needed is in memory now, so release the archive (and any unar temp dir) early
+            if processor.archive:
+                processor.archive.close()
+            state["page_sample"] = page_sample
+            # One task per Vision request: a single page ("page:3"), or pages packed together ("page:3-6")
+            def page_task_name(paths):
+                first, last = (page_sample["page_numbers"][path] for path in (paths[0], paths[-1]))
+                return f"page:{first}" if first == last else f"page:{first}-{last}"
+            state["page_tasks"] = [
+                add(page_task_name(paths), lambda paths=paths: processor.analyze_sampled_pages(page_sample, paths), ["sample_pages"])
+                for paths in processor.page_groups(page_sample)
+            ]
+            scheduler.add_dependencies(f"{prefix}story", state["page_tasks"])
+        
+        def story():
+            pages_analyzed()
+            page_tasks = [scheduler.tasks[task_id] for task_id in state["page_tasks"]]
+            analysis_duration = (max(t.end_time for t in page_tasks) - min(t.start_time for t in page_tasks)) if page_tasks else 0.0
+            analyzed = {}
+            for task_id in state["page_tasks"]:
+                analyzed.update(scheduler.result(task_id))
+            # The prepared page images are not needed after this, so they are dropped with the sample
+            story_analysis = checked(processor.build_story_analysis(state.pop("page_sample"), analyzed, len(page_tasks), analysis_duration))
+            story_analysis["comic_filename"] = os.path.basename(cbr_path)
+            state["story_analysis"] = story_analysis
+        
+        # Agent 2's accuracy review only needs the script section, so it is added as soon as that has
+        # streamed in, overlapping the hook analysis and title suggestions Agent 1 is still writing
+        def review(script: str):
+            provisional_output = {"story_analysis": state["story_analysis"], "script_generation_result": {"script_section": script}}
+            scheduler.add_dependencies(f"{prefix}recommendations", [add("accuracy", lambda: accuracy(provisional_output))])
+        
+        def script():
+            script_result = processor.generate_youtube_script_fixed(state["story_analysis"], target_duration, on_script=review)
+            if f"{prefix}accuracy" not in scheduler.tasks:
+                review(script_result["script_section"])
+            state["agent_1_output"] = processor.build_processing_result(cbr_path, state["story_analysis"], script_result)
+            save_checkpoint(state["agent_1_output"], "agent_1", "agent_1_output")
+        
+        # A resumed pipeline reuses the checkpoints of leading stages whose inputs are unchanged
+        reused_agent_1 = self.reusable_output("agent_1", "agent_1_output")
+        reused_agent_2 = reused_agent_1 and self.reusable_output("agent_2", "agent_2_output")
+        reused_final = reused_agent_2 and self.reusable_output("agent_3", "final_output")
+        reused_stages = [stage for stage, output in
+                         (("agent_1", reused_agent_1), ("agent_2", reused_agent_2), ("agent_3", reused_final)) if output]
+        
+        def reuse_agent_1():
+            pages_analyzed()
+            state["agent_1_output"] = reused_agent_1
+            state["story_analysis"] = reused_agent_1["story_analysis"]
+            if not reused_agent_2:
+                review(script_from_result(reused_agent_1["script_generation_result"]))
+        
+        if reused_agent_1:
+            add("script", reuse_agent_1, pool="cpu")
+        else:
+            add("extract", extract, pool="cpu")
+            add("sample_pages", sample_pages, ["extract"], pool="cpu")
+            add("story", story, ["sample_pages"])
+            add("script", script, ["story"])
+        
+        # Agent 2: competitor analysis and accuracy review are independent; recommendations need both
+        def recommendations():
+            competitive_analysis = scheduler.result(competitor_task)
+            if "error" in competitive_analysis:
+                print(f"Warning: Competitive analysis error - {competitive_analysis['error']}")
+            recommendations_result = checked(self.script_editor.recommend_improvements(
+                state["agent_1_output"], state["accuracy_review"], competitive_analysis
+            ))
+            state["agent_2_output"] = self.script_editor.build_review(
+                state["agent_1_output"], self.artifact_paths["agent_1_output"],
+                competitive_analysis, state["accuracy_review"], recommendations_result
+            )
+            save_checkpoint(state["agent_2_output"], "agent_2", "agent_2_output")
+        
+        def accuracy(agent_1_output: Dict[str, Any]):
+            state["accuracy_review"] = checked(self.script_editor.review_script_accuracy(agent_1_output))
+        
+        def reuse_agent_2():
+            state["agent_2_output"] = reused_agent_2
+        
+        if reused_agent_2:
+            add("recommendations", reuse_agent_2, ["script"], pool="cpu")
+        else:
+            if competitor_task is None:
+                competitor_task = schedule_competitor_analysis(scheduler, self.script_editor, f"{prefix}competitor", priority)
+            add("recommendations", recommendations, ["script"], shared_deps=[competitor_task])
+        
+        # Agent 3: validation and titles only need the final script, so synthesis adds them as soon as
+        # that section has streamed in, and they run while the rest of the package is generated
+        def checks(script: str):
+            provisional_package = {"final_script": script, "target_duration": target_duration}
+            check_tasks = [
+                add("validation", lambda: self.final_integrator.validate_against_source(
+                    provisional_package, state["agent_2_output"], state["agent_1_output"])),
+                add("titles", lambda: self.final_integrator.generate_title_options(
+                    provisional_package, os.path.basename(cbr_path)))
+            ]
+            scheduler.add_dependencies(f"{prefix}integrate", check_tasks)
+        
+        def synthesis():
+            state["final_script_package"] = checked(self.final_integrator.synthesize_from_review(
+                state["agent_2_output"], state["agent_1_output"], target_duration, on_script=checks
+            ))
+            if f"{prefix}validation" not in scheduler.tasks:
+                checks(state["final_script_package"]["final_script"])
+        
+        def integrate():
+            final_output = self.final_integrator.build_final_output(
+                state["agent_2_output"], state["final_script_package"],
+                scheduler.result(f"{prefix}validation"), scheduler.result(f"{prefix}titles"),
+                self.artifact_paths["agent_2_output"]
+            )
+            save_checkpoint(final_output, "agent_3", "final_output")
+        
+        if reused_final:
+            add("integrate", lambda: None, ["recommendations"], pool="cpu")
+        else:
+            add("synthesis", synthesis, ["recommendations"])
+            add("integrate", integrate, ["synthesis"], pool="cpu")
+        
+        def finish():
+            pages_analyzed()
+            processor.cleanup()
+            results = self._attach_trace(self._collect_scheduled_results(scheduler, prefix, pipeline_results, reused_stages))
+            if on_finished:
+                on_finished(results)
+            return results
+        
+        stage_tasks = [task_id for task_id in scheduler.tasks if task_id.startswith(prefix)]
+        return scheduler.add_task(finish_task, finish, stage_tasks, pool="cpu", priority=priority, always_run=True)
+    
+    def _collect_scheduled_results(self, scheduler: StageScheduler, prefix: str, pipeline_results: Dict[str, Any],
+                                   reused_stages=()) -> Dict[str, Any]:
+        """Fold a scheduled pipeline's task outcomes into the per-agent stage results run_complete_pipeline reports."""
+        task_stages = {
+            "agent_1": ["extract", "sample_pages", "page:", "story", "script"],
+            "agent_2": ["competitor", "accuracy", "recommendations"],
+            "agent_3": ["synthesis", "validation", "titles", "integrate"],
+        }
+        stage_names = {"agent_1": "Agent 1", "agent_2": "Agent 2", "agent_3": "Agent 3"}
+        pipeline_tasks = [task for task_id, task in scheduler.tasks.items()
+                          if task_id.startswith(prefix) and task_id != f"{prefix}finish"]
+        
+        succeeded = True
+        for stage, names in task_stages.items():
+            tasks = [task for task in pipeline_tasks
+                     if any(task.task_id[len(prefix):].startswith(name) for name in names)]
+            started = [task for task in tasks if task.start_time is not None]
+            failed = [task for task in tasks if task.status == "failed"]
+            stage_result = {
+                "success": bool(tasks) and all(task.status == "done" for task in tasks),
+                "duration": (max(t.end_time for t in started) - min(t.start_time for t in started)) if started else 0.0,
+                "stage": stage_names[stage]
+            }
+            if failed:
+                stage_result["error"] = failed[0].error
+            if stage in reused_stages:
+                stage_result["resumed"] = True
+            pipeline_results["stages"][stage] = stage_result
+            if not stage_result["success"]:
+                succeeded = False
+                pipeline_results["success"] = False
+                pipeline_results["failed_at"] = stage_names[stage]
+                break
+        
+        pipeline_results["tasks"] = scheduler.summary(prefix)["tasks"]
+        if not succeeded:
+            pipeline_results["end_time"] = time.time()
+            pipeline_results["total_duration"] = pipeline_results["end_time"] - pipeline_results["start_time"]
+            return pipeline_results
+        return self._finish_pipeline(pipeline_results, self.artifact_paths["final_output"])
+    
+    def _run_subprocess_pipeline(self, cbr_path: str, target_duration: int, pipeline_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Run each agent as its own Python subprocess, handing off through coordinator-chosen files."""
+        paths = self.artifact_paths
         
         # Stage 1: Comic Processor & Script Creator
         stage_1_result = self.run_agent(
             "agent_1_comic_processor.py",
-            [cbr_path, self.openai_api_key, str(target_duration)],
-            "AGENT 1: Comic Processor & Script Creator"
+            [cbr_path, self.openai_api_key, str(target_duration), paths["agent_1_output"]],
+            "AGENT 1: Comic Processor & Script Creator",
+            checkpoint=("agent_1", "agent_1_output")
         )
         
         pipeline_results["stages"]["agent_1"] = stage_1_result
@@ -158,20 +849,20 @@ class PipelineCoordinator:
             pipeline_results["failed_at"] = "Agent 1"
             return pipeline_results
         
-        # Find Agent 1 output file
-        agent_1_output = self.find_latest_output_file("agent_1_output_")
-        if not agent_1_output:
+        if not self.record_artifacts("agent_1", ["agent_1_output", "agent_1_summary"]):
             pipeline_results["success"] = False
-            pipeline_results["error"] = "Could not find Agent 1 output file"
+            pipeline_results["failed_at"] = "Agent 1"
+            pipeline_results["error"] = f"Agent 1 did not write its output file: {paths['agent_1_output']}"
             return pipeline_results
         
-        print(f"✅ Agent 1 completed successfully. Output: {agent_1_output}")
+        print(f"✅ Agent 1 completed successfully. Output: {paths['agent_1_output']}")
         
         # Stage 2: Script Editor & Competitive Analyst
         stage_2_result = self.run_agent(
             "agent_2_script_editor.py",
-            [agent_1_output, self.competitor_data_path, self.openai_api_key],
-            "AGENT 2: Script Editor & Competitive Analyst"
+            [paths["agent_1_output"], self.competitor_data_path, self.openai_api_key, paths["agent_2_output"]],
+            "AGENT 2: Script Editor & Competitive Analyst",
+            checkpoint=("agent_2", "agent_2_output")
         )
         
         pipeline_results["stages"]["agent_2"] = stage_2_result
@@ -181,20 +872,20 @@ class PipelineCoordinator:
             pipeline_results["failed_at"] = "Agent 2"
             return pipeline_results
         
-        # Find Agent 2 output file
-        agent_2_output = self.find_latest_output_file("agent_2_output_")
-        if not agent_2_output:
+        if not self.record_artifacts("agent_2", ["agent_2_output", "agent_2_summary"]):
             pipeline_results["success"] = False
-            pipeline_results["error"] = "Could not find Agent 2 output file"
+            pipeline_results["failed_at"] = "Agent 2"
+            pipeline_results["error"] = f"Agent 2 did not write its output file: {paths['agent_2_output']}"
             return pipeline_results
         
-        print(f"✅ Agent 2 completed successfully. Output: {agent_2_output}")
+        print(f"✅ Agent 2 completed successfully. Output: {paths['agent_2_output']}")
         
         # Stage 3: Final Integration Specialist
         stage_3_result = self.run_agent(
             "agent_3_final_integrator.py",
-            [agent_2_output, self.openai_api_key, str(target_duration)],
-            "AGENT 3: Final Integration Specialist"
+            [paths["agent_2_output"], self.openai_api_key, paths["final_output"], paths["final_summary"], str(target_duration)],
+            "AGENT 3: Final Integration Specialist",
+            checkpoint=("agent_3", "final_output")
         )
         
         pipeline_results["stages"]["agent_3"] = stage_3_result
@@ -204,37 +895,15 @@ class PipelineCoordinator:
             pipeline_results["failed_at"] = "Agent 3"
             return pipeline_results
         
-        # Find final output file
-        final_output = self.find_latest_output_file("final_output_")
-        if not final_output:
+        if not self.record_artifacts("agent_3", ["final_output", "final_summary"]):
             pipeline_results["success"] = False
-            pipeline_results["error"] = "Could not find final output file"
+            pipeline_results["failed_at"] = "Agent 3"
+            pipeline_results["error"] = f"Agent 3 did not write its output file: {paths['final_output']}"
             return pipeline_results
         
-        print(f"✅ Agent 3 completed successfully. Output: {final_output}")
-        
-        # Copy results to results directory
-        try:
-            import shutil
-            shutil.copy(agent_1_output, os.path.join(self.results_dir, "agent_1_output.json"))
-            shutil.copy(agent_2_output, os.path.join(self.results_dir, "agent_2_output.json"))
-            shutil.copy(final_output, os.path.join(self.results_dir, "final_output.json"))
-        except Exception as e:
-            print(f"Warning: Could not copy results to results directory: {e}")
-        
-        # Calculate total pipeline time
-        pipeline_end = time.time()
-        total_duration = pipeline_end - pipeline_start
+        print(f"✅ Agent 3 completed successfully. Output: {paths['final_output']}")
         
-        pipeline_results.update({
-            "success": True,
-            "end_time": pipeline_end,
-            "total_duration": total_duration,
-            "final_output_file": final_output,
-            "results_directory": self.results_dir
-        })
-        
-        return pipeline_results
+        return self._finish_pipeline(pipeline_results, paths["final_output"])
     
     def generate_pipeline_report(self, pipeline_results: Dict[str, Any]) -> str:
         """Generate a comprehensive pipeline execution report."""
@@ -244,11 +913,12 @@ class PipelineCoordinator:
 COMIC-TO-YOUTUBE SCRIPT PIPELINE REPORT
 {'='*80}
 
-Pipeline ID: {pipeline_results.get('pipeline_id', 'Unknown')}
+Pipeline ID: {pipeline_results.get('pipeline_id', 'Unknown')}{' (resumed)' if pipeline_results.get('resumed') else ''}
 Source CBR: {pipeline_results.get('cbr_file', 'Unknown')}
 Target Duration: {pipeline_results.get('target_duration', 'Unknown')} seconds
 
 EXECUTION SUMMARY:
+Mode: {pipeline_results.get('mode', 'Unknown')}
 Status: {'SUCCESS' if pipeline_results.get('success') else 'FAILED'}
 Total Duration: {pipeline_results.get('total_duration', 0):.2f} seconds
 """
@@ -262,7 +932,7 @@ Total Duration: {pipeline_results.get('total_duration', 0):.2f} seconds
         
         stages = pipeline_results.get('stages', {})
         for stage_name, stage_data in stages.items():
-            status = "SUCCESS" if stage_data.get('success') else "FAILED"
+            status = "REUSED" if stage_data.get('resumed') else "SUCCESS" if stage_data.get('success') else "FAILED"
             duration = stage_data.get('duration', 0)
             report += f"  {stage_name}: {status} ({duration:.2f}s)\n"
             
@@ -272,23 +942,64 @@ Total Duration: {pipeline_results.get('total_duration', 0):.2f} seconds
         if pipeline_results.get('success'):
             report += f"\nFINAL OUTPUT: {pipeline_results.get('final_output_file', 'Not found')}\n"
             report += f"RESULTS SAVED TO: {pipeline_results.get('results_directory', 'Not saved')}\n"
+            report += f"ARTIFACT MANIFEST: {pipeline_results.get('manifest_file', 'Not written')}\n"
+        
+        trace = pipeline_results.get('trace')
+        if trace:
+            report += f"\nTRACE SUMMARY ({trace['spans']} spans, timeline: {trace['chrome_trace_file']}):\n"
+            report += format_trace_summary(trace['summary'])
         
         report += "\n" + "="*80
         
         return report
 
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python pipeline_coordinator.py <cbr_file> <competitor_data.csv> <openai_api_key> [target_duration]")
-        print("Example: python pipeline_coordinator.py comic.cbr competitor_data.csv sk-... 75")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Run the comic-to-YouTube script pipeline.",
+        epilog="Example: python pipeline_coordinator.py comic.cbr competitor_data.csv sk-... 75"
+    )
+    parser.add_argument("cbr_file")
+    parser.add_argument("competitor_data")
+    parser.add_argument("api_key")
+    parser.add_argument("target_duration", nargs="?", type=int, default=75)
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default="in-process",
+                        help="Run agents in this process (default) or as one subprocess per agent")
+    parser.add_argument("--requests-per-minute", type=int, default=60,
+                        help="API request budget shared by all agents (in-process mode)")
+    parser.add_argument("--tokens-per-minute", type=int, default=None,
+                        help="API token budget shared by all agents (in-process mode, default: unlimited)")
+    parser.add_argument("--completion-cache", choices=COMPLETION_CACHE_MODES, default="off",
+                        help="Reuse identical completions from .cache/completions (on), or only replay cached ones and fail on a miss (replay)")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET_TOKENS,
+                        help="Input tokens allowed per API call; longer prompts have their least important sections condensed or trimmed (0: no limit)")
+    parser.add_argument("--page-selection", choices=PAGE_SELECTION_MODES, default="smart",
+                        help="Score every page locally and send the most informative story pages to Vision (smart), or sample fixed positions (in-process mode)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_VISION_PAGES,
+                        help="Vision calls per comic (in-process mode)")
+    parser.add_argument("--pages-per-request", type=int, default=1,
+                        help="Pages packed into each Vision request, cutting request count under per-minute caps (in-process mode)")
+    parser.add_argument("--coverage", choices=COVERAGE_MODES, default="sampled",
+                        help="Analyze selected pages (sampled), or every page with a cheaper pass summarized pages -> scenes -> issue (full, in-process mode)")
+    parser.add_argument("--resume", metavar="PIPELINE_ID", default=None,
+                        help="Continue an earlier pipeline in its results directory, skipping every stage whose inputs have not changed")
+    args = parser.parse_args()
+    
+    if args.resume and not os.path.exists(os.path.join(f"results_{args.resume}", "manifest.json")):
+        parser.error(f"no manifest found for pipeline {args.resume} (expected results_{args.resume}/manifest.json)")
     
-    cbr_file = sys.argv[1]
-    competitor_data = sys.argv[2]
-    api_key = sys.argv[3]
-    target_duration = int(sys.argv[4]) if len(sys.argv) > 4 else 75
+    cbr_file = args.cbr_file
+    target_duration = args.target_duration
     
-    coordinator = PipelineCoordinator(api_key, competitor_data)
+    coordinator = PipelineCoordinator(args.api_key, args.competitor_data, mode=args.mode,
+                                      requests_per_minute=args.requests_per_minute,
+                                      tokens_per_minute=args.tokens_per_minute,
+                                      completion_cache=args.completion_cache,
+                                      prompt_budget_tokens=args.prompt_budget,
+                                      processor_options={"page_selection": args.page_selection,
+                                                         "max_vision_pages": args.max_pages,
+                                                         "pages_per_request": args.pages_per_request,
+                                                         "coverage": args.coverage},
+                                      pipeline_id=args.resume)
     
     try:
         results = coordinator.run_complete_pipeline(cbr_file, target_duration)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Pipeline Service
+Long-running worker that keeps the OpenAI client, the rate-limited LLM client, the
+ScriptEditor (with its competitor analysis) and the FinalIntegrator warm, and runs comics
+submitted over a local HTTP API (TCP or Unix socket) through the in-process pipeline.
+
+Jobs wait in a priority queue (lowest priority value first, then in submission order) and
+their status is persisted in jobs.json, so jobs that were queued or running when the
+service stopped are picked up again on restart, resuming their pipelines.
+
+API:
+  POST   /jobs              {"cbr_file": "...", "target_duration": 75, "priority": 0} -> 202 with the job
+  GET    /jobs              every job, newest first (?status=queued to filter)
+  GET    /jobs/<id>         one job's status
+  GET    /jobs/<id>/result  the final output of a successful job
+  DELETE /jobs/<id>         cancel a queued job
+  GET    /health            queue depth, competitor analysis state and API call stats
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from pipeline_coordinator import PipelineCoordinator, pipeline_error
+from disk_cache import write_json_atomic
+from llm_client import COMPLETION_CACHE_MODES
+from prompt_budget import DEFAULT_PROMPT_BUDGET_TOKENS
+from page_selection import COVERAGE_MODES, DEFAULT_MAX_VISION_PAGES, PAGE_SELECTION_MODES
+from tracing import Tracer
+
+JOB_STATUSES = ("queued", "running", "success", "failed", "cancelled")
+# Jobs in these states are run again (resuming their pipelines) when the service restarts
+UNFINISHED_STATUSES = ("queued", "running")
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix socket, one thread per connection."""
+    daemon_threads = True
+
+class PipelineService:
+    def __init__(self, openai_api_key: str, competitor_data_path: str, results_dir: str = "results_service",
+                 job_workers: int = 2, extraction_workers: int = 2, requests_per_minute: int = 60,
+                 tokens_per_minute: Optional[int] = None, completion_cache: str = "off",
+                 prompt_budget_tokens: Optional[int] = None, page_selection: str = "smart",
+                 max_vision_pages: int = DEFAULT_MAX_VISION_PAGES, pages_per_request: int = 1,
+                 coverage: str = "sampled"):
+        self.openai_api_key = openai_api_key
+        self.competitor_data_path = competitor_data_path
+        self.results_dir = results_dir
+        self.job_workers = max(1, job_workers)
+        self.extraction_workers = max(1, extraction_workers)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_cache = completion_cache
+        self.prompt_budget_tokens = prompt_budget_tokens
+        self.page_selection = page_selection
+        self.max_vision_pages = max_vision_pages
+        self.pages_per_request = pages_per_request
+        self.coverage = coverage
+        self.status_path = os.path.join(results_dir, "jobs.json")
+        # Agent setup and the competitor analysis are traced here; each job's pipeline has its own trace
+        self.tracer = Tracer(os.path.join(results_dir, "service_trace.jsonl"))
+        self.started_at = time.time()
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._jobs_lock = threading.Lock()
+        self._queue: "queue.PriorityQueue[Tuple[int, int, str]]" = queue.PriorityQueue()
+        self._sequence = 0
+        self.competitor_analysis_state = "pending"
+
+        # Built once and shared by every job
+        self.client = None
+        self.llm = None
+        self.script_editor = None
+        self.final_integrator = None
+        self.processor_options: Dict[str, Any] = {}
+
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def build_shared_agents(self):
+        """Build the OpenAI client, LLM client, ScriptEditor and FinalIntegrator every job shares, and import agent 1."""
+        from openai import OpenAI
+        from llm_client import LLMClient, RateLimiter
+        from prompt_budget import PromptBudget
+        from agent_2_script_editor import ScriptEditor
+        from agent_3_final_integrator import FinalIntegrator
+        # Imported here so the first job does not pay for it
+        import agent_1_comic_processor  # noqa: F401
+
+        self.client = OpenAI(api_key=self.openai_api_key)
+        self.llm = LLMClient(self.client, RateLimiter(self.requests_per_minute, self.tokens_per_minute),
+                             cache_mode=self.completion_cache, prompt_budget=PromptBudget(self.prompt_budget_tokens))
+        self.script_editor = ScriptEditor(self.openai_api_key, self.competitor_data_path, client=self.client, llm=self.llm)
+        self.final_integrator = FinalIntegrator(self.openai_api_key, client=self.client, llm=self.llm)
+        self.processor_options = {
+            "extraction_slots": threading.BoundedSemaphore(self.extraction_workers),
+            "page_selection": self.page_selection,
+            "max_vision_pages": self.max_vision_pages,
+            "pages_per_request": self.pages_per_request,
+            "coverage": self.coverage
+        }
+
+    def warm_competitor_analysis(self):
+        """Run (or load from cache) the competitor analysis before the first job needs it.
+
+        Jobs that start meanwhile wait on the ScriptEditor's analysis lock and then share the result.
+        """
+        self.competitor_analysis_state = "warming"
+        try:
+            with self.tracer.activate():
+                analysis = self.script_editor.analyze_competitor_patterns()
+        except Exception as e:
+            analysis = {"error": f"Competitive analysis failed: {e}"}
+        if analysis.get("error"):
+            print(f"⚠️  Competitor analysis warm-up failed, jobs will retry it: {analysis['error']}")
+            self.competitor_analysis_state = "error"
+        else:
+            print("✅ Competitor analysis ready")
+            self.competitor_analysis_state = "ready"
+
+    def _write_status(self):
+        """Persist every job's status, atomically so a crash never leaves truncated JSON to restart from. Callers hold _jobs_lock."""
+        write_json_atomic(self.status_path, self.jobs, indent=2)
+
+    def _update_job(self, job_id: str, **fields) -> Dict[str, Any]:
+        with self._jobs_lock:
+            self.jobs[job_id].update(fields)
+            self._write_status()
+            return dict(self.jobs[job_id])
+
+    def _enqueue(self, job: Dict[str, Any]):
+        """Queue a job. Callers hold _jobs_lock."""
+        self._sequence += 1
+        job["sequence"] = self._sequence
+        self._queue.put((job["priority"], self._sequence, job["job_id"]))
+
+    def load_jobs(self) -> int:
+        """Load the jobs of an earlier run and queue those it had not finished. Returns how many were queued."""
+        if not os.path.exists(self.status_path):
+            return 0
+        with open(self.status_path, encoding='utf-8') as f:
+            previous = json.load(f)
+        with self._jobs_lock:
+            self.jobs.update(previous)
+            unfinished = sorted((job for job in self.jobs.values() if job.get("status") in UNFINISHED_STATUSES),
+                                key=lambda job: (job["priority"], job.get("sequence", 0)))
+            for job in unfinished:
+                # A job that was running keeps its pipeline id, so its finished stages are reused
+                job["status"] = "queued"
+                self._enqueue(job)
+            self._write_status()
+        return len(unfinished)
+
+    def submit(self, cbr_file: str, target_duration: int = 75, priority: int = 0) -> Dict[str, Any]:
+        """Queue a comic and return its job record."""
+        job_id = f"job_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        job = {
+            "job_id": job_id,
+            "cbr_file": cbr_file,
+            "target_duration": target_duration,
+            "priority": priority,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "pipeline_id": None
+        }
+        with self._jobs_lock:
+            self.jobs[job_id] = job
+            self._enqueue(job)
+            self._write_status()
+        print(f"📥 Queued {job_id}: {os.path.basename(cbr_file)} (priority {priority})")
+        return self.get_job(job_id)
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1 for the next job to run, or None if the job is not queued. Callers hold _jobs_lock."""
+        job = self.jobs[job_id]
+        if job["status"] != "queued":
+            return None
+        key = (job["priority"], job["sequence"])
+        return 1 + sum(1 for other in self.jobs.values()
+                       if other["status"] == "queued" and (other["priority"], other["sequence"]) < key)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._jobs_lock:
+            if job_id not in self.jobs:
+                return None
+            job = dict(self.jobs[job_id])
+            job["queue_position"] = self.queue_position(job_id)
+            return job
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._jobs_lock:
+            job_ids = [job_id for job_id, job in self.jobs.items() if status is None or job["status"] == status]
+        jobs = [self.get_job(job_id) for job_id in job_ids]
+        return sorted(jobs, key=lambda job: job["submitted_at"], reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job; running and finished jobs are left as they are. None if there is no such job."""
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                # Its queue entry stays behind and is skipped when a worker picks it up
+                job.update(status="cancelled", finished_at=time.time())
+                self._write_status()
+        return self.get_job(job_id)
+
+    def job_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The final output of a successful job, or None."""
+        job = self.get_job(job_id)
+        if not job or job["status"] != "success" or not job.get("final_output_file"):
+            return None
+        with open(job["final_output_file"], encoding='utf-8') as f:
+            return json.load(f)
+
+    def run_job(self, job_id: str):
+        with self._jobs_lock:
+            job = self.jobs[job_id]
+            if job["status"] != "queued":
+                return
+            job.update(status="running", started_at=time.time())
+            self._write_status()
+            cbr_file, target_duration, pipeline_id = job["cbr_file"], job["target_duration"], job.get("pipeline_id")
+
+        print(f"🚀 Running {job_id}: {os.path.basename(cbr_file)}")
+        job_start = time.time()
+        coordinator = None
+        try:
+            coordinator = PipelineCoordinator(
+                self.openai_api_key, self.competitor_data_path, mode="in-process",
+                results_root=self.results_dir, client=self.client,
+                script_editor=self.script_editor, final_integrator=self.final_integrator,
+                processor_options=self.processor_options, llm=self.llm,
+                completion_cache=self.completion_cache, prompt_budget_tokens=self.prompt_budget_tokens,
+                pipeline_id=pipeline_id
+            )
+            self._update_job(job_id, pipeline_id=coordinator.pipeline_id, results_directory=coordinator.results_dir)
+            results = coordinator.run_complete_pipeline(cbr_file, target_duration)
+            with open(os.path.join(coordinator.results_dir, "pipeline_report.txt"), 'w', encoding='utf-8') as f:
+                f.write(coordinator.generate_pipeline_report(results))
+        except Exception as e:
+            results = {"success": False, "error": f"Pipeline coordinator error: {e}"}
+
+        job = self._update_job(
+            job_id,
+            status="success" if results.get("success") else "failed",
+            finished_at=time.time(),
+            duration=time.time() - job_start,
+            resumed=bool(coordinator and coordinator.resumed),
+            final_output_file=results.get("final_output_file"),
+            failed_at=results.get("failed_at"),
+            error=pipeline_error(results),
+            issues=results.get("issues", [])
+        )
+        icon = "✅" if job["status"] == "success" else "❌"
+        print(f"{icon} {job_id}: {job['status']} in {job['duration']:.1f}s")
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                self.run_job(job_id)
+            except Exception as e:
+                print(f"❌ {job_id}: unexpected service error: {e}")
+                self._update_job(job_id, status="failed", finished_at=time.time(), error=f"Unexpected service error: {e}")
+
+    def start(self):
+        """Build the shared agents, pick up unfinished jobs and start the job workers and competitor warm-up."""
+        with self.tracer.activate():
+            self.build_shared_agents()
+        requeued = self.load_jobs()
+        if requeued:
+            print(f"🔁 Requeued {requeued} unfinished job(s) from {self.status_path}")
+        threading.Thread(target=self.warm_competitor_analysis, name="competitor-warmup", daemon=True).start()
+        for n in range(self.job_workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{n + 1}", daemon=True).start()
+
+    def health(self) -> Dict[str, Any]:
+        with self._jobs_lock:
+            counts = {status: sum(1 for job in self.jobs.values() if job["status"] == status) for status in JOB_STATUSES}
+        health = {
+            "status": "ok",
+            "uptime": time.time() - self.started_at,
+            "job_workers": self.job_workers,
+            "jobs": counts,
+            "competitor_analysis": self.competitor_analysis_state
+        }
+        if self.llm:
+            health["api_calls"] = dict(self.llm.stats)
+            health["prompt_budget"] = dict(self.llm.prompt_budget.stats)
+        return health
+
+    def handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Any):
+                body = json.dumps(payload, indent=2).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_error(self, status: int, message: str):
+                self._send_json(status, {"error": message})
+
+            def _route(self) -> Tuple[List[str], Dict[str, List[str]]]:
+                url = urlsplit(self.path)
+                return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+            def do_GET(self):
+                parts, query = self._route()
+                if parts == ["health"]:
+                    self._send_json(200, service.health())
+                elif parts == ["jobs"]:
+                    status = query.get("status", [None])[0]
+                    if status is not None and status not in JOB_STATUSES:
+                        self._send_error(400, f"Unknown status '{status}'. Expected one of: {', '.join(JOB_STATUSES)}")
+                        return
+                    self._send_json(200, {"jobs": service.list_jobs(status)})
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    job = service.get_job(parts[1])
+                    if job is None:
+                        self._send_error(404, f"No job {parts[1]}")
+                    else:
+                        self._send_json(200, job)
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                    job = service.get_job(parts[1])
+                    if job is None:
+                        self._send_error(404, f"No job {parts[1]}")
+                    elif job["status"] != "success":
+                        self._send_json(409, {"error": f"Job is {job['status']}, no result available", "job": job})
+                    else:
+                        try:
+                            self._send_json(200, {"job_id": job["job_id"], "final_output": service.job_result(parts[1])})
+                        except (OSError, json.JSONDecodeError) as e:
+                            self._send_error(500, f"Could not read final output: {e}")
+                else:
+                    self._send_error(404, f"Unknown path {self.path}")
+
+            def do_POST(self):
+                parts, _ = self._route()
+                if parts != ["jobs"]:
+                    self._send_error(404, f"Unknown path {self.path}")
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                except (ValueError, json.JSONDecodeError):
+                    self._send_error(400, "Invalid JSON body")
+                    return
+                if not isinstance(request, dict):
+                    self._send_error(400, "Expected a JSON object")
+                    return
+                cbr_file = request.get("cbr_file")
+                target_duration = request.get("target_duration", 75)
+                priority = request.get("priority", 0)
+                if not isinstance(cbr_file, str) or not os.path.isfile(cbr_file):
+                    self._send_error(400, f"cbr_file must be the path of a comic file on the service host: {cbr_file!r}")
+                elif not isinstance(target_duration, int) or isinstance(target_duration, bool) or target_duration <= 0:
+                    self._send_error(400, "target_duration must be a positive number of seconds")
+                elif not isinstance(priority, int) or isinstance(priority, bool):
+                    self._send_error(400, "priority must be an integer (lower runs first)")
+                else:
+                    self._send_json(202, service.submit(os.path.abspath(cbr_file), target_duration, priority))
+
+            def do_DELETE(self):
+                parts, _ = self._route()
+                if len(parts) != 2 or parts[0] != "jobs":
+                    self._send_error(404, f"Unknown path {self.path}")
+                    return
+                job = service.cancel(parts[1])
+                if job is None:
+                    self._send_error(404, f"No job {parts[1]}")
+                elif job["status"] != "cancelled":
+                    self._send_json(409, {"error": f"Job is {job['status']}, only queued jobs can be cancelled", "job": job})
+                else:
+                    self._send_json(200, job)
+
+        return Handler
+
+    def make_server(self, host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None):
+        """An HTTP server for the API, on a Unix socket when socket_path is given, else on host:port."""
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            return ThreadingUnixHTTPServer(socket_path, self.handler_class())
+        httpd = ThreadingHTTPServer((host, port), self.handler_class())
+        httpd.daemon_threads = True
+        return httpd
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the comic-to-YouTube script pipeline to local clients with a job queue.",
+        epilog='Example: python pipeline_service.py competitor_data.csv sk-... --port 8765 --job-workers 2'
+    )
+    parser.add_argument("competitor_data")
+    parser.add_argument("api_key")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--results-dir", default="results_service",
+                        help="Where job status (jobs.json) and every job's pipeline results are kept")
+    parser.add_argument("--job-workers", type=int, default=2, help="Comics run at once")
+    parser.add_argument("--extraction-workers", type=int, default=2,
+                        help="Comic archives decoded at once across all jobs")
+    parser.add_argument("--requests-per-minute", type=int, default=60,
+                        help="API request budget shared by every job")
+    parser.add_argument("--tokens-per-minute", type=int, default=None,
+                        help="API token budget shared by every job (default: unlimited)")
+    parser.add_argument("--completion-cache", choices=COMPLETION_CACHE_MODES, default="off",
+                        help="Reuse identical completions from .cache/completions (on), or only replay cached ones and fail on a miss (replay)")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET_TOKENS,
+                        help="Input tokens allowed per API call; longer prompts have their least important sections condensed or trimmed (0: no limit)")
+    parser.add_argument("--page-selection", choices=PAGE_SELECTION_MODES, default="smart",
+                        help="Score every page locally and send the most informative story pages to Vision (smart), or sample fixed positions")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_VISION_PAGES, help="Vision calls per comic")
+    parser.add_argument("--pages-per-request", type=int, default=1,
+                        help="Pages packed into each Vision request, cutting request count under per-minute caps")
+    parser.add_argument("--coverage", choices=COVERAGE_MODES, default="sampled",
+                        help="Analyze selected pages (sampled), or every page with a cheaper pass summarized pages -> scenes -> issue (full)")
+    args = parser.parse_args()
+
+    service = PipelineService(
+        args.api_key, args.competitor_data, results_dir=args.results_dir,
+        job_workers=args.job_workers, extraction_workers=args.extraction_workers,
+        requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute,
+        completion_cache=args.completion_cache, prompt_budget_tokens=args.prompt_budget,
+        page_selection=args.page_selection, max_vision_pages=args.max_pages,
+        pages_per_request=args.pages_per_request, coverage=args.coverage
+    )
+
+    try:
+        service.start()
+        httpd = service.make_server(args.host, args.port, args.socket)
+        address = args.socket or f"http://{args.host}:{httpd.server_address[1]}"
+        print(f"🛰️  Pipeline service listening on {address} with {service.job_workers} job worker(s)")
+        print(f"📁 Job status and results are kept in: {service.results_dir}")
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        # Unfinished jobs stay in jobs.json and resume on the next start
+        print("\n⚠️  Service stopped by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Pipeline service error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
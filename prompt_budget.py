@@ -0,0 +1,222 @@
+"""
+Prompt Budget
+Keeps the input side of each chat completion within a per-call token budget. Prompts
+are declared as named sections (story summary, reviews, recommendations, ...) with a
+priority; when a prompt is over budget the least important sections are first swapped
+for their condensed form (e.g. only the action items of a review), then shortened line
+by line, and the savings are logged and traced.
+
+Tokens are counted with tiktoken when it is installed, otherwise estimated at about
+four characters per token like the rate limiter's estimates.
+"""
+
+import os
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from tracing import span
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Input tokens allowed per call unless a call has its own budget; 0 disables trimming
+DEFAULT_PROMPT_BUDGET_TOKENS = 6000
+# Agents launched as subprocesses pick the coordinator's budget up from here
+PROMPT_BUDGET_ENV = "SCRIPT_GEN_PROMPT_BUDGET"
+# Encoding used by the gpt-4.1 / gpt-4o family
+TOKEN_ENCODING = "o200k_base"
+# Per-message formatting overhead in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    """The tiktoken encoding, or None when tiktoken (or its encoding file) is unavailable."""
+    global _encoding
+    if tiktoken is None:
+        return None
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                # The encoding is downloaded on first use, which fails offline
+                print(f"Warning: tiktoken encoding '{TOKEN_ENCODING}' unavailable ({e}), estimating tokens from characters")
+                _encoding = False
+        return _encoding or None
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Input tokens of a list of text chat messages."""
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            content = "".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+        total += count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+def compact_json(value: Any) -> str:
+    """JSON without indentation, for reference material such as the profile schema."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    return stripped.startswith(("#", "**")) or (stripped.endswith(":") and len(stripped) < 80)
+
+def _omitted(tokens: int) -> str:
+    return f"[... {tokens:,} tokens omitted to fit the prompt budget]"
+
+def shorten_text(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, dropping lines from every part of it rather than only the end.
+
+    Headings and the first line under each heading are kept first, so every topic stays
+    represented; the remaining lines are added back in document order while they fit.
+    Dropped runs of lines are replaced by a single "[... N tokens omitted ...]" line.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    total = count_tokens(text)
+    lines = text.splitlines()
+    costs = [count_tokens(line) for line in lines]
+    essential = {i for i, line in enumerate(lines)
+                 if line.strip() and (_is_heading(line) or i == 0 or _is_heading(lines[i - 1]) or not lines[i - 1].strip())}
+    order = sorted(essential) + [i for i in range(len(lines)) if i not in essential and lines[i].strip()]
+
+    def render(keep: set) -> str:
+        result = []
+        dropped = 0
+        for i, line in enumerate(lines):
+            if i in keep:
+                if dropped:
+                    result.append(_omitted(dropped))
+                    dropped = 0
+                result.append(line)
+            else:
+                dropped += costs[i]
+        if dropped:
+            result.append(_omitted(dropped))
+        return "\n".join(result)
+
+    kept: List[int] = []
+    used = 0
+    cut_line = False
+    for i in order:
+        if used + costs[i] + 1 <= max_tokens:
+            kept.append(i)
+            used += costs[i] + 1
+        elif not cut_line and max_tokens - used >= 32:
+            # The first line that does not fit (often a long paragraph) is cut at a word to use up the room left
+            room = int(len(lines[i]) * (max_tokens - used - 16) / costs[i])
+            lines[i] = lines[i][:room].rsplit(" ", 1)[0] + " ..."
+            costs[i] = count_tokens(lines[i])
+            kept.append(i)
+            used += costs[i] + 1
+            cut_line = True
+    # The omission markers take room too, so give back the last lines picked until it fits
+    shortened = render(set(kept))
+    while kept and count_tokens(shortened) > max_tokens:
+        kept.pop()
+        shortened = render(set(kept))
+    if not kept:
+        # Not even one line fits, so cut by characters
+        marker = _omitted(total)
+        return text[:max(0, max_tokens - count_tokens(marker)) * 4].rstrip() + "\n" + marker
+    return shortened
+
+class PromptSection:
+    """A variable part of a prompt.
+
+    Sections with a lower priority are trimmed first. condensed, when given, is a shorter
+    rendering of the same material that is swapped in before any text is cut; a section
+    is never shortened below min_tokens.
+    """
+
+    def __init__(self, name: str, text: str, priority: int = 0, min_tokens: int = 0,
+                 condensed: Optional[str] = None):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.condensed = condensed
+
+class PromptBudget:
+    """Per-call input token budgets, shared by every agent through the LLM client.
+
+    max_input_tokens applies to every call without an entry in per_call (keyed by the
+    call's trace label, e.g. "final_synthesis"). A budget of 0 or None disables trimming.
+    """
+
+    def __init__(self, max_input_tokens: Optional[int] = None, per_call: Optional[Dict[str, int]] = None):
+        if max_input_tokens is None:
+            max_input_tokens = int(os.environ.get(PROMPT_BUDGET_ENV) or DEFAULT_PROMPT_BUDGET_TOKENS)
+        self.max_input_tokens = max_input_tokens
+        self.per_call = dict(per_call or {})
+        self._stats_lock = threading.Lock()
+        self.stats = {"prompts": 0, "prompts_trimmed": 0, "tokens_before": 0, "tokens_after": 0, "tokens_saved": 0}
+
+    def budget_for(self, label: str) -> Optional[int]:
+        budget = self.per_call.get(label, self.max_input_tokens)
+        return budget if budget and budget > 0 else None
+
+    def fit(self, label: str, sections: List[PromptSection],
+            build_messages: Callable[[Dict[str, str]], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Messages for a call, built by build_messages from section texts that fit the call's budget.
+
+        build_messages receives {section name: text} and returns the chat messages; everything
+        it adds around the sections (system prompt, instructions) is kept as is.
+        """
+        texts = {section.name: section.text for section in sections}
+        budget = self.budget_for(label)
+        with span(f"{label}_prompt", "prompt", budget=budget) as attributes:
+            messages = build_messages(texts)
+            before = count_message_tokens(messages)
+            attributes["tokens_before"] = before
+            savings: Dict[str, int] = {}
+            if budget and before > budget:
+                sizes = {section.name: count_tokens(section.text) for section in sections}
+                excess = before - budget
+                # Least important first: swap in the condensed rendering, then cut lines if that was not enough
+                for section in sorted(sections, key=lambda section: section.priority):
+                    if excess <= 0:
+                        break
+                    name = section.name
+                    if section.condensed is not None and count_tokens(section.condensed) < sizes[name]:
+                        texts[name] = section.condensed
+                        excess -= sizes[name] - count_tokens(section.condensed)
+                        sizes[name] = count_tokens(section.condensed)
+                    allowance = max(section.min_tokens, sizes[name] - excess)
+                    if excess > 0 and allowance < sizes[name]:
+                        texts[name] = shorten_text(texts[name], allowance)
+                        excess -= sizes[name] - count_tokens(texts[name])
+                        sizes[name] = count_tokens(texts[name])
+                messages = build_messages(texts)
+                savings = {section.name: count_tokens(section.text) - sizes[section.name] for section in sections
+                           if count_tokens(section.text) > sizes[section.name]}
+            after = count_message_tokens(messages)
+            attributes["tokens_after"] = after
+            attributes["tokens_saved"] = before - after
+            if savings:
+                attributes["sections_trimmed"] = savings
+                print(f"✂️ {label} prompt trimmed from {before:,} to {after:,} tokens (budget {budget:,}): "
+                      + ", ".join(f"{name} -{saved:,}" for name, saved in savings.items())
+                      + ("; still over budget with every section at its minimum" if after > budget else ""))
+        with self._stats_lock:
+            self.stats["prompts"] += 1
+            self.stats["tokens_before"] += before
+            self.stats["tokens_after"] += after
+            if before > after:
+                self.stats["prompts_trimmed"] += 1
+                self.stats["tokens_saved"] += before - after
+        return messages
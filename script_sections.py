@@ -0,0 +1,155 @@
+"""
+Script Sections
+Finds the narration script inside the agents' multi-section completions, either in a
+finished text or incrementally while a completion streams in, so that work needing only
+the script can start before the remaining sections have been generated. Structured
+replies carry the script as a JSON field (JsonFieldParser); outputs saved before that
+were Markdown with a "SCRIPT" heading followed by "HOOK ANALYSIS", "TITLE SUGGESTIONS", ...
+"""
+
+import re
+import json
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Agent 1's Markdown script generation output: SCRIPT, HOOK ANALYSIS, TITLE SUGGESTIONS
+SCRIPT_END_MARKERS = ("HOOK ANALYSIS", "TITLE SUGGESTIONS")
+
+# The prompts ask for upper-case headings, so "script" in a lead-in sentence is not mistaken for one;
+# a finished text with no upper-case heading falls back to a case-insensitive match
+_SCRIPT_MARKER = re.compile(r"\bSCRIPT\b")
+_SCRIPT_MARKER_ANY_CASE = re.compile(r"\bSCRIPT\b", re.IGNORECASE)
+# Heading decoration between the marker and the script itself, e.g. "** -", ":**" or "(Adhering to ...)**"
+_HEADING_TAIL = re.compile(r"^(?:[\s*#:\-–—]|\([^)\n]*\))*")
+# A trailing line holding only the next heading's numbering or markdown, e.g. "2. **"
+_TRAILING_HEADING = re.compile(r"(?:\n[ \t]*(?:\d+[.)])?[ \t*#]*)+$")
+
+def _clean_section(section: str) -> str:
+    section = _HEADING_TAIL.sub("", section, count=1)
+    return _TRAILING_HEADING.sub("", section.rstrip()).strip()
+
+def extract_script(text: str, end_markers: Iterable[str] = SCRIPT_END_MARKERS) -> Optional[str]:
+    """The script section of a finished completion, or None if it has no SCRIPT heading."""
+    parser = ScriptSectionParser(end_markers)
+    parser.feed(text)
+    return parser.finish()
+
+def extract_script_or_text(text: str, end_markers: Iterable[str] = SCRIPT_END_MARKERS, context: str = "output") -> str:
+    """Like extract_script, but falls back to the whole text (with a warning) when there is no SCRIPT heading."""
+    script = extract_script(text, end_markers)
+    if script is None:
+        if text:
+            print(f"Warning: 'SCRIPT' heading not found in {context}, using raw output.")
+        return text
+    return script
+
+def script_from_result(script_generation_result: Dict[str, Any], context: str = "Agent 1 output") -> str:
+    """Agent 1's narration: the structured script field, or the SCRIPT section of an older Markdown output."""
+    return script_generation_result.get("script_section") or \
+        extract_script_or_text(script_generation_result.get("script", ""), SCRIPT_END_MARKERS, context)
+
+class JsonFieldParser:
+    """Incremental parser for a streamed JSON object: feed() returns the value of one string
+    field the moment its closing quote arrives (once), and calls on_value with it.
+    """
+
+    def __init__(self, field: str, on_value: Optional[Callable[[str], None]] = None):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        # How far back a key split across deltas can start
+        self._key_window = len(field) + 16
+        self.on_value = on_value
+        self.text = ""
+        self._value_start = None
+        self._scanned = 0
+        self._escaped = False
+        self.value: Optional[str] = None
+        self.complete = False
+
+    def feed(self, delta: str) -> Optional[str]:
+        if not delta:
+            return None
+        self.text += delta
+        if self.complete:
+            return None
+        if self._value_start is None:
+            match = self._key.search(self.text, max(0, self._scanned - self._key_window))
+            self._scanned = len(self.text)
+            if not match:
+                return None
+            self._value_start = self._scanned = match.end()
+        for i in range(self._scanned, len(self.text)):
+            char = self.text[i]
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self.value = json.loads(self.text[self._value_start - 1:i + 1])
+                self.complete = True
+                if self.on_value:
+                    self.on_value(self.value)
+                return self.value
+        self._scanned = len(self.text)
+        return None
+
+class ScriptSectionParser:
+    """Incremental parser: feed() text deltas as they stream in.
+
+    The script section is complete as soon as the first end marker after the SCRIPT
+    heading arrives; feed() returns it at that moment (once) and on_script is called
+    with it. finish() closes the stream, treating everything after the heading as
+    the script if no end marker ever arrived.
+    """
+
+    def __init__(self, end_markers: Iterable[str] = SCRIPT_END_MARKERS,
+                 on_script: Optional[Callable[[str], None]] = None):
+        end_markers = list(end_markers)
+        self._end_pattern = re.compile("|".join(re.escape(marker) for marker in end_markers), re.IGNORECASE)
+        self._longest_marker = max((len(marker) for marker in end_markers), default=0)
+        self.on_script = on_script
+        self.text = ""
+        self._script_start = None
+        self._scanned = 0
+        self.script: Optional[str] = None
+        self.complete = False
+
+    def feed(self, delta: str) -> Optional[str]:
+        """Add streamed text. Returns the script the moment its section closes, otherwise None."""
+        if not delta:
+            return None
+        self.text += delta
+        if self.complete:
+            return None
+
+        if self._script_start is None:
+            # Require a character after the match so "SCRIPT" is not a prefix of a longer word still streaming
+            match = _SCRIPT_MARKER.search(self.text, max(0, self._scanned - len("SCRIPT")))
+            if not match or match.end() >= len(self.text):
+                self._scanned = len(self.text)
+                return None
+            self._script_start = match.end()
+            self._scanned = self._script_start
+
+        # Only re-scan the tail that could hold a marker split across deltas
+        end = self._end_pattern.search(self.text, max(self._script_start, self._scanned - self._longest_marker))
+        self._scanned = len(self.text)
+        if not end:
+            return None
+        return self._complete(self.text[self._script_start:end.start()])
+
+    def finish(self) -> Optional[str]:
+        """End of stream. Returns the script, or None if the text never had a SCRIPT heading."""
+        if self.complete:
+            return self.script
+        if self._script_start is None:
+            match = _SCRIPT_MARKER_ANY_CASE.search(self.text)
+            if not match:
+                return None
+            self._script_start = match.end()
+        return self._complete(self.text[self._script_start:])
+
+    def _complete(self, section: str) -> str:
+        self.script = _clean_section(section)
+        self.complete = True
+        if self.on_script:
+            self.on_script(self.script)
+        return self.script
@@ -0,0 +1,201 @@
+"""
+Stage Scheduler
+Runs a dependency graph (DAG) of pipeline tasks with separate concurrency limits for
+local CPU/disk work and for API calls, so that work from many comics can overlap:
+extraction of the next comic proceeds while earlier comics are waiting on the API.
+"""
+
+import time
+import heapq
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from tracing import span
+
+TASK_POOLS = ("cpu", "api")
+
+def future_result(future: Future, step_name: str) -> Dict[str, Any]:
+    """Result of an agent step run concurrently, turning an unexpected exception into the usual error dict."""
+    try:
+        return future.result()
+    except Exception as e:
+        return {"error": f"{step_name} failed: {e}"}
+
+class Task:
+    """One schedulable unit of work and its bookkeeping."""
+
+    def __init__(self, task_id: str, func: Callable[[], Any], deps: Iterable[str] = (), pool: str = "api",
+                 priority: int = 0, always_run: bool = False):
+        if pool not in TASK_POOLS:
+            raise ValueError(f"Unknown task pool '{pool}'. Expected one of: {', '.join(TASK_POOLS)}")
+        self.task_id = task_id
+        self.func = func
+        self.deps = list(deps)
+        self.pool = pool
+        self.priority = priority
+        # Finalizers run once their dependencies have settled, even if some failed
+        self.always_run = always_run
+        # Runs in the context it was added from, so it records to the adding pipeline's tracer
+        self.context = contextvars.copy_context()
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self) -> float:
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task_id,
+            "pool": self.pool,
+            "status": self.status,
+            "error": self.error,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": self.duration
+        }
+
+class StageScheduler:
+    """Dispatches tasks as soon as their dependencies finish, lowest priority value first within each pool."""
+
+    def __init__(self, cpu_workers: int = 2, api_workers: int = 8):
+        self.limits = {"cpu": max(1, cpu_workers), "api": max(1, api_workers)}
+        self.tasks: Dict[str, Task] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        self._ready = {pool: [] for pool in TASK_POOLS}
+        self._running = {pool: 0 for pool in TASK_POOLS}
+        self._sequence = 0
+        self._lock = threading.Condition()
+
+    def add_task(self, task_id: str, func: Callable[[], Any], deps: Iterable[str] = (), pool: str = "api",
+                 priority: int = 0, always_run: bool = False) -> str:
+        """Register a task. Dependencies must already be registered. Safe to call while run() is in progress."""
+        task = Task(task_id, func, deps, pool, priority, always_run)
+        with self._lock:
+            if task_id in self.tasks:
+                raise ValueError(f"Duplicate task id: {task_id}")
+            self._check_deps(task_id, task.deps)
+            for dep in task.deps:
+                self._dependents.setdefault(dep, []).append(task_id)
+            self.tasks[task_id] = task
+            self._dependents.setdefault(task_id, [])
+            self._settle_if_ready(task)
+            self._lock.notify_all()
+        return task_id
+
+    def _check_deps(self, task_id: str, deps: List[str]):
+        """Reject unknown dependencies before anything is registered. Caller holds the lock."""
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task {task_id} depends on unknown task {dep}")
+
+    def add_dependencies(self, task_id: str, deps: Iterable[str]):
+        """Make a still-pending task wait for more tasks, e.g. ones a running task has just fanned out."""
+        with self._lock:
+            task = self.tasks[task_id]
+            if task.status != "pending":
+                raise ValueError(f"Cannot add dependencies to {task_id}: it is already {task.status}")
+            deps = list(deps)
+            self._check_deps(task_id, deps)
+            for dep in deps:
+                task.deps.append(dep)
+                self._dependents.setdefault(dep, []).append(task_id)
+            self._settle_if_ready(task)
+            self._lock.notify_all()
+
+    def result(self, task_id: str) -> Any:
+        return self.tasks[task_id].result
+
+    def _settle_if_ready(self, task: Task):
+        """Queue a pending task whose dependencies have all settled, or skip it if one failed. Caller holds the lock."""
+        if task.status != "pending":
+            return
+        dep_statuses = [self.tasks[dep].status for dep in task.deps]
+        if any(status in ("pending", "queued", "running") for status in dep_statuses):
+            return
+        if not task.always_run and any(status != "done" for status in dep_statuses):
+            failed = [dep for dep in task.deps if self.tasks[dep].status != "done"]
+            task.status = "skipped"
+            task.error = f"Skipped because {', '.join(failed)} did not complete"
+            self._on_settled(task)
+            return
+        task.status = "queued"
+        self._sequence += 1
+        heapq.heappush(self._ready[task.pool], (task.priority, self._sequence, task.task_id))
+
+    def _on_settled(self, task: Task):
+        for dependent in self._dependents.get(task.task_id, []):
+            self._settle_if_ready(self.tasks[dependent])
+
+    def _run_task(self, task: Task):
+        task.start_time = time.time()
+        try:
+            task.result = task.context.run(self._call_traced, task)
+            status, error = "done", None
+        except Exception as e:
+            status, error = "failed", str(e)
+        task.end_time = time.time()
+        with self._lock:
+            task.status = status
+            task.error = error
+            self._running[task.pool] -= 1
+            try:
+                self._on_settled(task)
+            finally:
+                self._lock.notify_all()
+
+    @staticmethod
+    def _call_traced(task: Task) -> Any:
+        # Pipelines prefix their task ids with the pipeline id, which the trace already identifies
+        with span(task.task_id.split(":", 1)[-1], "task", pool=task.pool, task_id=task.task_id):
+            return task.func()
+
+    def _dispatch(self, executors: Dict[str, ThreadPoolExecutor]):
+        """Start queued tasks while their pool has free slots. Caller holds the lock."""
+        for pool in TASK_POOLS:
+            while self._ready[pool] and self._running[pool] < self.limits[pool]:
+                _, _, task_id = heapq.heappop(self._ready[pool])
+                task = self.tasks[task_id]
+                task.status = "running"
+                self._running[pool] += 1
+                executors[pool].submit(self._run_task, task)
+
+    def _unfinished(self) -> bool:
+        return any(task.status in ("pending", "queued", "running") for task in self.tasks.values())
+
+    def run(self) -> Dict[str, Task]:
+        """Run every registered task (and any added while running) to completion."""
+        executors = {pool: ThreadPoolExecutor(max_workers=self.limits[pool], thread_name_prefix=f"{pool}-stage")
+                     for pool in TASK_POOLS}
+        try:
+            with self._lock:
+                while self._unfinished():
+                    self._dispatch(executors)
+                    if not any(self._running.values()) and not any(self._ready.values()):
+                        # Only pending tasks remain and nothing can unblock them
+                        for task in self.tasks.values():
+                            if task.status == "pending":
+                                task.status = "skipped"
+                                task.error = "Dependencies never completed"
+                        break
+                    self._lock.wait()
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+        return self.tasks
+
+    def summary(self, prefix: Optional[str] = None) -> Dict[str, Any]:
+        """Per-task timings plus the busy time of each pool, optionally limited to task ids starting with prefix."""
+        tasks = [task for task in self.tasks.values() if prefix is None or task.task_id.startswith(prefix)]
+        return {
+            "tasks": [task.to_dict() for task in tasks],
+            "pool_busy_seconds": {pool: sum(task.duration for task in tasks if task.pool == pool) for pool in TASK_POOLS},
+            "limits": dict(self.limits)
+        }
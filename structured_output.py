@@ -0,0 +1,125 @@
+"""
+Structured Output
+Helpers for chat completions constrained to a JSON schema: building strict schemas and
+the response_format that requests them, validating replies against the subset of JSON
+Schema that strict structured outputs use, and rendering replies back to the Markdown
+sections the reports and later prompts read.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+class StructuredOutputError(ValueError):
+    """Raised when a reply still does not match its schema after the repair attempts."""
+
+    def __init__(self, message: str, errors: List[str]):
+        super().__init__(message)
+        self.errors = errors
+
+def strict_object(properties: Dict[str, Dict[str, Any]], description: Optional[str] = None) -> Dict[str, Any]:
+    """An object schema in the form strict mode requires: every property required, no others allowed.
+
+    Replies list the properties in this order, so put fields needed early (e.g. the script) first.
+    """
+    schema = {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+    if description:
+        schema["description"] = description
+    return schema
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float),
+    "integer": int,
+}
+
+def validate_json(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """Errors for value against schema; an empty list means it is valid."""
+    expected = schema.get("type")
+    if expected:
+        python_type = _JSON_TYPES[expected]
+        # bool is an int subclass, but true is not a valid integer
+        if not isinstance(value, python_type) or (isinstance(value, bool) and expected in ("integer", "number")):
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is below the minimum of {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is above the maximum of {schema['maximum']}")
+    # Strict mode guarantees every field is present, but not that it says anything
+    if isinstance(value, str) and not value.strip():
+        errors.append(f"{path}: is empty")
+    if isinstance(value, list):
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            errors.append(f"{path}: has {len(value)} items, expected at least {schema['minItems']}")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: has {len(value)} items, expected at most {schema['maxItems']}")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(validate_json(item, schema["items"], f"{path}[{i}]"))
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing required field '{name}'")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(validate_json(item, properties[name], f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected field '{name}'")
+    return errors
+
+def parse_json_output(content: str, schema: Dict[str, Any],
+                      check: Optional[Callable[[Dict[str, Any]], List[str]]] = None) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Parse and validate a reply. check adds rules a schema cannot express, returning error strings."""
+    try:
+        data = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        return None, [f"reply is not valid JSON ({e})"]
+    errors = validate_json(data, schema)
+    if not errors and check:
+        errors = check(data)
+    return data, errors
+
+def repair_prompt(errors: List[str]) -> str:
+    """Follow-up asking the model to fix only what failed validation."""
+    problems = "\n".join(f"- {error}" for error in errors[:20])
+    return ("Your reply did not pass validation:\n"
+            f"{problems}\n\n"
+            "Reply again with the complete JSON object, fixing only these problems and keeping every other field unchanged.")
+
+def _heading(name: str) -> str:
+    return name.replace("_", " ").upper()
+
+def _render_value(value: Any) -> str:
+    if isinstance(value, dict):
+        return "\n".join(f"- {_heading(name).title()}: {item}" for name, item in value.items())
+    if isinstance(value, list):
+        lines = []
+        for i, item in enumerate(value, 1):
+            if isinstance(item, dict):
+                first, *rest = item.items()
+                lines.append(f"{i}. {first[1]}")
+                lines.extend(f"   - {_heading(name).title()}: {detail}" for name, detail in rest)
+            else:
+                lines.append(f"{i}. {item}")
+        return "\n".join(lines)
+    return str(value)
+
+def render_markdown(data: Dict[str, Any]) -> str:
+    """The reply as "**FIELD NAME:**" sections in field order, e.g. script -> "**SCRIPT:**"."""
+    return "\n\n".join(f"**{_heading(name)}:**\n{_render_value(value)}" for name, value in data.items())
+
+def render_fields(data: Optional[Dict[str, Any]], fields: Iterable[str]) -> Optional[str]:
+    """render_markdown of only some fields, e.g. a review's action items; None without structured data."""
+    if not data:
+        return None
+    return render_markdown({name: data[name] for name in fields if name in data}) or None
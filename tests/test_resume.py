@@ -0,0 +1,95 @@
+"""Resuming a pipeline against the fake Chat Completions server from benchmark.py.
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmark import FakeChatCompletionsServer, write_competitor_csv, write_fixture
+from llm_client import LLMClient
+from pipeline_coordinator import PipelineCoordinator
+from stage_scheduler import StageScheduler
+
+
+class ResumeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeChatCompletionsServer(latency=0.01, jitter=0, stream_interval=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="test_resume_")
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        self.addCleanup(os.chdir, cwd)
+        environ = mock.patch.dict(os.environ, {"OPENAI_BASE_URL": self.server.base_url})
+        environ.start()
+        self.addCleanup(environ.stop)
+        write_fixture("comic.cbz", "cbz", pages=4, width=320, height=480)
+        write_competitor_csv("competitors.csv", rows=5)
+
+    def run_pipeline(self, scheduled: bool, pipeline_id=None):
+        coordinator = PipelineCoordinator("sk-test", "competitors.csv", requests_per_minute=100000,
+                                          pipeline_id=pipeline_id)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if scheduled:
+                scheduler = StageScheduler()
+                task = coordinator.schedule_pipeline(scheduler, "comic.cbz")
+                scheduler.run()
+                results = scheduler.result(task)
+            else:
+                results = coordinator.run_complete_pipeline("comic.cbz")
+        self.assertTrue(results["success"], results.get("error"))
+        return coordinator
+
+    @staticmethod
+    def load_outputs(coordinator: PipelineCoordinator):
+        with open(coordinator.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(coordinator.artifact_paths["agent_1_output"], encoding='utf-8') as f:
+            return manifest, json.load(f)
+
+    def run_with_fallback_script(self, scheduled: bool):
+        """Resume a pipeline whose script generation failed and fell back to the placeholder script."""
+        create_json = LLMClient.create_json
+
+        def failing_script_generation(llm, name, *args, **kwargs):
+            if name == "script_generation":
+                raise RuntimeError("script generation unavailable")
+            return create_json(llm, name, *args, **kwargs)
+
+        with mock.patch.object(LLMClient, "create_json", failing_script_generation):
+            coordinator = self.run_pipeline(scheduled)
+        manifest, agent_1_output = self.load_outputs(coordinator)
+        self.assertEqual(manifest["stages"]["agent_1"]["degraded"], ["fallback script"])
+        self.assertEqual(agent_1_output["status"], "success_with_fallback_script")
+
+        self.run_pipeline(scheduled, coordinator.pipeline_id)
+        manifest, agent_1_output = self.load_outputs(coordinator)
+        self.assertNotIn("degraded", manifest["stages"]["agent_1"])
+        self.assertEqual(agent_1_output["status"], "success")
+
+        # The stage is sound now, so the next resume reuses its output
+        self.run_pipeline(scheduled, coordinator.pipeline_id)
+        self.assertEqual(self.load_outputs(coordinator)[1]["processing_timestamp"], agent_1_output["processing_timestamp"])
+
+    def test_resume_reruns_stage_that_fell_back(self):
+        self.run_with_fallback_script(scheduled=False)
+
+    def test_scheduled_resume_reruns_stage_that_fell_back(self):
+        self.run_with_fallback_script(scheduled=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""ScriptEditor's competitor analysis against the fake Chat Completions server from benchmark.py.
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from openai import OpenAI
+
+from agent_2_script_editor import ScriptEditor
+from benchmark import FakeChatCompletionsServer, write_competitor_csv
+
+
+class CompetitorAnalysisTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeChatCompletionsServer(latency=0.01, jitter=0, stream_interval=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="test_script_editor_")
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        self.csv_path = os.path.join(self.work_dir, "competitors.csv")
+
+    def analyze(self, editor: ScriptEditor):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return editor.analyze_competitor_patterns()
+
+    def test_analysis_follows_changes_to_the_csv(self):
+        write_competitor_csv(self.csv_path, rows=3)
+        client = OpenAI(api_key="sk-test", base_url=self.server.base_url)
+        with contextlib.redirect_stdout(io.StringIO()):
+            editor = ScriptEditor("sk-test", self.csv_path, client=client,
+                                  cache_dir=os.path.join(self.work_dir, "cache"))
+        first = self.analyze(editor)
+        self.assertEqual(first["videos_analyzed"], 3)
+        self.assertTrue(self.analyze(editor)["used_cached_analysis"])
+
+        # The service keeps one editor for its lifetime, so a CSV updated underneath it must be reanalyzed
+        write_competitor_csv(self.csv_path, rows=7, seed=1)
+        second = self.analyze(editor)
+        self.assertFalse(second["used_cached_analysis"])
+        self.assertEqual(second["videos_analyzed"], 7)
+        self.assertNotEqual(second["competitor_data_hash"], first["competitor_data_hash"])
+
+
+if __name__ == "__main__":
+    unittest.main()
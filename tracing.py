@@ -0,0 +1,175 @@
+"""
+Tracing
+Records timed spans for API calls, archive extraction, image preparation and file I/O
+to a JSON-lines trace per pipeline, and converts it to the Chrome trace format
+(chrome://tracing, https://ui.perfetto.dev) for a timeline view.
+
+The active tracer is held in a context variable, so pipelines sharing one process (and
+one set of agents) still record into their own trace. Agents launched as subprocesses
+append to the coordinator's trace file, which is passed in SCRIPT_GEN_TRACE.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_ENV = "SCRIPT_GEN_TRACE"
+
+class Tracer:
+    """Appends one JSON line per finished span to path. A tracer without a path records nothing."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @contextmanager
+    def span(self, name: str, category: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """Time the enclosed block. Attributes added to the yielded dict are recorded with the span."""
+        attributes = dict(attributes)
+        if not self.enabled:
+            yield attributes
+            return
+        start = time.time()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.record(name, category, start, time.time() - start, attributes)
+
+    def record(self, name: str, category: str, start: float, duration: float, attributes: Optional[Dict[str, Any]] = None):
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "cat": category,
+            "ts": start,
+            "dur": duration,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "thread": threading.current_thread().name,
+            "args": attributes or {}
+        }
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    @contextmanager
+    def activate(self) -> Iterator["Tracer"]:
+        """Make this the tracer that spans in the current context (and tasks started from it) record to."""
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_current_tracer: contextvars.ContextVar[Optional[Tracer]] = contextvars.ContextVar("script_gen_tracer", default=None)
+_process_tracer: Optional[Tracer] = None
+_process_tracer_lock = threading.Lock()
+
+def current_tracer() -> Tracer:
+    """The tracer activated for this context, else one writing to $SCRIPT_GEN_TRACE, else a disabled tracer."""
+    global _process_tracer
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        return tracer
+    with _process_tracer_lock:
+        if _process_tracer is None:
+            _process_tracer = Tracer(os.environ.get(TRACE_ENV) or None)
+        return _process_tracer
+
+def span(name: str, category: str, **attributes):
+    """Shorthand for current_tracer().span(...)."""
+    return current_tracer().span(name, category, **attributes)
+
+def in_current_context(func: Callable) -> Callable:
+    """Wrap func so that, when run on a worker thread, it records to the submitting thread's tracer."""
+    context = contextvars.copy_context()
+    def run(*args, **kwargs):
+        # Each call gets its own copy, since one context cannot be entered by two threads at once
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Read the spans from a JSON-lines trace, skipping any partially written line."""
+    events = []
+    if not path or not os.path.exists(path):
+        return events
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+def write_chrome_trace(events: List[Dict[str, Any]], path: str) -> str:
+    """Write spans as Chrome trace "complete" events (microsecond timestamps)."""
+    trace_events = [{
+        "name": event["name"],
+        "cat": event["cat"],
+        "ph": "X",
+        "ts": int(event["ts"] * 1_000_000),
+        "dur": int(event["dur"] * 1_000_000),
+        "pid": event["pid"],
+        "tid": event["tid"],
+        "args": event.get("args", {})
+    } for event in events]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+    return path
+
+def summarize_trace(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregate spans by category and name: count, wall time, rate-limit waits, tokens, prompt tokens saved by the
+    prompt budget, bytes uploaded and cache hits."""
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    for event in events:
+        args = event.get("args", {})
+        row = rows.setdefault((event["cat"], event["name"]), {
+            "category": event["cat"], "name": event["name"], "count": 0, "total_seconds": 0.0,
+            "max_seconds": 0.0, "rate_limit_wait_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "tokens_saved": 0, "bytes_uploaded": 0, "cache_hits": 0, "errors": 0
+        })
+        row["count"] += 1
+        row["total_seconds"] += event["dur"]
+        row["max_seconds"] = max(row["max_seconds"], event["dur"])
+        row["rate_limit_wait_seconds"] += args.get("rate_limit_wait") or 0.0
+        row["prompt_tokens"] += args.get("prompt_tokens") or 0
+        row["completion_tokens"] += args.get("completion_tokens") or 0
+        row["tokens_saved"] += args.get("tokens_saved") or 0
+        row["bytes_uploaded"] += args.get("bytes_uploaded") or 0
+        row["cache_hits"] += 1 if args.get("cache") == "hit" else 0
+        row["errors"] += 1 if args.get("error") else 0
+    return sorted(rows.values(), key=lambda row: (row["category"], -row["total_seconds"]))
+
+def format_trace_summary(rows: List[Dict[str, Any]]) -> str:
+    """Fixed-width table of summarize_trace rows for the text reports."""
+    header = f"  {'category':<10} {'name':<32} {'count':>5} {'total s':>8} {'mean s':>7} {'max s':>7} {'wait s':>7} {'prompt tok':>10} {'compl tok':>9} {'saved tok':>9} {'KB up':>8} {'cached':>6}\n"
+    lines = [header]
+    for row in rows:
+        lines.append(
+            f"  {row['category'][:10]:<10} {row['name'][:32]:<32} {row['count']:>5} {row['total_seconds']:>8.2f} "
+            f"{row['total_seconds'] / row['count']:>7.2f} {row['max_seconds']:>7.2f} {row['rate_limit_wait_seconds']:>7.2f} {row['prompt_tokens']:>10} "
+            f"{row['completion_tokens']:>9} {row['tokens_saved']:>9} {row['bytes_uploaded'] / 1024:>8.1f} {row['cache_hits']:>6}\n"
+        )
+    return "".join(lines)